@@ -0,0 +1,495 @@
+import os
+import sys
+import json
+import fcntl
+import argparse
+from contextlib import contextmanager
+
+from history import HistoryEntry
+from history_management import save_history, HISTORY_FILE
+
+
+"""
+checkpoint.py
+
+Durable progress tracking for sharded filter jobs, so that a job that dies, is killed or
+loses its container can be restarted with the same job id and continue where it stopped.
+
+A job lives in its own directory (e.g. graph_batches/<job_id>/) containing:
+    - manifest.json          : the job parameters and the progress of every shard
+    - output_batch_<i>.txt   : the graphs that passed the filter in shard i
+    - final_filtered_graphs.txt : all passing graphs, written once every shard is complete
+
+For every shard (a geng `res/mod` class) the manifest records:
+    - "state"        : "pending", "running", "drained" or "complete"
+    - "input_count"  : the number of graphs of the shard that were filtered
+    - "output_count" : the number of those graphs that passed
+    - "offset"       : the size in bytes of the shard's output file at that point
+    - "stats"        : (with --stats) the timings of the run that completed the shard
+
+Workers checkpoint periodically after flushing and fsyncing their output. Because geng
+enumerates a shard in a deterministic order, a restarted worker truncates its output file
+to the recorded offset, skips the first `input_count` graphs and continues from there.
+A worker that reaches the end of its input only marks the shard as "drained", since geng
+dying also ends the input. The runner marks a drained shard as complete (`complete`) once
+geng exited successfully; otherwise the shard stays resumable like a running one.
+The manifest is shared by the workers of a job and is only updated under a file lock,
+using an atomic replace.
+
+Runs stopped with --limit are not jobs, but are recorded the same way: their workers write
+summaries (output_batch_<i>.summary.json) instead of history entries, and `record-limit` saves
+one entry for the trimmed final output of all workers. Runs with --format bitmap do the same
+with `record-bitmap`: their entry lists no graphs, but points at the packed pass map.
+
+Usage:
+    python checkpoint.py init <job_dir> <order> '<filter_string>' <num_shards>
+    python checkpoint.py pending <job_dir>
+    python checkpoint.py complete <job_dir> <shard>
+    python checkpoint.py finalize <job_dir>
+    python checkpoint.py record-limit <output_dir> '<filter_string>' <limit> <num_shards>
+    python checkpoint.py record-bitmap <output_dir> '<filter_string>' <num_shards>
+"""
+
+MANIFEST_NAME = "manifest.json"
+FINAL_OUTPUT_NAME = "final_filtered_graphs.txt"
+PASSMAP_OUTPUT_NAME = "final_filtered_graphs.passmap"
+
+# Number of most recent passed graphs stored in the history entry of a job
+HISTORY_GRAPH_COUNT = 20
+
+def shard_output_path(job_dir, shard):
+    """
+    Returns the path of the output file of a shard in the given job directory.
+    """
+    return os.path.join(job_dir, f"output_batch_{shard}.txt")
+
+def write_json_atomic(path, data):
+    """
+    Writes `data` as JSON to `path` so that the file always holds either the old or the new content.
+
+    The data is written to a temporary file which is fsynced and then renamed over `path`.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(data, file, indent=2)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+    # Make the rename itself durable
+    dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+@contextmanager
+def locked(manifest_path):
+    """
+    Context manager holding an exclusive lock on the manifest, shared by all workers of a job.
+    """
+    with open(f"{manifest_path}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def load_manifest(manifest_path):
+    """
+    Loads a job manifest.
+
+    Returns:
+        dict: The manifest.
+
+    Raises:
+        FileNotFoundError: If the manifest does not exist.
+    """
+    with open(manifest_path, "r") as file:
+        return json.load(file)
+
+def init_job(job_dir, order, filter_str, num_shards):
+    """
+    Creates the manifest of a new job, or loads the manifest of an existing job to resume it.
+
+    Args:
+        job_dir (str): The directory of the job.
+        order (int): The number of vertices of the generated graphs.
+        filter_str (str): The filter string applied by the job.
+        num_shards (int): The number of geng `res/mod` shards (the `mod` value).
+
+    Returns:
+        dict: The (new or existing) manifest.
+
+    Raises:
+        ValueError: If the job already exists with different parameters.
+    """
+    os.makedirs(job_dir, exist_ok=True)
+    manifest_path = os.path.join(job_dir, MANIFEST_NAME)
+
+    with locked(manifest_path):
+        if os.path.exists(manifest_path):
+            manifest = load_manifest(manifest_path)
+            if (manifest["order"], manifest["filter"], manifest["num_shards"]) != (order, filter_str, num_shards):
+                raise ValueError(f"Job {manifest['job_id']} already exists with different parameters")
+            return manifest
+
+        manifest = {
+            "job_id": os.path.basename(os.path.normpath(job_dir)),
+            "order": order,
+            "filter": filter_str,
+            "num_shards": num_shards,
+            "finalized": False,
+            "shards": [
+                {"state": "pending", "input_count": 0, "output_count": 0, "offset": 0}
+                for _ in range(num_shards)
+            ]
+        }
+        write_json_atomic(manifest_path, manifest)
+        return manifest
+
+def get_shard(manifest_path, shard):
+    """
+    Returns the progress of one shard of the job.
+    """
+    with locked(manifest_path):
+        return load_manifest(manifest_path)["shards"][shard]
+
+def update_shard(manifest_path, shard, **fields):
+    """
+    Updates the progress of one shard of the job (e.g. `state`, `input_count`, `output_count`, `offset`).
+
+    Callers must flush and fsync the shard's output before recording its offset.
+    """
+    with locked(manifest_path):
+        manifest = load_manifest(manifest_path)
+        manifest["shards"][shard].update(fields)
+        write_json_atomic(manifest_path, manifest)
+
+def complete_shard(manifest_path, shard):
+    """
+    Marks a drained shard as complete, once its generator is known to have exited successfully.
+
+    Raises:
+        ValueError: If the worker of the shard did not reach the end of its input.
+    """
+    with locked(manifest_path):
+        manifest = load_manifest(manifest_path)
+        state = manifest["shards"][shard]["state"]
+        if state == "complete":
+            return
+        if state != "drained":
+            raise ValueError(f"Shard {shard} is {state}, not drained")
+        manifest["shards"][shard]["state"] = "complete"
+        write_json_atomic(manifest_path, manifest)
+
+def pending_shards(manifest):
+    """
+    Returns the numbers of the shards that are not complete yet.
+    """
+    return [i for i, shard in enumerate(manifest["shards"]) if shard["state"] != "complete"]
+
+def open_shard_output(output_path, offset):
+    """
+    Opens the output file of a shard for appending, after truncating any output written
+    after the last checkpoint.
+
+    Args:
+        output_path (str): The path of the shard's output file.
+        offset (int): The size of the output at the last checkpoint.
+
+    Returns:
+        file: The output file opened in binary append mode.
+    """
+    with open(output_path, "ab") as file:
+        file.truncate(offset)
+    return open(output_path, "ab")
+
+def read_last_lines(path, count):
+    """
+    Returns the last `count` non-empty lines of a file without reading the whole file.
+    """
+    with open(path, "rb") as file:
+        file.seek(0, os.SEEK_END)
+        position = file.tell()
+        data = b""
+        while position > 0 and data.count(b"\n") <= count:
+            step = min(65536, position)
+            position -= step
+            file.seek(position)
+            data = file.read(step) + data
+    lines = [line for line in data.decode().split("\n") if line]
+    return lines[-count:] if count else []
+
+def copy_prefix(source, destination, length, chunk_size=1 << 20):
+    """
+    Copies the first `length` bytes of the binary file `source` to `destination`.
+    """
+    while length > 0:
+        data = source.read(min(chunk_size, length))
+        if not data:
+            break
+        destination.write(data)
+        length -= len(data)
+
+def finalize_job(job_dir):
+    """
+    Combines the outputs of a completed job and records it as a single history entry.
+
+    The shard outputs are concatenated in shard order into `final_filtered_graphs.txt`, and the
+    summed counts are saved to the history. A job is finalized only once, so running it again
+    with the same job id does not add another history entry. Before the entry is saved, the
+    size of the history file is recorded in the manifest as `finalizing`. If finalizing was
+    interrupted after saving the entry but before marking the job as finalized, the next run
+    finds the job's entry after that offset and does not save it again.
+
+    Args:
+        job_dir (str): The directory of the job.
+
+    Returns:
+        HistoryEntry: The history entry of the job, or `None` if it was already finalized.
+
+    Raises:
+        ValueError: If some shards are not complete yet.
+    """
+    manifest_path = os.path.join(job_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    if manifest["finalized"]:
+        return None
+
+    pending = pending_shards(manifest)
+    if pending:
+        raise ValueError(f"Shards {pending} of job {manifest['job_id']} are not complete")
+
+    # Concatenate the shard outputs, keeping only what was checkpointed
+    final_path = os.path.join(job_dir, FINAL_OUTPUT_NAME)
+    with open(final_path, "wb") as final_file:
+        for i, shard in enumerate(manifest["shards"]):
+            with open(shard_output_path(job_dir, i), "rb") as shard_file:
+                copy_prefix(shard_file, final_file, shard["offset"])
+
+    # Keep the per-shard statistics (if the workers measured them) with the job's history entry
+    metadata = {"job_id": manifest["job_id"]}
+    shard_stats = [dict(shard["stats"], shard=i) for i, shard in enumerate(manifest["shards"]) if "stats" in shard]
+    if shard_stats:
+        metadata["shard_stats"] = shard_stats
+
+    entry = HistoryEntry(
+        input_number=sum(shard["input_count"] for shard in manifest["shards"]),
+        output_number=sum(shard["output_count"] for shard in manifest["shards"]),
+        filter_str=manifest["filter"],
+        passed_graph_list=read_last_lines(final_path, HISTORY_GRAPH_COUNT),
+        metadata=metadata
+    )
+
+    # Record where the entry goes before saving it, so an interrupted finalize can tell whether it was saved
+    with locked(manifest_path):
+        manifest = load_manifest(manifest_path)
+        if "finalizing" not in manifest:
+            manifest["finalizing"] = {"history_offset": history_size()}
+            write_json_atomic(manifest_path, manifest)
+    if not history_has_job_entry(manifest["finalizing"]["history_offset"], manifest["job_id"]):
+        save_history([entry])
+
+    with locked(manifest_path):
+        manifest = load_manifest(manifest_path)
+        manifest["finalized"] = True
+        write_json_atomic(manifest_path, manifest)
+    return entry
+
+def history_size():
+    """
+    Returns the size of the history file in bytes (0 if it does not exist yet).
+    """
+    try:
+        return os.path.getsize(HISTORY_FILE)
+    except FileNotFoundError:
+        return 0
+
+def history_has_job_entry(offset, job_id):
+    """
+    Checks whether the history contains an entry of the job after byte `offset`.
+    """
+    if not os.path.exists(HISTORY_FILE):
+        return False
+    with open(HISTORY_FILE, "rb") as file:
+        file.seek(offset)
+        for line in file:
+            parts = line.rstrip(b"\n").split(b"\t")
+            if len(parts) != 6:
+                continue
+            try:
+                metadata = json.loads(parts[5])
+            except ValueError:
+                continue
+            if isinstance(metadata, dict) and metadata.get("job_id") == job_id:
+                return True
+    return False
+
+def read_summaries(output_dir, num_shards):
+    """
+    Adds up the summaries (`output_batch_<i>.summary.json`) written by the workers of a run.
+    A worker stopped before it could write its summary counts as truncated.
+
+    Returns:
+        tuple: `(input_count, output_count, truncated, shard_stats)`, where `shard_stats` lists
+               the statistics of the workers run with --stats.
+    """
+    input_count = 0
+    output_count = 0
+    truncated = False
+    shard_stats = []
+    for i in range(num_shards):
+        try:
+            with open(os.path.join(output_dir, f"output_batch_{i}.summary.json"), "r") as f:
+                summary = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            truncated = True
+            continue
+        input_count += summary["input_count"]
+        output_count += summary["output_count"]
+        truncated = truncated or summary["truncated"]
+        if "stats" in summary:
+            shard_stats.append(dict(summary["stats"], shard=i))
+    return input_count, output_count, truncated, shard_stats
+
+def record_limited_run(output_dir, filter_str, limit, num_shards):
+    """
+    Saves a single history entry for a run of several workers stopped with --limit.
+
+    The workers' summaries (`output_batch_<i>.summary.json`) give the number of graphs they
+    read; the passing graphs are those of the final output, which was trimmed to `limit` lines.
+
+    Args:
+        output_dir (str): The directory with the worker summaries and the final output.
+        filter_str (str): The filter string of the run.
+        limit (int): The limit of the run.
+        num_shards (int): The number of workers (geng `res/mod` shards).
+
+    Returns:
+        HistoryEntry: The saved history entry.
+    """
+    input_count, passed_count, truncated, shard_stats = read_summaries(output_dir, num_shards)
+
+    final_path = os.path.join(output_dir, FINAL_OUTPUT_NAME)
+    with open(final_path, "rb") as f:
+        output_count = sum(1 for line in f if line.strip())
+
+    # Workers that found matches at the same time may pass more than K graphs, which were trimmed
+    metadata = {"limit": limit, "output_dir": output_dir}
+    if truncated or passed_count > output_count:
+        metadata["truncated"] = True
+    if shard_stats:
+        metadata["shard_stats"] = shard_stats
+
+    entry = HistoryEntry(
+        input_number=input_count,
+        output_number=output_count,
+        filter_str=filter_str,
+        passed_graph_list=read_last_lines(final_path, HISTORY_GRAPH_COUNT),
+        metadata=metadata
+    )
+    save_history([entry])
+    return entry
+
+def record_bitmap_run(output_dir, filter_str, num_shards):
+    """
+    Saves a single history entry for a run of several workers with --format bitmap.
+
+    Such a run keeps no graph6 strings, so the entry lists no passing graphs and records the
+    path of the packed pass map (`final_filtered_graphs.passmap`) in its metadata instead.
+
+    Args:
+        output_dir (str): The directory with the worker summaries and the packed pass map.
+        filter_str (str): The filter string of the run.
+        num_shards (int): The number of workers (geng `res/mod` shards).
+
+    Returns:
+        HistoryEntry: The saved history entry.
+    """
+    input_count, output_count, truncated, shard_stats = read_summaries(output_dir, num_shards)
+
+    metadata = {"passmap": os.path.join(output_dir, PASSMAP_OUTPUT_NAME), "output_dir": output_dir}
+    if truncated:
+        metadata["truncated"] = True
+    if shard_stats:
+        metadata["shard_stats"] = shard_stats
+
+    entry = HistoryEntry(
+        input_number=input_count,
+        output_number=output_count,
+        filter_str=filter_str,
+        passed_graph_list=[],
+        metadata=metadata
+    )
+    save_history([entry])
+    return entry
+
+def parse_args():
+    """
+    Parses command line arguments for the checkpoint commands used by run_filter_parallel.sh.
+
+    Returns:
+        argparse.Namespace: Parsed command line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Manage the progress manifest of a sharded filter job.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    init_parser = commands.add_parser('init', help="Create the job manifest, or check it when resuming.")
+    init_parser.add_argument('job_dir', type=str, help="The directory of the job.")
+    init_parser.add_argument('order', type=int, help="The number of vertices of the graphs.")
+    init_parser.add_argument('filter_string', type=str, help="The filter string in JSON format.")
+    init_parser.add_argument('num_shards', type=int, help="The number of geng res/mod shards.")
+
+    pending_parser = commands.add_parser('pending', help="Print the shards that are not complete yet.")
+    pending_parser.add_argument('job_dir', type=str, help="The directory of the job.")
+
+    complete_parser = commands.add_parser('complete', help="Mark a drained shard as complete after geng exited successfully.")
+    complete_parser.add_argument('job_dir', type=str, help="The directory of the job.")
+    complete_parser.add_argument('shard', type=int, help="The number of the shard.")
+
+    finalize_parser = commands.add_parser('finalize', help="Combine the outputs and save the history of a completed job.")
+    finalize_parser.add_argument('job_dir', type=str, help="The directory of the job.")
+
+    record_parser = commands.add_parser('record-limit', help="Save a single history entry for a run stopped with --limit.")
+    record_parser.add_argument('output_dir', type=str, help="The directory with the worker summaries and the final output.")
+    record_parser.add_argument('filter_string', type=str, help="The filter string in JSON format.")
+    record_parser.add_argument('limit', type=int, help="The limit of the run.")
+    record_parser.add_argument('num_shards', type=int, help="The number of workers of the run.")
+
+    bitmap_parser = commands.add_parser('record-bitmap', help="Save a single history entry for a run with --format bitmap.")
+    bitmap_parser.add_argument('output_dir', type=str, help="The directory with the worker summaries and the packed pass map.")
+    bitmap_parser.add_argument('filter_string', type=str, help="The filter string in JSON format.")
+    bitmap_parser.add_argument('num_shards', type=int, help="The number of workers of the run.")
+
+    return parser.parse_args()
+
+def main():
+    """
+    Main entry point of the script. Runs one of the checkpoint commands.
+    """
+    args = parse_args()
+
+    try:
+        if args.command == 'init':
+            manifest = init_job(args.job_dir, args.order, args.filter_string, args.num_shards)
+            if manifest["finalized"]:
+                print(f"Job {manifest['job_id']} is already complete.", file=sys.stderr)
+        elif args.command == 'pending':
+            manifest = load_manifest(os.path.join(args.job_dir, MANIFEST_NAME))
+            print(" ".join(str(shard) for shard in pending_shards(manifest)))
+        elif args.command == 'complete':
+            complete_shard(os.path.join(args.job_dir, MANIFEST_NAME), args.shard)
+        elif args.command == 'finalize':
+            if finalize_job(args.job_dir) is None:
+                print("Job was already finalized, history not saved again.", file=sys.stderr)
+        elif args.command == 'record-limit':
+            record_limited_run(args.output_dir, args.filter_string, args.limit, args.num_shards)
+        elif args.command == 'record-bitmap':
+            record_bitmap_run(args.output_dir, args.filter_string, args.num_shards)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import networkx as nx
+from matplotlib.figure import Figure
+from matplotlib.collections import LineCollection
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+
+
+"""
+contact_sheet.py
+
+Exports many graphs as contact sheets: every sheet is one image with a grid of tiles, one
+graph per tile, instead of one image file per graph. This keeps the number of files small and
+pays the figure setup and save cost once per sheet rather than once per graph.
+
+- For png, jpg and svg, every sheet is written to its own file (sheet_00000.png, ...).
+- For pdf, sheets are pages of multi-page PDF files (sheets_00000.pdf, ...), each holding up
+  to `PAGES_PER_PDF` sheets.
+
+Sheets are rendered in parallel by a pool of worker processes. A JSON sidecar, index.json,
+maps every graph6 string to its sheet and tile:
+
+    {"format": "png", "columns": 10, "rows": 10,
+     "sheets": [{"file": "sheet_00000.png", "page": 0}, ...],
+     "graphs": {"<graph6>": {"sheet": 0, "tile": 0}, ...}}
+
+Tiles are numbered row by row from the top left (row = tile // columns, column = tile % columns).
+The index is written while the sheets are queued, so it is never held in memory as a whole.
+
+Usage:
+    python contact_sheet.py <results_file> <folder> [--format png|jpg|svg|pdf] [--columns C] [--rows R] [--workers W]
+"""
+
+SHEET_FORMATS = ("png", "jpg", "svg", "pdf")
+INDEX_NAME = "index.json"
+
+# Default grid of tiles per sheet, and size of a tile in inches
+DEFAULT_COLUMNS = 10
+DEFAULT_ROWS = 10
+TILE_SIZE = 1.6
+
+# Radius of a drawn graph, as a fraction of the tile size
+TILE_RADIUS = 0.36
+
+# Number of sheets per PDF file, so large exports are split over several files and can be rendered in parallel
+PAGES_PER_PDF = 50
+
+def render_sheet(graphs, columns, rows):
+    """
+    Draws the graphs on a grid of tiles and returns the figure.
+
+    All tiles share a single axes: every graph's layout is moved into its tile, and the edges
+    and vertices of the whole sheet are drawn as one line collection and one scatter plot,
+    which is much cheaper than one axes per graph. Layouts use a fixed seed, so a sheet looks
+    the same every time it is rendered.
+
+    Args:
+        graphs (list): Up to `columns * rows` graph6 strings.
+        columns (int): The number of tiles per row.
+        rows (int): The number of rows of tiles.
+
+    Returns:
+        matplotlib.figure.Figure: The sheet.
+    """
+    # A plain Figure (no pyplot) avoids pyplot's global figure management in the worker processes
+    figure = Figure(figsize=(columns * TILE_SIZE, rows * TILE_SIZE))
+    FigureCanvasAgg(figure)
+    ax = figure.add_axes([0, 0, 1, 1])
+    ax.axis('off')
+    ax.set_xlim(0, columns)
+    ax.set_ylim(rows, 0)  # tile rows go from the top to the bottom
+
+    edges = []
+    vertices = []
+    for tile, graph6 in enumerate(graphs):
+        row, column = divmod(tile, columns)
+        G = nx.from_graph6_bytes(graph6.encode('ascii'))
+
+        # Scale the layout (coordinates in [-1, 1]) into the tile, below the tile's label
+        pos = nx.spring_layout(G, seed=0)
+        center_x, center_y = column + 0.5, row + 0.57
+        xy = {v: (center_x + TILE_RADIUS * x, center_y - TILE_RADIUS * y) for v, (x, y) in pos.items()}
+
+        edges.extend((xy[u], xy[v]) for u, v in G.edges())
+        vertices.extend(xy.values())
+        ax.text(center_x, row + 0.1, graph6, ha='center', va='center', fontsize=7, family='monospace')
+
+    ax.add_collection(LineCollection(edges, colors='gray', linewidths=0.8))
+    if vertices:
+        xs, ys = zip(*vertices)
+        ax.scatter(xs, ys, s=40, c='lightblue', edgecolors='gray', linewidths=0.5, zorder=2)
+    return figure
+
+def render_file(path, image_format, sheets, columns, rows):
+    """
+    Renders one output file: a single sheet for image formats, or several pages for PDF.
+    Runs in a worker process.
+
+    Args:
+        path (str): The file to write.
+        image_format (str): One of `SHEET_FORMATS`.
+        sheets (list): The sheets of the file, each a list of graph6 strings.
+        columns (int): The number of tiles per row.
+        rows (int): The number of rows of tiles.
+
+    Returns:
+        str: The path of the written file.
+    """
+    if image_format == "pdf":
+        with PdfPages(path) as pdf:
+            for graphs in sheets:
+                pdf.savefig(render_sheet(graphs, columns, rows))
+    else:
+        render_sheet(sheets[0], columns, rows).savefig(path, format=image_format, dpi=100)
+    return path
+
+def group_files(graphs, image_format, columns, rows):
+    """
+    Splits a stream of graph6 strings into sheets and output files.
+
+    Yields:
+        tuple: `(file_name, first_sheet, sheets)` for every output file, where `sheets` is a
+               list of sheets (lists of graph6 strings) and `first_sheet` the number of the first one.
+    """
+    per_sheet = columns * rows
+    per_file = PAGES_PER_PDF if image_format == "pdf" else 1
+    sheets = []
+    sheet = []
+    sheet_count = 0
+
+    def file_name(number):
+        return f"sheets_{number:05d}.pdf" if image_format == "pdf" else f"sheet_{number:05d}.{image_format}"
+
+    for graph6 in graphs:
+        sheet.append(graph6)
+        if len(sheet) == per_sheet:
+            sheets.append(sheet)
+            sheet = []
+            if len(sheets) == per_file:
+                yield file_name(sheet_count // per_file), sheet_count, sheets
+                sheet_count += len(sheets)
+                sheets = []
+
+    if sheet:
+        sheets.append(sheet)
+    if sheets:
+        yield file_name(sheet_count // per_file), sheet_count, sheets
+
+def export_contact_sheets(graphs, output_folder, image_format="png", columns=DEFAULT_COLUMNS, rows=DEFAULT_ROWS, workers=None):
+    """
+    Exports graphs as contact sheets, rendered in parallel, and writes the index.json sidecar.
+
+    Only a few files per worker are queued at a time, and the entries of the index are written
+    out as the sheets are queued, so the graphs can be streamed from a results file of any size.
+    The sheets go straight to the index file and the graphs to a temporary file, which is
+    appended to the index at the end.
+
+    Args:
+        graphs (iterable): The graph6 strings to export.
+        output_folder (str): The folder for the sheets and the index (created if needed).
+        image_format (str): One of `SHEET_FORMATS`.
+        columns (int): The number of tiles per row.
+        rows (int): The number of rows of tiles.
+        workers (int, optional): The number of worker processes (default: the number of CPUs).
+
+    Returns:
+        tuple: `(graph_count, sheet_count)`, the number of exported graphs and of sheets.
+
+    Example:
+        >>> export_contact_sheets(["Bw", "BW"], "./graph_images", "png")
+        (2, 1)
+    """
+    if image_format not in SHEET_FORMATS:
+        raise ValueError(f"Unsupported contact sheet format: {image_format}")
+    os.makedirs(output_folder, exist_ok=True)
+
+    workers = workers or os.cpu_count() or 1
+    index_path = os.path.join(output_folder, INDEX_NAME)
+    tmp_path = f"{index_path}.tmp"
+    graph_count = 0
+    sheet_count = 0
+    pending = []
+
+    try:
+        with open(tmp_path, "w") as index_file, tempfile.TemporaryFile("w+", dir=output_folder) as graphs_file:
+            index_file.write(f'{{"format": {json.dumps(image_format)}, "columns": {columns}, "rows": {rows}, "sheets": [')
+
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for file_name, first_sheet, sheets in group_files(graphs, image_format, columns, rows):
+                    # Record where every graph goes while the file is rendered
+                    for page, sheet in enumerate(sheets):
+                        index_file.write((", " if sheet_count else "") + json.dumps({"file": file_name, "page": page}))
+                        for tile, graph6 in enumerate(sheet):
+                            graphs_file.write((", " if graph_count else "") + json.dumps(graph6) + ": "
+                                              + json.dumps({"sheet": first_sheet + page, "tile": tile}))
+                            graph_count += 1
+                        sheet_count += 1
+
+                    pending.append(pool.submit(render_file, os.path.join(output_folder, file_name), image_format, sheets, columns, rows))
+
+                    # Wait for the oldest file when enough are queued, to bound the memory used
+                    if len(pending) >= 2 * workers:
+                        pending.pop(0).result()
+
+                for future in pending:
+                    future.result()
+
+            index_file.write('], "graphs": {')
+            graphs_file.seek(0)
+            shutil.copyfileobj(graphs_file, index_file)
+            index_file.write("}}")
+        os.replace(tmp_path, index_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return graph_count, sheet_count
+
+def read_graphs(path):
+    """
+    Yields the graph6 strings of a results file, one per non-empty line.
+    """
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+
+def parse_positive_int(value):
+    """
+    Argparse type for strictly positive integers.
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid positive integer: {value!r}")
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"invalid positive integer: {value!r}")
+    return number
+
+def parse_args():
+    """
+    Parses command line arguments for exporting a results file as contact sheets.
+
+    Returns:
+        argparse.Namespace: Parsed command line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Export the graphs of a results file as contact sheets.')
+    parser.add_argument('results_file', type=str, help="The results file, one graph6 string per line.")
+    parser.add_argument('output_folder', type=str, help="The folder for the sheets and their index.json.")
+    parser.add_argument('--format', choices=SHEET_FORMATS, default="png", help="The format of the sheets (pdf: multi-page files).")
+    parser.add_argument('--columns', type=parse_positive_int, default=DEFAULT_COLUMNS, help="The number of tiles per row.")
+    parser.add_argument('--rows', type=parse_positive_int, default=DEFAULT_ROWS, help="The number of rows of tiles per sheet.")
+    parser.add_argument('--workers', type=parse_positive_int, help="The number of worker processes (default: the number of CPUs).")
+    return parser.parse_args()
+
+def main():
+    """
+    Main entry point of the script. Exports the results file and reports the number of sheets.
+    """
+    args = parse_args()
+    try:
+        graph_count, sheet_count = export_contact_sheets(read_graphs(args.results_file), args.output_folder, args.format,
+                                                         args.columns, args.rows, args.workers)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Exported {graph_count} graphs on {sheet_count} sheets to {args.output_folder}.")
+
+if __name__ == "__main__":
+    main()
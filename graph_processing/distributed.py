@@ -0,0 +1,604 @@
+import os
+import sys
+import hmac
+import json
+import time
+import socket
+import argparse
+import ipaddress
+import subprocess
+import threading
+import socketserver
+from collections import deque
+from datetime import datetime
+
+from filter_graph import parse_rules, filter_stream
+from history import HistoryEntry
+from history_management import save_history
+from shards import generate_shard
+import checkpoint
+
+
+"""
+distributed.py
+
+Runs a filter job over several hosts. A coordinator splits the job into geng `res/mod`
+shards and hands them out over TCP to worker processes, which generate and filter their
+shards with the same rule semantics as filter_graph.py and stream the passing graphs back.
+
+Protocol (one JSON object per line, over a plain TCP connection per worker):
+    worker -> coordinator
+        {"type": "hello", "name", "token"}                     register, answered with "job" (or "error")
+        {"type": "request"}                                    ask for work, answered with "shard", "wait" or "done"
+        {"type": "heartbeat"}                                  sent periodically while connected
+        {"type": "results", "shard", "attempt", "graphs"}      a batch of passing graphs (graph6)
+        {"type": "complete", "shard", "attempt", "input_count", "output_count"}
+        {"type": "failed", "shard", "attempt", "reason"}       geng failed, the shard must be handed out again
+    coordinator -> worker
+        {"type": "job", "order", "filter", "mod", "heartbeat_interval"}
+        {"type": "shard", "shard", "attempt"}                  generate and filter this shard
+        {"type": "wait"}                                       nothing to hand out right now, ask again later
+        {"type": "done"}                                       the job is complete, disconnect
+        {"type": "error", "reason"}                            the worker was refused (e.g. a wrong token)
+
+The coordinator listens on 127.0.0.1 by default. To accept workers from other hosts it must
+listen on a public address (e.g. --host 0.0.0.0), which requires a shared token: workers send
+it in their hello, and connections with a wrong or missing token are refused, so other hosts
+cannot submit results. The token is read from the `SHED_DISTRIBUTED_TOKEN` environment
+variable (or --token). It is sent in clear text, so use a trusted network or an SSH tunnel.
+
+A worker that disconnects or misses heartbeats for longer than the timeout is considered
+dead: the partial results of its shards are discarded and the shards are handed out again.
+Every assignment has an attempt number, so late messages from a dead worker are ignored.
+A worker whose geng fails (e.g. it is killed) reports the shard as failed and stops; the
+shard's partial results are discarded and it is handed out again under a new attempt.
+When all shards are complete, the coordinator combines their outputs in shard order and
+saves a single history entry for the job.
+
+Usage:
+    python distributed.py coordinator <order> '<filter_string>' [--shards M] [--host H] [--port P] [--job-id ID] [--token T]
+    python distributed.py worker <coordinator_host> [--port P] [--name NAME] [--token T]
+
+Example (two workers on localhost):
+    python distributed.py coordinator 10 '[{"degree_sum": 6, "type": "min", "count": 3}]' --shards 64 &
+    python distributed.py worker localhost &
+    python distributed.py worker localhost
+"""
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 5555
+
+# Environment variable holding the shared token of the coordinator and its workers
+TOKEN_VARIABLE = "SHED_DISTRIBUTED_TOKEN"
+DEFAULT_SHARDS = 64
+
+# Seconds between heartbeats, and seconds without any message after which a worker is dead
+HEARTBEAT_INTERVAL = 5
+HEARTBEAT_TIMEOUT = 15
+
+# Number of passing graphs a worker sends per results message
+RESULT_BATCH_SIZE = 1000
+
+# Directory in which every job gets its own output directory (as for run_filter_parallel.sh)
+OUTPUT_ROOT = "graph_batches"
+
+def is_loopback(host):
+    """
+    Whether `host` is a loopback address, only reachable from this machine.
+    """
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+class MessageChannel:
+    """
+    A TCP connection exchanging newline-delimited JSON messages.
+
+    Sending is thread-safe, so a heartbeat thread can share the channel with the main thread.
+    """
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = sock.makefile("rb")
+        self.send_lock = threading.Lock()
+
+    def send(self, message):
+        """
+        Sends one message.
+
+        Raises:
+            OSError: If the connection is broken.
+        """
+        data = (json.dumps(message) + "\n").encode()
+        with self.send_lock:
+            self.sock.sendall(data)
+
+    def receive(self):
+        """
+        Receives one message.
+
+        Returns:
+            dict: The message, or `None` if the connection was closed.
+        """
+        line = self.reader.readline()
+        if not line:
+            return None
+        return json.loads(line)
+
+    def close(self):
+        """
+        Closes the connection, which also unblocks a thread waiting in `receive()`.
+        """
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.reader.close()
+        self.sock.close()
+
+class Coordinator:
+    """
+    Hands out the shards of a filter job to workers and collects their results.
+
+    Attributes:
+    ----------
+    order : int
+        The number of vertices of the generated graphs.
+    filter_str : str
+        The filter string (in JSON format) applied by the workers.
+    mod : int
+        The number of geng `res/mod` shards the job is split into.
+    job_dir : str
+        The directory receiving the shard outputs and the final combined output.
+    token : str
+        The shared token workers must present, or `None` (only allowed on a loopback address).
+    """
+    def __init__(self, order, filter_str, mod=DEFAULT_SHARDS, job_dir=None,
+                 host=DEFAULT_HOST, port=DEFAULT_PORT, heartbeat_timeout=HEARTBEAT_TIMEOUT, token=None):
+        """
+        Initializes a coordinator. Call `start()` to accept workers and `wait()` to finish the job.
+
+        Raises:
+            SystemExit: If the filter string is not valid JSON.
+            ValueError: If the coordinator would listen on a public address without a token.
+        """
+        parse_rules(filter_str)  # fail early on an invalid filter
+        if not token and not is_loopback(host):
+            raise ValueError(f"Listening on {host} requires a shared token (set {TOKEN_VARIABLE} or use --token)")
+        self.token = token
+        self.order = order
+        self.filter_str = filter_str
+        self.mod = mod
+        self.job_dir = job_dir or os.path.join(OUTPUT_ROOT, datetime.now().strftime("dist_%Y%m%d_%H%M%S"))
+        self.address = (host, port)
+        self.heartbeat_timeout = heartbeat_timeout
+
+        self.lock = threading.Condition()
+        self.pending = deque(range(mod))  # shards waiting to be handed out
+        self.assignments = {}             # shard -> (worker_id, attempt)
+        self.attempts = [0] * mod         # number of times each shard was handed out
+        self.completed = {}               # shard -> (input_count, output_count)
+        self.part_files = {}              # shard -> open file receiving its results
+        self.workers = {}                 # worker_id -> {"name", "channel", "last_seen", "shards"}
+        self.worker_names = set()         # names of all workers that took part
+        self.reassigned = 0               # number of shards taken back from dead or failed workers
+        self.next_worker_id = 0
+        self.server = None
+
+    def start(self):
+        """
+        Starts accepting workers in background threads.
+
+        Returns:
+            tuple: The `(host, port)` the coordinator listens on (useful with port 0).
+        """
+        os.makedirs(self.job_dir, exist_ok=True)
+
+        coordinator = self
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                coordinator.serve_worker(MessageChannel(self.request))
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer(self.address, Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        threading.Thread(target=self.monitor_workers, daemon=True).start()
+        return self.server.server_address
+
+    def finished(self):
+        """
+        Whether every shard is complete.
+        """
+        return len(self.completed) == self.mod
+
+    def serve_worker(self, channel):
+        """
+        Handles the messages of one worker connection until it closes.
+        """
+        worker_id = None
+        try:
+            while True:
+                message = channel.receive()
+                if message is None:
+                    break
+
+                kind = message.get("type")
+                if kind == "hello":
+                    if not self.accepts_token(message.get("token")):
+                        print(f"Refused worker {message.get('name')}: invalid token.", file=sys.stderr)
+                        channel.send({"type": "error", "reason": "invalid token"})
+                        break
+                    worker_id = self.register_worker(message.get("name"), channel)
+                    channel.send({"type": "job", "order": self.order, "filter": self.filter_str,
+                                  "mod": self.mod, "heartbeat_interval": HEARTBEAT_INTERVAL})
+                elif worker_id is None:
+                    break  # a worker must say hello first
+                elif kind == "heartbeat":
+                    self.touch_worker(worker_id)
+                elif kind == "request":
+                    channel.send(self.assign_shard(worker_id))
+                elif kind == "results":
+                    self.add_results(worker_id, message["shard"], message["attempt"], message["graphs"])
+                elif kind == "complete":
+                    self.complete_shard(worker_id, message["shard"], message["attempt"],
+                                        message["input_count"], message["output_count"])
+                elif kind == "failed":
+                    self.fail_shard(worker_id, message["shard"], message["attempt"], message.get("reason"))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Worker {worker_id} failed: {e}", file=sys.stderr)
+        finally:
+            if worker_id is not None:
+                self.release_worker(worker_id, "disconnected")
+            channel.close()
+
+    def accepts_token(self, token):
+        """
+        Whether a worker presenting `token` may join (always, if the coordinator has no token).
+        """
+        if not self.token:
+            return True
+        return isinstance(token, str) and hmac.compare_digest(token.encode(), self.token.encode())
+
+    def register_worker(self, name, channel):
+        """
+        Registers a new worker connection and returns its id.
+        """
+        with self.lock:
+            worker_id = self.next_worker_id
+            self.next_worker_id += 1
+            name = name or f"worker-{worker_id}"
+            self.workers[worker_id] = {"name": name, "channel": channel,
+                                       "last_seen": time.monotonic(), "shards": set()}
+            self.worker_names.add(name)
+        print(f"Worker {name} connected.")
+        return worker_id
+
+    def touch_worker(self, worker_id):
+        """
+        Records that a worker is alive.
+        """
+        with self.lock:
+            if worker_id in self.workers:
+                self.workers[worker_id]["last_seen"] = time.monotonic()
+
+    def assign_shard(self, worker_id):
+        """
+        Picks the next shard for a worker.
+
+        Returns:
+            dict: A "shard" message, "wait" if all remaining shards are in progress elsewhere,
+                  or "done" if the job is complete.
+        """
+        with self.lock:
+            if worker_id not in self.workers:
+                return {"type": "done"}
+            self.workers[worker_id]["last_seen"] = time.monotonic()
+
+            if self.pending:
+                shard = self.pending.popleft()
+                self.attempts[shard] += 1
+                self.assignments[shard] = (worker_id, self.attempts[shard])
+                self.workers[worker_id]["shards"].add(shard)
+                return {"type": "shard", "shard": shard, "attempt": self.attempts[shard]}
+            if self.finished():
+                return {"type": "done"}
+            return {"type": "wait"}
+
+    def is_current(self, worker_id, shard, attempt):
+        """
+        Whether the shard is still assigned to the worker under this attempt (caller holds the lock).
+        """
+        return self.assignments.get(shard) == (worker_id, attempt)
+
+    def part_path(self, shard):
+        """
+        Returns the path receiving the results of a shard that is still in progress.
+        """
+        return checkpoint.shard_output_path(self.job_dir, shard) + ".part"
+
+    def add_results(self, worker_id, shard, attempt, graphs):
+        """
+        Appends a batch of passing graphs to the shard's partial output.
+        Results of outdated attempts (e.g. from a worker declared dead) are ignored.
+        """
+        with self.lock:
+            if worker_id in self.workers:
+                self.workers[worker_id]["last_seen"] = time.monotonic()
+            if not self.is_current(worker_id, shard, attempt):
+                return
+            if shard not in self.part_files:
+                self.part_files[shard] = open(self.part_path(shard), "w")
+            self.part_files[shard].writelines(graph + "\n" for graph in graphs)
+
+    def complete_shard(self, worker_id, shard, attempt, input_count, output_count):
+        """
+        Marks a shard as complete and moves its partial output into place.
+        """
+        with self.lock:
+            if not self.is_current(worker_id, shard, attempt):
+                return
+            part_file = self.part_files.pop(shard, None) or open(self.part_path(shard), "w")
+            part_file.close()
+            os.replace(self.part_path(shard), checkpoint.shard_output_path(self.job_dir, shard))
+
+            del self.assignments[shard]
+            self.workers[worker_id]["shards"].discard(shard)
+            self.completed[shard] = (input_count, output_count)
+            print(f"Shard {shard} complete ({len(self.completed)}/{self.mod}).")
+            if self.finished():
+                self.lock.notify_all()
+
+    def requeue_shard(self, worker, shard):
+        """
+        Takes a shard back from a worker, discarding its partial results (caller holds the lock).
+        """
+        del self.assignments[shard]
+        worker["shards"].discard(shard)
+        part_file = self.part_files.pop(shard, None)
+        if part_file is not None:
+            part_file.close()
+            os.remove(self.part_path(shard))
+        self.pending.appendleft(shard)
+        self.reassigned += 1
+
+    def fail_shard(self, worker_id, shard, attempt, reason):
+        """
+        Hands out a shard again after its worker reported that geng failed.
+        """
+        with self.lock:
+            if not self.is_current(worker_id, shard, attempt):
+                return
+            self.requeue_shard(self.workers[worker_id], shard)
+        print(f"Shard {shard} failed on attempt {attempt} ({reason}), reassigning it.")
+
+    def release_worker(self, worker_id, reason):
+        """
+        Removes a worker and hands its unfinished shards out again, discarding their partial results.
+        """
+        with self.lock:
+            worker = self.workers.pop(worker_id, None)
+            if worker is None:
+                return
+            shards = sorted(worker["shards"])
+            for shard in reversed(shards):
+                self.requeue_shard(worker, shard)
+        if shards:
+            print(f"Worker {worker['name']} {reason}, reassigning shards {shards}.")
+        worker["channel"].close()
+
+    def monitor_workers(self):
+        """
+        Background loop releasing the workers that missed their heartbeats.
+        """
+        while True:
+            with self.lock:
+                if self.lock.wait_for(self.finished, timeout=1):
+                    return
+                now = time.monotonic()
+                dead = [worker_id for worker_id, worker in self.workers.items()
+                        if now - worker["last_seen"] > self.heartbeat_timeout]
+            for worker_id in dead:
+                self.release_worker(worker_id, "missed its heartbeats")
+
+    def wait(self):
+        """
+        Blocks until every shard is complete, then combines the outputs and saves the history.
+
+        Returns:
+            HistoryEntry: The history entry saved for the job.
+        """
+        with self.lock:
+            self.lock.wait_for(self.finished)
+
+        # Stop accepting workers; connected workers get "done" or see the connection close
+        self.server.shutdown()
+        self.server.server_close()
+        with self.lock:
+            workers = list(self.workers.values())
+        for worker in workers:
+            worker["channel"].close()
+
+        # Combine the shard outputs in shard order, as run_filter_parallel.sh does
+        final_path = os.path.join(self.job_dir, checkpoint.FINAL_OUTPUT_NAME)
+        with open(final_path, "wb") as final_file:
+            for shard in range(self.mod):
+                with open(checkpoint.shard_output_path(self.job_dir, shard), "rb") as shard_file:
+                    checkpoint.copy_prefix(shard_file, final_file, os.fstat(shard_file.fileno()).st_size)
+
+        entry = HistoryEntry(
+            input_number=sum(counts[0] for counts in self.completed.values()),
+            output_number=sum(counts[1] for counts in self.completed.values()),
+            filter_str=self.filter_str,
+            passed_graph_list=checkpoint.read_last_lines(final_path, checkpoint.HISTORY_GRAPH_COUNT),
+            metadata={"job_id": os.path.basename(os.path.normpath(self.job_dir)),
+                      "workers": len(self.worker_names), "reassigned_shards": self.reassigned}
+        )
+        save_history([entry])
+        return entry
+
+class ResultStream:
+    """
+    Write-only file-like object given to `filter_stream()` as its output. It collects the
+    passing graphs and streams them to the coordinator in batches of `RESULT_BATCH_SIZE`.
+    """
+    def __init__(self, channel, shard, attempt, batch_size=RESULT_BATCH_SIZE):
+        self.channel = channel
+        self.shard = shard
+        self.attempt = attempt
+        self.batch_size = batch_size
+        self.buffer = []
+        self.lines = 0
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.lines += data.count(b"\n")
+        if self.lines >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        graphs = b"".join(self.buffer).decode().split()
+        self.buffer = []
+        self.lines = 0
+        if graphs:
+            self.channel.send({"type": "results", "shard": self.shard, "attempt": self.attempt, "graphs": graphs})
+
+def run_worker(host, port=DEFAULT_PORT, name=None, generate=generate_shard, token=None):
+    """
+    Connects to a coordinator and filters the shards it hands out until the job is complete.
+
+    Args:
+        host (str): The host of the coordinator.
+        port (int): The port of the coordinator.
+        name (str, optional): A name identifying this worker in the coordinator's output.
+        generate (callable): Context manager yielding the graph6 lines of a shard, called as
+                             `generate(order, res, mod)` (geng by default).
+        token (str, optional): The shared token of the coordinator.
+
+    Returns:
+        int: The number of shards this worker completed.
+
+    Raises:
+        PermissionError: If the coordinator refused this worker (e.g. a wrong token).
+        subprocess.CalledProcessError: If geng failed; the shard was reported as failed.
+    """
+    completed = 0
+    with socket.create_connection((host, port)) as sock:
+        channel = MessageChannel(sock)
+        channel.send({"type": "hello", "name": name or f"{socket.gethostname()}-{os.getpid()}", "token": token})
+        job = channel.receive()
+        if job is None:
+            return completed
+        if job["type"] == "error":
+            raise PermissionError(job["reason"])
+        rules = json.loads(job["filter"])
+
+        # Keep sending heartbeats while we are busy filtering
+        stopped = threading.Event()
+        def send_heartbeats():
+            while not stopped.wait(job["heartbeat_interval"]):
+                try:
+                    channel.send({"type": "heartbeat"})
+                except OSError:
+                    return
+        threading.Thread(target=send_heartbeats, daemon=True).start()
+
+        try:
+            while True:
+                channel.send({"type": "request"})
+                reply = channel.receive()
+                if reply is None or reply["type"] == "done":
+                    break
+                if reply["type"] == "wait":
+                    time.sleep(job["heartbeat_interval"] / 5)
+                    continue
+
+                shard, attempt = reply["shard"], reply["attempt"]
+                results = ResultStream(channel, shard, attempt)
+                try:
+                    with generate(job["order"], shard, job["mod"]) as lines:
+                        input_count, output_count, _, _ = filter_stream(lines, rules, results)
+                except subprocess.CalledProcessError as e:
+                    # The counts of an incomplete shard are wrong, let another worker redo it
+                    channel.send({"type": "failed", "shard": shard, "attempt": attempt, "reason": str(e)})
+                    raise
+                results.flush()
+                channel.send({"type": "complete", "shard": shard, "attempt": attempt,
+                              "input_count": input_count, "output_count": output_count})
+                completed += 1
+        except OSError:
+            pass  # the coordinator went away; it hands our shard to another worker
+        finally:
+            stopped.set()
+            channel.close()
+    return completed
+
+def parse_args():
+    """
+    Parses command line arguments for the coordinator and worker roles.
+
+    Returns:
+        argparse.Namespace: Parsed command line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Run a filter job distributed over several hosts.')
+    roles = parser.add_subparsers(dest='role', required=True)
+
+    coordinator_parser = roles.add_parser('coordinator', help="Split a job into shards and hand them out to workers.")
+    coordinator_parser.add_argument('order', type=int, help="The number of vertices of the graphs.")
+    coordinator_parser.add_argument('filter_string', type=str, help="The filter string in JSON format.")
+    coordinator_parser.add_argument('--shards', type=int, default=DEFAULT_SHARDS, help="The number of geng res/mod shards.")
+    coordinator_parser.add_argument('--host', type=str, default=DEFAULT_HOST,
+                                    help="The address to listen on (a public address such as 0.0.0.0 requires a token).")
+    coordinator_parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="The port to listen on.")
+    coordinator_parser.add_argument('--job-id', type=str, help="The job id (output goes to graph_batches/<id>/).")
+    coordinator_parser.add_argument('--token', type=str, default=os.environ.get(TOKEN_VARIABLE),
+                                    help=f"The shared token workers must present (default: ${TOKEN_VARIABLE}).")
+    coordinator_parser.add_argument('--heartbeat-timeout', type=float, default=HEARTBEAT_TIMEOUT,
+                                    help="Seconds without messages after which a worker is considered dead.")
+
+    worker_parser = roles.add_parser('worker', help="Filter the shards handed out by a coordinator.")
+    worker_parser.add_argument('host', type=str, help="The host of the coordinator.")
+    worker_parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="The port of the coordinator.")
+    worker_parser.add_argument('--name', type=str, help="A name identifying this worker.")
+    worker_parser.add_argument('--token', type=str, default=os.environ.get(TOKEN_VARIABLE),
+                               help=f"The shared token of the coordinator (default: ${TOKEN_VARIABLE}).")
+
+    return parser.parse_args()
+
+def main():
+    """
+    Main entry point of the script. Runs the coordinator or a worker.
+    """
+    args = parse_args()
+
+    if args.role == 'coordinator':
+        job_dir = os.path.join(OUTPUT_ROOT, args.job_id) if args.job_id else None
+        try:
+            coordinator = Coordinator(args.order, args.filter_string, args.shards, job_dir,
+                                      args.host, args.port, args.heartbeat_timeout, args.token)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        host, port = coordinator.start()
+        print(f"Coordinator listening on {host}:{port}, waiting for workers to filter {args.shards} shards.")
+        entry = coordinator.wait()
+        print(f"{entry.output_number} of {entry.input_number} graphs passed. History saved to history.txt.")
+        print(f"All filtered graphs saved to {os.path.join(coordinator.job_dir, checkpoint.FINAL_OUTPUT_NAME)}.")
+    else:
+        try:
+            completed = run_worker(args.host, args.port, args.name, token=args.token)
+        except PermissionError as e:
+            print(f"Error: the coordinator refused this worker: {e}")
+            sys.exit(1)
+        except subprocess.CalledProcessError as e:
+            print(f"Error: {e}; the coordinator hands the shard to another worker.")
+            sys.exit(1)
+        except OSError as e:
+            print(f"Error: cannot reach the coordinator: {e}")
+            sys.exit(1)
+        print(f"Worker finished after completing {completed} shards.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,406 @@
+import os
+import sys
+import json
+import math
+import random
+import argparse
+import subprocess
+from statistics import NormalDist
+
+from filter_graph import parse_rules, filter_stream
+from shards import generate_shard
+
+
+"""
+estimate_filter.py
+
+This script estimates how many graphs of a given order will pass a filter, before
+committing to a full (possibly multi-hour) run. Instead of filtering every graph, it
+runs the filter over a random sample of geng `res/mod` shards and extrapolates:
+
+    - the estimated number of passing graphs
+    - the estimated pass rate (passing graphs / generated graphs)
+    - the projected runtime of the full run (CPU time and wall time for a number of workers)
+
+Each estimate comes with a confidence interval based on the variation between the
+sampled shards (ratio estimator with finite population correction). The sample is kept to
+at most `MAX_SAMPLE_FRACTION` of the shards and about `MAX_SAMPLE_GRAPHS` graphs (--max-graphs),
+so an estimate stays much cheaper than the run; orders whose shards are too large for that
+are refused.
+The projected runtime adds the measured startup time of a filter worker (interpreter and
+imports) for every worker of the full run.
+
+Usage:
+    python estimate_filter.py <order> '<filter_string>' [--samples S] [--mod M] [--workers W] [--max-graphs G] [--json]
+
+Example:
+    python estimate_filter.py 11 '[{"degree_sum": 6, "type": "min", "count": 3}]' --samples 8
+"""
+
+# Number of (unlabelled) graphs with n vertices, OEIS A000088. geng generates exactly
+# these graphs, so the size of the full run is known without generating it.
+GRAPH_COUNTS = {
+    0: 1, 1: 1, 2: 2, 3: 4, 4: 11, 5: 34, 6: 156, 7: 1044, 8: 12346, 9: 274668,
+    10: 12005168, 11: 1018997864, 12: 165091172592, 13: 50502031367952,
+    14: 29054155657235488, 15: 31426485969804308768,
+}
+
+# Default number of shards to sample and average number of graphs per shard
+DEFAULT_SAMPLES = 8
+TARGET_SHARD_SIZE = 20000
+
+# A confidence interval needs at least 2 shards, and the sample is capped at this fraction of
+# the shards (smaller shards are chosen for orders where the default would exceed it)
+MIN_SAMPLES = 2
+MAX_SAMPLE_FRACTION = 0.1
+
+# Expected number of graphs of a sample at most (about a quarter of an hour of filtering). From
+# 14 vertices on, geng cannot split the graphs into shards small enough to stay below it
+MAX_SAMPLE_GRAPHS = 10000000
+
+# geng splits the graphs into res/mod classes at a fixed level of its search tree. The classes
+# are only of comparable size when that level has many more nodes (graphs on fewer vertices)
+# than there are classes, so we require at least this many nodes per class.
+NODES_PER_SHARD = 20
+
+# geng's upper limit on mod (its internal multiplicity 20*mod must stay below 10^9)
+MAX_MOD = 49999999
+
+# Number of parallel workers used by run_filter_parallel.sh
+DEFAULT_WORKERS = 4
+
+def choose_split(order, mod=None, target_shard_size=TARGET_SHARD_SIZE):
+    """
+    Chooses how to split the graphs of the given order into geng shards of comparable size.
+
+    geng splits at level n-3 (n-4 from 14 vertices on), which for large `mod` leaves most
+    classes empty. The `-X` option moves that level up, so we pick the smallest increase for
+    which the split level has at least `NODES_PER_SHARD` nodes per class. The split level is
+    kept at most n-2, since generating all graphs on n-1 vertices for every shard is too costly.
+
+    Args:
+        order (int): The number of vertices.
+        mod (int, optional): The number of shards; chosen from `target_shard_size` if omitted.
+        target_shard_size (int): The desired average number of graphs per shard.
+
+    Returns:
+        tuple: `(mod, split_increase)`, the `mod` value and `-X` value to pass to geng.
+               A `mod` of 1 means the order is small enough to run completely.
+
+    Example:
+        >>> choose_split(11)
+        (13733, 1)
+    """
+    total = GRAPH_COUNTS.get(order)
+    if total is None or order < 6:
+        return (mod or 1), 0
+
+    base_level = order - 4 if order >= 14 else order - 3
+    if mod is None:
+        mod = min(total // target_shard_size, GRAPH_COUNTS[order - 2] // NODES_PER_SHARD, MAX_MOD)
+    if mod <= 1:
+        return 1, 0
+
+    # Move the split level up until it has enough nodes for every class
+    level = base_level
+    while level < order - 2 and GRAPH_COUNTS[level] < NODES_PER_SHARD * mod:
+        level += 1
+    return mod, level - base_level
+
+def t_quantile(p, df):
+    """
+    Approximates the p-quantile of Student's t-distribution with `df` degrees of freedom.
+
+    Uses the Cornish-Fisher expansion around the normal quantile, which is accurate to a
+    few percent for df >= 3 and converges to the normal quantile for large df.
+
+    Args:
+        p (float): The probability (e.g. 0.975 for a two-sided 95% interval).
+        df (int): The degrees of freedom.
+
+    Returns:
+        float: The approximated quantile.
+    """
+    z = NormalDist().inv_cdf(p)
+    return (z
+            + (z ** 3 + z) / (4 * df)
+            + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+            + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * df ** 3))
+
+def ratio_estimate(ys, xs, population_size, confidence=0.95):
+    """
+    Estimates the ratio sum(Y) / sum(X) over all shards from a simple random sample of shards.
+
+    Args:
+        ys (list): The sampled numerator values (e.g. passing graphs per shard).
+        xs (list): The sampled denominator values (e.g. generated graphs per shard).
+        population_size (int): The total number of shards the sample was drawn from.
+        confidence (float): The confidence level of the interval.
+
+    Returns:
+        tuple: `(ratio, low, high)`, the estimated ratio and its confidence interval.
+               The interval is `(ratio, ratio)` when the whole population was sampled.
+
+    Raises:
+        ValueError: If the sampled shards contain no graphs at all (sum(X) == 0), or if
+                    fewer than `MIN_SAMPLES` shards of a larger population were sampled.
+
+    Example:
+        >>> ratio_estimate([1, 2, 3], [10, 20, 30], 100)
+        (0.1, 0.1, 0.1)
+    """
+    n = len(xs)
+    if sum(xs) == 0:
+        raise ValueError("The sampled shards contain no graphs")
+
+    ratio = sum(ys) / sum(xs)
+    sampling_fraction = n / population_size
+    if sampling_fraction >= 1:
+        return ratio, ratio, ratio
+    if n < MIN_SAMPLES:
+        raise ValueError(f"At least {MIN_SAMPLES} shards are needed for a confidence interval")
+
+    # Linearized variance of the ratio estimator with finite population correction
+    mean_x = sum(xs) / n
+    residual_variance = sum((y - ratio * x) ** 2 for y, x in zip(ys, xs)) / (n - 1)
+    standard_error = math.sqrt((1 - sampling_fraction) * residual_variance / n) / mean_x
+
+    margin = t_quantile((1 + confidence) / 2, n - 1) * standard_error
+    return ratio, max(0.0, ratio - margin), ratio + margin
+
+def plan_sample(order, samples=DEFAULT_SAMPLES, mod=None, max_graphs=MAX_SAMPLE_GRAPHS):
+    """
+    Chooses the shards of an estimate: how to split the graphs and how many shards to sample.
+
+    The sample is capped at `MAX_SAMPLE_FRACTION` of the shards (but at least `MIN_SAMPLES`),
+    and at the number of shards expected to hold `max_graphs` graphs. When `mod` is not given,
+    the shards are made small enough for `samples` shards to stay within that fraction of the
+    graphs, as far as geng's split level allows.
+
+    Args:
+        order (int): The number of vertices.
+        samples (int): The requested number of shards to sample.
+        mod (int, optional): The number of shards (chosen from the order if omitted).
+        max_graphs (int): The expected number of graphs of the sample at most.
+
+    Returns:
+        tuple: `(mod, split_increase, samples)`. A `mod` of 1 means the order is small
+               enough to run completely, with a single sample.
+
+    Raises:
+        ValueError: If the number of graphs of the order is not tabulated and `mod` is not
+                    given, or if even the smallest sample would exceed `max_graphs` graphs.
+
+    Example:
+        >>> plan_sample(9)
+        (52, 1, 5)
+    """
+    total = GRAPH_COUNTS.get(order)
+    if total is None and mod is None:
+        raise ValueError(f"The number of graphs with {order} vertices is unknown, give the number of shards")
+    target_shard_size = TARGET_SHARD_SIZE
+    if mod is None and total > TARGET_SHARD_SIZE:
+        target_shard_size = min(TARGET_SHARD_SIZE, max(1, int(total * MAX_SAMPLE_FRACTION / samples)))
+
+    mod, split_increase = choose_split(order, mod, target_shard_size)
+    if mod <= 1:
+        if total is not None and total > max_graphs:
+            raise ValueError(f"Running all {total} graphs with {order} vertices exceeds {max_graphs} graphs")
+        return 1, split_increase, 1
+
+    samples = min(mod, max(MIN_SAMPLES, min(samples, int(mod * MAX_SAMPLE_FRACTION))))
+    if total is not None:
+        samples = min(samples, int(max_graphs * mod / total))
+        if samples < MIN_SAMPLES:
+            raise ValueError(f"A sample of {MIN_SAMPLES} shards of the graphs with {order} vertices "
+                             f"exceeds {max_graphs} graphs, the shards of this order are too large")
+    return mod, split_increase, samples
+
+# CPU time of starting a filter worker, measured once per process (see `startup_seconds()`)
+measured_startup = None
+
+def startup_seconds():
+    """
+    Measures the CPU time of starting a filter worker: the Python interpreter and the
+    imports of filter_graph.py. Every worker of a full run pays it once, independently of
+    the number of graphs, so it is added to the projected runtime rather than sampled.
+
+    Returns:
+        float: The CPU time in seconds (0 if the measurement failed).
+    """
+    global measured_startup
+    if measured_startup is None:
+        before = os.times()
+        try:
+            subprocess.run([sys.executable, "-c", "import filter_graph"], check=True,
+                           cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.DEVNULL)
+        except (OSError, subprocess.CalledProcessError):
+            return 0.0
+        after = os.times()
+        measured_startup = (after.children_user + after.children_system
+                            - before.children_user - before.children_system)
+    return measured_startup
+
+def run_shard(order, res, mod, rules, split_increase=0):
+    """
+    Generates one geng `res/mod` shard and runs the filter over it.
+
+    Args:
+        order (int): The number of vertices.
+        res (int): The shard to generate (0 <= res < mod).
+        mod (int): The total number of shards.
+        rules (list): A list of rule dictionaries.
+        split_increase (int): The value of geng's `-X` option (see `choose_split()`).
+
+    Returns:
+        tuple: `(input_count, output_count, seconds)` for the shard, where `seconds` is the
+               CPU time spent generating and filtering it.
+
+    Raises:
+        subprocess.CalledProcessError: If geng failed, so the shard's counts would be wrong.
+    """
+    before = os.times()
+    with generate_shard(order, res, mod, split_increase) as lines, open(os.devnull, "wb") as sink:
+        input_count, output_count, _, _ = filter_stream(lines, rules, sink)
+    after = os.times()
+
+    # CPU time of this process (filtering) plus that of the finished geng child (generation)
+    seconds = (after.user + after.system - before.user - before.system
+               + after.children_user + after.children_system
+               - before.children_user - before.children_system)
+    return input_count, output_count, seconds
+
+def estimate(order, rules, samples=DEFAULT_SAMPLES, mod=None, workers=DEFAULT_WORKERS, confidence=0.95, seed=None,
+             max_graphs=MAX_SAMPLE_GRAPHS):
+    """
+    Estimates the outcome and runtime of filtering all graphs of the given order.
+
+    Args:
+        order (int): The number of vertices.
+        rules (list): A list of rule dictionaries.
+        samples (int): The number of shards to sample (capped as described in `plan_sample()`).
+        mod (int, optional): The number of shards to split the graphs into (chosen from the order if omitted).
+        workers (int): The number of parallel workers used to project the wall time.
+        confidence (float): The confidence level of the intervals.
+        seed (int, optional): Seed for choosing the sampled shards (for reproducible estimates).
+        max_graphs (int): The expected number of graphs of the sample at most.
+
+    Returns:
+        dict: The estimates. Every estimated quantity is a dictionary with keys
+              `estimate`, `low` and `high`. When the order is small enough to run completely
+              (or every shard was sampled), `exact` is `True` and the intervals of the pass
+              count and rate are collapsed. The runtimes include `startup_seconds` per worker.
+    """
+    mod, split_increase, samples = plan_sample(order, samples, mod, max_graphs)
+    shards = sorted(random.Random(seed).sample(range(mod), samples))
+
+    # Filter the sampled shards and remember their sizes, pass counts and CPU times
+    inputs, outputs, cpu_times = [], [], []
+    for res in shards:
+        input_count, output_count, seconds = run_shard(order, res, mod, rules, split_increase)
+        inputs.append(input_count)
+        outputs.append(output_count)
+        cpu_times.append(seconds)
+
+    # The total number of generated graphs is known for the tabulated orders
+    total_graphs = GRAPH_COUNTS.get(order)
+    if total_graphs is None:
+        total_graphs = round(sum(inputs) / samples * mod)
+
+    pass_rate, rate_low, rate_high = ratio_estimate(outputs, inputs, mod, confidence)
+    seconds_per_graph, time_low, time_high = ratio_estimate(cpu_times, inputs, mod, confidence)
+
+    startup = startup_seconds()
+
+    def scaled(value, low, high, factor, offset=0.0):
+        return {"estimate": value * factor + offset, "low": low * factor + offset, "high": high * factor + offset}
+
+    return {
+        "order": order,
+        "mod": mod,
+        "split_increase": split_increase,
+        "shards": shards,
+        "sampled_graphs": sum(inputs),
+        "sampled_passed": sum(outputs),
+        "total_graphs": total_graphs,
+        "confidence": confidence,
+        "exact": samples == mod,
+        "pass_rate": scaled(pass_rate, rate_low, rate_high, 1),
+        "pass_count": scaled(pass_rate, rate_low, rate_high, total_graphs),
+        "cpu_seconds": scaled(seconds_per_graph, time_low, time_high, total_graphs, workers * startup),
+        "wall_seconds": scaled(seconds_per_graph, time_low, time_high, total_graphs / workers, startup),
+        "startup_seconds": startup,
+        "workers": workers,
+    }
+
+def format_estimate(result):
+    """
+    Formats the result of `estimate()` as a short human-readable report.
+    """
+    def interval(value, fmt):
+        return f"{fmt.format(value['estimate'])} [{fmt.format(value['low'])} - {fmt.format(value['high'])}]"
+
+    label = "exact" if result["exact"] else f"{result['confidence']:.0%} CI"
+    return "\n".join([
+        f"Sampled {len(result['shards'])}/{result['mod']} shards: "
+        f"{result['sampled_passed']} of {result['sampled_graphs']} graphs passed.",
+        f"Graphs generated : {result['total_graphs']}",
+        f"Passing graphs   : {interval(result['pass_count'], '{:.0f}')} ({label})",
+        f"Pass rate        : {interval(result['pass_rate'], '{:.4%}')}",
+        f"CPU time         : {interval(result['cpu_seconds'], '{:.1f}')} s",
+        f"Wall time        : {interval(result['wall_seconds'], '{:.1f}')} s with {result['workers']} workers",
+    ])
+
+def parse_samples(value):
+    """
+    Argparse type for the number of sampled shards (at least `MIN_SAMPLES`).
+    """
+    try:
+        samples = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid number of samples: {value!r}")
+    if samples < MIN_SAMPLES:
+        raise argparse.ArgumentTypeError(f"at least {MIN_SAMPLES} samples are needed for a confidence interval")
+    return samples
+
+def parse_args():
+    """
+    Parses command line arguments for the estimator.
+
+    Returns:
+        argparse.Namespace: Parsed command line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Estimate the pass count and runtime of a filter from a sample of geng shards.')
+    parser.add_argument('order', type=int, help="The number of vertices of the graphs.")
+    parser.add_argument('filter_string', type=str, help="The filter string in JSON format.")
+    parser.add_argument('--samples', type=parse_samples, default=DEFAULT_SAMPLES,
+                        help=f"The number of shards to sample (at least {MIN_SAMPLES}, at most {MAX_SAMPLE_FRACTION:.0%} of the shards).")
+    parser.add_argument('--mod', type=int, help="The number of shards to split the graphs into.")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="The number of workers of the full run.")
+    parser.add_argument('--seed', type=int, help="Seed for choosing the sampled shards.")
+    parser.add_argument('--max-graphs', type=int, default=MAX_SAMPLE_GRAPHS,
+                        help=f"The expected number of sampled graphs at most (default {MAX_SAMPLE_GRAPHS}).")
+    parser.add_argument('--json', action='store_true', help="Print the estimate as JSON.")
+    return parser.parse_args()
+
+def main():
+    """
+    Main entry point of the script. Samples the shards and prints the estimate.
+    """
+    args = parse_args()
+    rules = parse_rules(args.filter_string)
+
+    try:
+        result = estimate(args.order, rules, samples=args.samples, mod=args.mod, workers=args.workers, seed=args.seed,
+                          max_graphs=args.max_graphs)
+    except (OSError, ValueError, subprocess.CalledProcessError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print(format_estimate(result))
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,18 @@
-from datetime import datetime
+import os
 import sys
 import json
+import signal
+import cProfile
 import networkx as nx
 import argparse
 
 from history import HistoryEntry
 from export_graph6toImage import export_graph_image
 from history_management import save_history
+from stats import StageTimer, NULL_TIMER, format_report
+from graph_io import read_lines, open_output, COMPRESSIONS
+from passmap import PassMap, RoaringBitmap
+import checkpoint
 
 
 """
@@ -15,7 +21,8 @@ filter_graph.py
 This script filters graphs based on user-defined rules involving the sum of degrees
 of nodes at each edge. It reads graphs in graph6 format from standard input, checks
 each graph against a list of rules provided as a JSON string, and prints only the
-graphs that satisfy all the rules.
+graphs that satisfy all the rules. Input and output are handled as bytes: stdin is read in
+large blocks and the passing graphs are written in batches (see graph_io.py).
 
 Each rule specifies:
     - "degree_sum": the target sum of degrees of two connected nodes
@@ -23,12 +30,36 @@ Each rule specifies:
     - "count": how many such edges are required
 
 Usage:
-    python filter_graph.py '<filter_string>'
+    python filter_graph.py '<filter_string>' [--limit K] [--output FILE] [--compress gzip|zstd]
 
 Example:
     python filter_graph.py 6 '[{"degree_sum": 6, "type": "min", "count": 3}]'
     This keeps only graphs with 6 vertices and at least 3 edges where the endpoints have degrees summing to 6.
 
+With --output FILE the passing graphs are written to FILE instead of stdout. With
+--compress (or an output file ending in .gz or .zst) they are compressed on the fly.
+
+With --bitmap FILE the indices of the passing graphs in the input order are also recorded
+as a compact bitmap (see passmap.py), so the result can be stored and combined without the
+graph6 text.
+
+With --limit K the script stops reading input as soon as K graphs have passed. Once the
+script exits, the upstream geng process is terminated by SIGPIPE on its next write. A
+SIGTERM sent by a runner script (e.g. because other workers already found enough graphs)
+also stops the filter cleanly. In both cases the history entry is marked as truncated.
+With --summary FILE the counts of the run are written to FILE as JSON instead of a history
+entry; run_filter_parallel.sh uses it in limit mode to save a single entry for all workers.
+
+With --checkpoint MANIFEST --shard I --output FILE the script runs shard I of a sharded job
+(see checkpoint.py). Progress is recorded in the job manifest every few thousand graphs, and
+a restarted worker resumes from the last checkpoint instead of starting over. The history of
+a sharded job is saved once for the whole job, when it is finalized.
+
+With --stats the script measures the wall-clock and CPU time of every stage of the filter
+loop (waiting for geng, graph6 decoding, rule evaluation, output writes, image export),
+the throughput, pass rate and peak memory, prints them to stderr and stores them in the
+history entry. With --profile FILE a cProfile dump of the run is written to FILE.
+
 Version: 1.0
 """
 
@@ -153,6 +184,206 @@ def satisfies_all_rules(G, rules):
             return False
     return True
 
+# Number of input graphs between two checkpoints of a sharded job
+CHECKPOINT_INTERVAL = 10000
+
+# Number of passing graphs collected before they are written to the output at once
+WRITE_BATCH_SIZE = 4096
+
+# Set by the SIGTERM handler to ask the filter loop to stop after the current graph
+stop_requested = False
+
+def handle_termination(signum, frame):
+    """
+    Signal handler for SIGTERM. Requests the filter loop to stop so that the history
+    of the graphs processed so far can still be saved.
+    """
+    global stop_requested
+    stop_requested = True
+
+def filter_stream(lines, rules, output, limit=None, export_folder=None, image_format=None,
+                  progress=None, progress_interval=CHECKPOINT_INTERVAL, timer=NULL_TIMER, passed_indices=None):
+    """
+    Filters graph6 lines against the rules and writes the passing graphs to `output`.
+
+    The passing graphs are written in batches of `WRITE_BATCH_SIZE` lines, before every
+    `progress` call and at the end (in limit mode, every match is written and flushed at once).
+
+    Args:
+        lines (iterable): An iterable of graph6 bytes strings (e.g. `read_lines(sys.stdin.buffer)`),
+                          one graph per line; surrounding whitespace and empty lines are ignored.
+        rules (list): A list of rule dictionaries.
+        output (file): A writable binary file object that receives the passing graphs.
+        limit (int, optional): Stop as soon as this many graphs have passed the filter.
+        export_folder (str, optional): Folder to export images of the passing graphs to.
+        image_format (str, optional): The image format used when exporting.
+        progress (callable, optional): Called as `progress(input_count, output_count)` after
+                                       every `progress_interval` input graphs (e.g. to checkpoint).
+        progress_interval (int): The number of input graphs between two `progress` calls.
+        timer (StageTimer, optional): Receives a lap at the end of every stage of the loop (see stats.py).
+        passed_indices (RoaringBitmap, optional): Receives the index (counting from 0) of every passing graph.
+                                                  The passing graphs are then not collected.
+
+    Returns:
+        tuple: `(input_count, output_count, passed_graphs, truncated)` where `passed_graphs`
+               are the passing graph6 strings (empty if `passed_indices` is given) and
+               `truncated` is `True` if the filter stopped before all input graphs were read.
+
+    Example:
+        >>> filter_stream([b"Bg", b"Bw"], [{"degree_sum": 3, "type": "min", "count": 1}], sys.stdout.buffer)
+        Bg
+        (2, 1, ['Bg'], False)
+    """
+    # Initialize counters and list for keeping track of processed graphs
+    input_count = 0
+    output_count = 0
+    passed_graphs = []
+    truncated = False
+    pending = []  # passing graphs that were not written to the output yet
+
+    # Process each graph from the input
+    for line in lines:
+        timer.lap("generate")
+        line = line.strip() # Remove leading/trailing whitespace
+        if not line: # Skip empty lines
+            continue
+
+        # Stop if the limit was reached or a runner asked us to stop; there is input left,
+        # so the result is incomplete
+        if stop_requested or (limit is not None and output_count >= limit):
+            truncated = True
+            break
+
+        input_count += 1 # Increment input graph count
+
+        # Convert graph6 format bytes to a NetworkX graph object
+        G = nx.from_graph6_bytes(line)
+        timer.lap("decode")
+        
+        # Check if the graph satisfies all the filtering rules
+        passed = satisfies_all_rules(G, rules)
+        timer.lap("rules")
+        if passed:
+            pending.append(line + b"\n") # Queue the graph for output if it passes the filter
+            output_count += 1 # Increment output graph count
+            # Record the passing graph: only its index for a pass map, which is what keeps it small
+            if passed_indices is not None:
+                passed_indices.add(input_count - 1)
+            else:
+                passed_graphs.append(line) # Add the graph to the list of passed graphs
+
+            # Write right away in limit mode so runners can count the matches found so far
+            if limit is not None or len(pending) >= WRITE_BATCH_SIZE:
+                output.write(b"".join(pending))
+                pending = []
+                if limit is not None:
+                    output.flush()
+            timer.lap("write")
+            
+            # If image export is requested, export the graph image
+            if export_folder:
+                export_graph_image(line.decode(), image_format, export_folder)
+                timer.lap("export")
+
+        # Report progress at regular intervals, once everything so far is written
+        if progress is not None and input_count % progress_interval == 0:
+            output.write(b"".join(pending))
+            pending = []
+            progress(input_count, output_count)
+            timer.lap("write")
+
+    output.write(b"".join(pending))
+    timer.lap("write")
+
+    # A runner may also stop us while we wait for input (e.g. when geng was terminated as well)
+    if stop_requested:
+        truncated = True
+
+    return input_count, output_count, [graph.decode() for graph in passed_graphs], truncated
+
+def skip_graphs(lines, count):
+    """
+    Skips the first `count` graphs (non-empty lines) of `lines` and yields the remaining lines.
+
+    Used to resume a shard: geng enumerates a shard in a deterministic order, so the graphs
+    that were already filtered before the last checkpoint are exactly the first ones.
+    """
+    lines = iter(lines)
+    skipped = 0
+    while skipped < count:
+        line = next(lines, None)
+        if line is None:
+            return
+        if line.strip():
+            skipped += 1
+    yield from lines
+
+def run_checkpointed_shard(args, rules, timer=NULL_TIMER):
+    """
+    Filters one shard of a sharded job, resuming from the shard's last checkpoint.
+
+    Output written after the last checkpoint is truncated, the graphs filtered before it are
+    skipped, and progress is recorded in the job manifest every `CHECKPOINT_INTERVAL` graphs.
+    When the input is exhausted the shard is marked as drained: the end of the input can also
+    mean that geng died, so only the runner, which knows geng's exit status, marks the shard as
+    complete. If the worker is stopped with SIGTERM, its progress is checkpointed so a restart
+    continues from there.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments (uses checkpoint, shard, output, export and image).
+        rules (list): A list of rule dictionaries.
+        timer (StageTimer, optional): Timer measuring the stages of this run.
+
+    Returns:
+        tuple: `(input_count, output_count)` for this run (without the graphs filtered before the checkpoint).
+    """
+    shard = checkpoint.get_shard(args.checkpoint, args.shard)
+    if shard["state"] == "complete":
+        print(f"Shard {args.shard} is already complete.", file=sys.stderr)
+        return 0, 0
+
+    base_input_count = shard["input_count"]
+    base_output_count = shard["output_count"]
+
+    with checkpoint.open_shard_output(args.output, shard["offset"]) as output:
+        def save_progress(input_count, output_count, state="running", **fields):
+            # Make the output durable before recording its size in the manifest
+            output.flush()
+            os.fsync(output.fileno())
+            checkpoint.update_shard(
+                args.checkpoint, args.shard,
+                state=state,
+                input_count=base_input_count + input_count,
+                output_count=base_output_count + output_count,
+                offset=os.fstat(output.fileno()).st_size,
+                **fields
+            )
+
+        input_count, output_count, _, truncated = filter_stream(
+            skip_graphs(read_lines(sys.stdin.buffer), base_input_count), rules, output,
+            export_folder=args.export,
+            image_format=args.image,
+            progress=save_progress,
+            timer=timer
+        )
+
+        # Keep the statistics of the run with the shard, the job's history entry collects them
+        fields = {"stats": timer.report(input_count, output_count)} if args.stats else {}
+        save_progress(input_count, output_count, "running" if truncated else "drained", **fields)
+    return input_count, output_count
+
+def parse_positive_int(value):
+    """
+    Argparse type for strictly positive integers (used for --limit).
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid positive integer: {value!r}")
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"invalid positive integer: {value!r}")
+    return number
+
 def parse_args():
     """
     Parses command line arguments to allow the user to specify filter string,
@@ -170,6 +401,22 @@ def parse_args():
     # Optional arguments for exporting images
     parser.add_argument('--export', metavar='FOLDER', type=str, help="Export filtered graphs as images to the specified folder.")
     parser.add_argument('--image', metavar='FORMAT', type=str, choices=['png', 'jpg', 'svg'], help="The image format for export.")
+
+    # Optional argument to stop after the first K passing graphs
+    parser.add_argument('--limit', metavar='K', type=parse_positive_int, help="Stop as soon as K graphs have passed the filter.")
+
+    # Optional arguments for writing to a file and running a checkpointed shard of a job
+    parser.add_argument('--output', metavar='FILE', type=str, help="Write the passing graphs to this file instead of stdout.")
+    parser.add_argument('--compress', choices=COMPRESSIONS, help="Compress the output (default: from the --output extension, .gz or .zst).")
+    parser.add_argument('--bitmap', metavar='FILE', type=str, help="Also record the indices of the passing graphs as a pass map (see passmap.py).")
+    parser.add_argument('--checkpoint', metavar='MANIFEST', type=str, help="Run a shard of a job, recording progress in this manifest.")
+    parser.add_argument('--shard', metavar='I', type=int, help="The shard of the job to run (with --checkpoint).")
+    parser.add_argument('--summary', metavar='FILE', type=str, help="Write the counts of the run to this JSON file instead of saving a history entry.")
+    parser.add_argument('--run-dir', metavar='FOLDER', type=str, help="The output folder of the run this worker belongs to, recorded in its history entry.")
+
+    # Optional arguments for performance measurements
+    parser.add_argument('--stats', action='store_true', help="Measure per-stage timings, throughput and memory, and add them to the history.")
+    parser.add_argument('--profile', metavar='FILE', type=str, help="Write a cProfile dump of the run to this file.")
     
     return parser.parse_args()
 
@@ -188,42 +435,90 @@ def main():
         print("Error: You must specify an image format using --image (e.g., png, jpg, svg).")
         sys.exit(1)
 
+    # Check that a checkpointed shard knows which shard it is and where its output goes
+    # (a checkpoint truncates the output to a byte offset, which a compressed stream does not allow)
+    if args.checkpoint and (args.shard is None or not args.output or args.limit or args.compress or args.bitmap):
+        print("Error: --checkpoint requires --shard and --output, and cannot be combined with --limit, --compress or --bitmap.")
+        sys.exit(1)
+
     # Parse the filter string provided by the user
     filter_str = args.filter_string
     rules = parse_rules(filter_str)
 
-    # Initialize counters and list for keeping track of processed graphs
-    input_count = 0
-    output_count = 0
-    passed_graphs = []
+    # Stop cleanly when a runner script terminates this worker
+    signal.signal(signal.SIGTERM, handle_termination)
 
-    # Process each graph from the standard input (stdin)
-    for line in sys.stdin:
-        line = line.strip() # Remove leading/trailing whitespace
-        if not line: # Skip empty lines
-            continue
-
-        input_count += 1 # Increment input graph count
+    # Set up the optional measurements
+    timer = StageTimer() if args.stats else NULL_TIMER
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
 
-        # Convert graph6 format string to a NetworkX graph object
-        G = nx.from_graph6_bytes(line.encode())
-        
-        # Check if the graph satisfies all the filtering rules
-        if satisfies_all_rules(G, rules):
-            print(line) # Print the graph if it passes the filter
-            output_count += 1 # Increment output graph count
-            passed_graphs.append(line) # Add the graph to the list of passed graphs
-            
-            # If image export is requested, export the graph image
-            if args.export:
-                export_graph_image(line, args.image, args.export)
+    try:
+        # Shards of a job keep their progress in the job manifest; the job saves the history
+        if args.checkpoint:
+            input_count, output_count = run_checkpointed_shard(args, rules, timer)
+        else:
+            passed_indices = RoaringBitmap() if args.bitmap else None
+            try:
+                output = open_output(args.output, args.compress)
+            except (OSError, ValueError) as e:
+                print(f"Error: {e}")
+                sys.exit(1)
+
+            # Process each graph from the standard input (stdin), read as bytes in large blocks
+            try:
+                input_count, output_count, passed_graphs, truncated = filter_stream(
+                    read_lines(sys.stdin.buffer), rules, output,
+                    limit=args.limit,
+                    export_folder=args.export,
+                    image_format=args.image,
+                    timer=timer,
+                    passed_indices=passed_indices
+                )
+            finally:
+                output.close()
+
+            # Store the passing graphs as a single-shard pass map, packed with the other shards by the runner
+            if args.bitmap:
+                PassMap(None, filter_str, [passed_indices], [input_count]).save(args.bitmap)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+
+    # Report the measurements on stderr, so they do not mix with the filtered graphs
+    stats = timer.report(input_count, output_count) if args.stats else None
+    if stats:
+        print(format_report(stats), file=sys.stderr)
+
+    if args.checkpoint:
+        return
+
+    # Save history after processing, recording whether the result was truncated
+    metadata = {}
+    if truncated:
+        metadata.update(truncated=True, limit=args.limit)
+    if stats:
+        metadata["stats"] = stats
+    if args.run_dir:
+        metadata["output_dir"] = args.run_dir
+
+    # A runner that combines several workers saves one history entry for all of them
+    if args.summary:
+        summary = {"input_count": input_count, "output_count": output_count, "truncated": truncated}
+        if stats:
+            summary["stats"] = stats
+        with open(args.summary, "w") as f:
+            json.dump(summary, f)
+        return
 
-    # Save history after processing
     entry = HistoryEntry(
         input_number=input_count,
         output_number=output_count,
         filter_str=filter_str,
-        passed_graph_list=passed_graphs
+        passed_graph_list=passed_graphs,
+        metadata=metadata or None
     )
     save_history([entry])
 
@@ -0,0 +1,96 @@
+import os
+import sys
+import gzip
+
+try:
+    import zstandard
+except ImportError:  # zstd output is optional
+    zstandard = None
+
+
+"""
+graph_io.py
+
+Bytes-based reading and writing of graph6 streams.
+
+geng writes hundreds of thousands of graphs per second, so the filter avoids per-line text
+handling: input is read from the binary stream in large blocks and split into lines without
+decoding, and passing graphs are written back in batches of bytes lines. Outputs can be
+compressed on the fly with gzip, or with zstd if the `zstandard` package is installed.
+"""
+
+# Size of the blocks read from the input stream
+READ_BLOCK_SIZE = 1 << 20
+
+# Supported output compressions and the file extensions that select them
+COMPRESSIONS = ("gzip", "zstd")
+COMPRESSION_EXTENSIONS = {".gz": "gzip", ".zst": "zstd"}
+
+def read_lines(stream, block_size=READ_BLOCK_SIZE):
+    """
+    Yields the lines of a binary stream as bytes, without their line endings.
+
+    The stream is read in blocks of up to `block_size` bytes. Only the data that is already
+    available is read (like `read1()`), so a slow producer such as geng is not waited for
+    until a whole block is full.
+
+    Args:
+        stream (file): A binary file object (e.g. `sys.stdin.buffer` or a pipe).
+        block_size (int): The maximum number of bytes read at once.
+
+    Example:
+        >>> list(read_lines(io.BytesIO(b"Bg\\nBw\\nBW")))
+        [b'Bg', b'Bw', b'BW']
+    """
+    read = getattr(stream, "read1", stream.read)
+    remainder = b""
+    while True:
+        block = read(block_size)
+        if not block:
+            break
+        lines = (remainder + block).split(b"\n")
+        remainder = lines.pop()  # the last line may continue in the next block
+        yield from lines
+    if remainder:
+        yield remainder
+
+def compression_for_path(path):
+    """
+    Returns the compression selected by the extension of `path` (".gz" or ".zst"), or `None`.
+    """
+    return COMPRESSION_EXTENSIONS.get(os.path.splitext(path)[1]) if path else None
+
+def open_output(path=None, compression=None):
+    """
+    Opens a binary output for the passing graphs, optionally compressed.
+
+    Args:
+        path (str, optional): The output file; standard output if not given.
+        compression (str, optional): "gzip" or "zstd". Defaults to the one selected by the
+                                     file extension, or no compression.
+
+    Returns:
+        file: A writable binary file object. Closing it finishes the compressed stream but
+              leaves standard output open.
+
+    Raises:
+        ValueError: If zstd is requested but the `zstandard` package is not installed.
+    """
+    compression = compression or compression_for_path(path)
+    if compression == "zstd" and zstandard is None:
+        raise ValueError("zstd output requires the 'zstandard' package (pip install zstandard)")
+
+    if path:
+        if compression == "gzip":
+            # Level 6 compresses almost as well as 9 at a fraction of the CPU time
+            return gzip.open(path, "wb", compresslevel=6)
+        if compression == "zstd":
+            return zstandard.ZstdCompressor().stream_writer(open(path, "wb"))
+        return open(path, "wb")
+
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=sys.stdout.buffer, mode="wb", compresslevel=6)
+    if compression == "zstd":
+        return zstandard.ZstdCompressor().stream_writer(sys.stdout.buffer, closefd=False)
+    # A duplicate of the standard output, which can be closed like any other output
+    return os.fdopen(os.dup(sys.stdout.fileno()), "wb")
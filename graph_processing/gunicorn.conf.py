@@ -0,0 +1,33 @@
+import os
+
+
+"""
+gunicorn.conf.py
+
+Production configuration of the web server, used by the Dockerfile:
+
+    gunicorn --config gunicorn.conf.py web_server:app
+
+Every setting can be overridden with an environment variable (e.g. `docker run -e WEB_THREADS=8`).
+"""
+
+# Address and port to listen on
+bind = os.environ.get("WEB_BIND", "0.0.0.0:5000")
+
+# A single worker process, scaled with threads. The metrics served at /metrics are kept in the
+# memory of the process, so with several processes every scrape would see a different partial
+# count. The threads mostly wait: the CPU-bound filtering runs in the processes started by
+# run_filter_parallel.sh, which already use every CPU, so more processes would only
+# oversubscribe them. Raise WEB_THREADS to serve more concurrent users.
+workers = int(os.environ.get("WEB_WORKERS", 1))
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", 4))
+
+# Filter jobs run inside the request, so allow long requests before a worker is restarted
+timeout = int(os.environ.get("WEB_TIMEOUT", 3600))
+graceful_timeout = 30
+keepalive = 5
+
+# Log requests and errors to the container output
+accesslog = "-"
+errorlog = "-"
@@ -1,3 +1,4 @@
+import json
 import time
 
 class HistoryEntry:
@@ -20,8 +21,11 @@ class HistoryEntry:
         The filtering rule (in JSON format) applied during the graph processing.
     passed_graph_list : list
         A list of identifiers (graph6 strings) for the 20 most recent graphs that passed the filter.
+    metadata : dict
+        Optional extra information about the run (e.g. whether the result was truncated).
+        Only written to the history line when it is not empty.
     """
-    def __init__(self, input_number, output_number, filter_str, passed_graph_list):
+    def __init__(self, input_number, output_number, filter_str, passed_graph_list, metadata=None):
         """
         Initializes a HistoryEntry instance with the given parameters.
 
@@ -35,6 +39,8 @@ class HistoryEntry:
             The filter applied during processing.
         passed_graph_list : list
             A list of identifiers for the 20 most recent passed graphs.
+        metadata : dict, optional
+            Extra information about the run, stored as JSON in an optional sixth column.
         """
         # Timestamp when the entry is created (format: YYYY-MM-DD HH:MM:SS)
         self.timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
@@ -42,15 +48,24 @@ class HistoryEntry:
         self.output_number = output_number  # The number of output graphs
         self.filter_str = filter_str  # The filter used during processing
         self.passed_graph_list = passed_graph_list  # List of passed graphs (only the 20 most recent)
+        self.metadata = metadata or {}  # Extra information about the run (e.g. truncation)
+
+    @property
+    def truncated(self):
+        """
+        Whether the run stopped early (e.g. because of --limit) before reading all input graphs.
+        """
+        return bool(self.metadata.get("truncated", False))
 
     def to_line(self):
         """
         Converts the HistoryEntry instance into a tab-delimited string format.
 
         This method generates a line formatted as:
-        <timestamp>	<inputNumber>	<outputNumber>	<filter>	<passedGraphList>
+        <timestamp>	<inputNumber>	<outputNumber>	<filter>	<passedGraphList>[	<metadata>]
         
-        The list of passed graphs is represented as a comma-separated string.
+        The list of passed graphs is represented as a comma-separated string. The metadata
+        column is only present when the entry has metadata and is written as a JSON object.
 
         Returns:
         -------
@@ -64,4 +79,9 @@ class HistoryEntry:
         """
         # Join the passed graph list into a comma-separated string
         passed_graph_str = ",".join(self.passed_graph_list)
-        return f"{self.timestamp}\t{self.input_number}\t{self.output_number}\t{self.filter_str}\t{passed_graph_str}"
+        line = f"{self.timestamp}\t{self.input_number}\t{self.output_number}\t{self.filter_str}\t{passed_graph_str}"
+
+        # Append the metadata as an extra JSON column only when there is something to record
+        if self.metadata:
+            line += "\t" + json.dumps(self.metadata, sort_keys=True)
+        return line
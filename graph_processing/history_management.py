@@ -1,4 +1,5 @@
 import os
+import json
 from history import HistoryEntry
 
 HISTORY_FILE = "history.txt"
@@ -10,8 +11,8 @@ def load_history():
     This function attempts to read the `history.txt` file, parsing each line into a
     `HistoryEntry` object. Each line in the file should represent a history entry with
     the following components: timestamp, input_number, output_number, filter_str, and 
-    passed_graph_list (a comma-separated list of graph identifiers). If the file does not 
-    exist, an empty list is returned.
+    passed_graph_list (a comma-separated list of graph identifiers), optionally followed by
+    a JSON metadata column. If the file does not exist, an empty list is returned.
 
     Returns:
         list: A list of `HistoryEntry` objects representing the history of processed graphs.
@@ -26,18 +27,27 @@ def load_history():
             # Read each line from the history file
             for line in file:
                 # Split the line into components based on tab characters
-                parts = line.strip().split('\t')
+                parts = line.rstrip('\n').split('\t')
                 
-                # Ensure that the line contains exactly 5 components (timestamp, input_number, output_number, filter_str, passed_graph_list)
-                if len(parts) == 5:
+                # Ensure that the line contains 5 components (timestamp, input_number, output_number, filter_str, passed_graph_list)
+                # or 6 components when a metadata column is present
+                if len(parts) in (5, 6):
                     # Extract the components
-                    timestamp, input_number, output_number, filter_str, passed_graph_str = parts
+                    timestamp, input_number, output_number, filter_str, passed_graph_str = parts[:5]
                     
                     # Split the passed graphs string by commas to convert it into a list
-                    passed_graph_list = passed_graph_str.split(",")
+                    passed_graph_list = passed_graph_str.split(",") if passed_graph_str else []
+
+                    # Parse the optional metadata column; skip the line if it is not valid JSON
+                    metadata = None
+                    if len(parts) == 6:
+                        try:
+                            metadata = json.loads(parts[5])
+                        except json.JSONDecodeError:
+                            continue
                     
                     # Create a new HistoryEntry object and append it to the history list
-                    history.append(HistoryEntry(int(input_number), int(output_number), filter_str, passed_graph_list))
+                    history.append(HistoryEntry(int(input_number), int(output_number), filter_str, passed_graph_list, metadata))
     
     # Return the list of history entries
     return history
@@ -0,0 +1,492 @@
+import sys
+import json
+import struct
+import bisect
+import argparse
+import subprocess
+from array import array
+
+from graph_io import open_output
+from shards import generate_shard
+
+
+"""
+passmap.py
+
+Compact "pass map" result format: instead of a graph6 line per passing graph, a result records
+which graphs passed as a compressed bitmap over geng's deterministic enumeration order.
+
+geng enumerates every `res/mod` shard of an order in the same order on every run, so the i-th
+graph of a shard is always the same graph. A pass map stores, for every shard, the set of indices
+of the passing graphs in a roaring-style bitmap (`RoaringBitmap`): indices are grouped in
+chunks of 65536 and every chunk is stored either as a sorted array of 16-bit offsets (sparse
+chunks) or as a 8 KiB bitset (dense chunks). A permissive filter on a large order therefore
+takes at most 1 bit per generated graph instead of a whole text line per passing graph.
+
+Pass maps of the same order and sharding can be combined with set operations without filtering
+again (e.g. the graphs passing filter A or B, or A and B), and the graph6 strings are only
+produced on demand, by running geng for the shards and keeping the graphs at the stored indices.
+
+File format (little-endian):
+    b"PASSMAP 2\\n"
+    a JSON header line: {"order", "mod", "split_increase", "filter",
+                         "shards": [{"input_count", "output_count", "size"}, ...]}
+    the serialized bitmap of every shard (`size` bytes each), in shard order
+
+Usage:
+    python passmap.py pack <output> <shard_file>... --order N --filter '<filter_string>'
+    python passmap.py union <output> <passmap> <passmap>...
+    python passmap.py intersect <output> <passmap> <passmap>...
+    python passmap.py materialize <passmap> [--output FILE]
+    python passmap.py info <passmap>
+
+Example:
+    ./run_filter_parallel.sh 10 '[{"degree_sum": 6, "type": "min", "count": 1}]' --format bitmap
+    python passmap.py materialize graph_batches/final_filtered_graphs.passmap --output graphs.txt.gz
+"""
+
+MAGIC = b"PASSMAP 2\n"
+
+# Version 1 stored container keys as uint16, which limited a shard to 2**32 graphs; still readable
+LEGACY_MAGIC = b"PASSMAP 1\n"
+
+# Header of every container in a serialized bitmap: key, type and number of values
+CONTAINER_HEADER = struct.Struct("<QBI")
+LEGACY_CONTAINER_HEADER = struct.Struct("<HBI")
+
+# Chunks with more values than this are stored as bitsets (an array of 4096 offsets takes 8 KiB too)
+ARRAY_MAX_SIZE = 4096
+BITSET_BYTES = 1 << 13
+
+# Container types in the serialized bitmap
+ARRAY_CONTAINER = 0
+BITSET_CONTAINER = 1
+
+def little_endian(values):
+    """
+    Returns the bytes of an `array('H')` in little-endian order.
+    """
+    if sys.byteorder == "big":
+        values = array("H", values)
+        values.byteswap()
+    return values.tobytes()
+
+class RoaringBitmap:
+    """
+    A compressed set of non-negative integers below 2**64, in the style of roaring bitmaps.
+
+    Every value is split into its high bits, which select a container, and its low 16 bits,
+    which are stored in that container: a sorted `array('H')` while the container holds at most
+    `ARRAY_MAX_SIZE` values, a 8 KiB `bytearray` bitset above that. Values are expected to be
+    added mostly in increasing order (like the indices of the passing graphs of a shard), which
+    appends to the arrays.
+
+    Example:
+        >>> bitmap = RoaringBitmap([3, 1, 70000])
+        >>> list(bitmap | RoaringBitmap([2])), len(bitmap), 70000 in bitmap
+        ([1, 2, 3, 70000], 3, True)
+    """
+    def __init__(self, values=()):
+        self.containers = {}
+        for value in values:
+            self.add(value)
+
+    def add(self, value):
+        """
+        Adds a value to the bitmap.
+        """
+        key, low = value >> 16, value & 0xFFFF
+        container = self.containers.get(key)
+        if container is None:
+            self.containers[key] = array("H", [low])
+        elif isinstance(container, bytearray):
+            container[low >> 3] |= 1 << (low & 7)
+        elif container[-1] < low:
+            container.append(low)
+            if len(container) > ARRAY_MAX_SIZE:
+                self.containers[key] = to_bitset(container)
+        else:
+            position = bisect.bisect_left(container, low)
+            if container[position] != low:
+                container.insert(position, low)
+                if len(container) > ARRAY_MAX_SIZE:
+                    self.containers[key] = to_bitset(container)
+
+    def __contains__(self, value):
+        container = self.containers.get(value >> 16)
+        if container is None:
+            return False
+        low = value & 0xFFFF
+        if isinstance(container, bytearray):
+            return bool(container[low >> 3] & (1 << (low & 7)))
+        position = bisect.bisect_left(container, low)
+        return position < len(container) and container[position] == low
+
+    def __len__(self):
+        return sum(container_size(container) for container in self.containers.values())
+
+    def __iter__(self):
+        """
+        Iterates over the values in increasing order.
+        """
+        for key in sorted(self.containers):
+            high = key << 16
+            for low in container_values(self.containers[key]):
+                yield high | low
+
+    def __eq__(self, other):
+        return isinstance(other, RoaringBitmap) and list(self) == list(other)
+
+    def __or__(self, other):
+        result = RoaringBitmap()
+        for key in self.containers.keys() | other.containers.keys():
+            a, b = self.containers.get(key), other.containers.get(key)
+            if a is None or b is None:
+                result.containers[key] = copy_container(a if b is None else b)
+            elif isinstance(a, array) and isinstance(b, array):
+                result.containers[key] = optimize(array("H", sorted(set(a) | set(b))))
+            else:
+                result.containers[key] = bitset_or(to_bitset(a), to_bitset(b))
+        return result
+
+    def __and__(self, other):
+        result = RoaringBitmap()
+        for key in self.containers.keys() & other.containers.keys():
+            a, b = self.containers[key], other.containers[key]
+            if isinstance(a, bytearray) and isinstance(b, bytearray):
+                container = optimize(bitset_and(a, b))
+            else:
+                # Check the values of the array container against the other container
+                values, other_container = (a, b) if isinstance(a, array) else (b, a)
+                container = array("H", [low for low in values if container_contains(other_container, low)])
+            if container_size(container):
+                result.containers[key] = container
+        return result
+
+    def to_bytes(self):
+        """
+        Serializes the bitmap.
+
+        Layout: the number of containers (uint32), then for every container in key order its key
+        (uint64), type (uint8) and number of values (uint32), followed by the values as uint16
+        (array containers) or the 8 KiB bitset (bitset containers).
+        """
+        parts = [struct.pack("<I", len(self.containers))]
+        for key in sorted(self.containers):
+            container = self.containers[key]
+            if isinstance(container, bytearray):
+                parts.append(CONTAINER_HEADER.pack(key, BITSET_CONTAINER, container_size(container)))
+                parts.append(bytes(container))
+            else:
+                parts.append(CONTAINER_HEADER.pack(key, ARRAY_CONTAINER, len(container)))
+                parts.append(little_endian(container))
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data, container_header=CONTAINER_HEADER):
+        """
+        Deserializes a bitmap written by `to_bytes()` (or, with `LEGACY_CONTAINER_HEADER`,
+        by version 1 of the file format).
+
+        Raises:
+            ValueError: If the data is not a valid serialized bitmap.
+        """
+        bitmap = cls()
+        try:
+            (count,), position = struct.unpack_from("<I", data), 4
+            for _ in range(count):
+                key, kind, size = container_header.unpack_from(data, position)
+                position += container_header.size
+                if kind == BITSET_CONTAINER:
+                    container = bytearray(data[position:position + BITSET_BYTES])
+                    position += BITSET_BYTES
+                else:
+                    container = array("H")
+                    container.frombytes(data[position:position + 2 * size])
+                    if sys.byteorder == "big":
+                        container.byteswap()
+                    position += 2 * size
+                if container_size(container) != size:
+                    raise ValueError("truncated bitmap")
+                bitmap.containers[key] = container
+        except struct.error as e:
+            raise ValueError(f"invalid bitmap: {e}")
+        return bitmap
+
+def to_bitset(container):
+    """
+    Returns a container as a bitset (a copy if it already is one).
+    """
+    if isinstance(container, bytearray):
+        return bytearray(container)
+    bitset = bytearray(BITSET_BYTES)
+    for low in container:
+        bitset[low >> 3] |= 1 << (low & 7)
+    return bitset
+
+def bitset_or(a, b):
+    return bytearray((int.from_bytes(a, "little") | int.from_bytes(b, "little")).to_bytes(BITSET_BYTES, "little"))
+
+def bitset_and(a, b):
+    return bytearray((int.from_bytes(a, "little") & int.from_bytes(b, "little")).to_bytes(BITSET_BYTES, "little"))
+
+def optimize(container):
+    """
+    Converts a container to the cheaper representation for its number of values.
+    """
+    if isinstance(container, bytearray) and container_size(container) <= ARRAY_MAX_SIZE:
+        return array("H", container_values(container))
+    if isinstance(container, array) and len(container) > ARRAY_MAX_SIZE:
+        return to_bitset(container)
+    return container
+
+def copy_container(container):
+    return bytearray(container) if isinstance(container, bytearray) else array("H", container)
+
+def container_size(container):
+    if isinstance(container, bytearray):
+        return int.from_bytes(container, "little").bit_count()
+    return len(container)
+
+def container_contains(container, low):
+    if isinstance(container, bytearray):
+        return bool(container[low >> 3] & (1 << (low & 7)))
+    position = bisect.bisect_left(container, low)
+    return position < len(container) and container[position] == low
+
+def container_values(container):
+    """
+    Yields the values of a container in increasing order.
+    """
+    if not isinstance(container, bytearray):
+        yield from container
+        return
+    for index, byte in enumerate(container):
+        if byte:
+            for bit in range(8):
+                if byte & (1 << bit):
+                    yield (index << 3) | bit
+
+class PassMap:
+    """
+    The result of a filter run as one bitmap of passing graph indices per geng `res/mod` shard.
+
+    Attributes:
+        order (int): The number of vertices of the graphs (`None` for a single unpacked shard).
+        filter (str): The filter string, or an expression combining the filters of several results.
+        bitmaps (list): The `RoaringBitmap` of every shard; `len(bitmaps)` is the `mod` of the sharding.
+        input_counts (list): The number of graphs generated for every shard.
+        split_increase (int): The value of geng's `-X` option used for the shards.
+    """
+    def __init__(self, order, filter_str, bitmaps, input_counts, split_increase=0):
+        self.order = order
+        self.filter = filter_str
+        self.bitmaps = bitmaps
+        self.input_counts = input_counts
+        self.split_increase = split_increase
+
+    @property
+    def mod(self):
+        return len(self.bitmaps)
+
+    @property
+    def input_count(self):
+        return sum(self.input_counts)
+
+    @property
+    def output_count(self):
+        return sum(len(bitmap) for bitmap in self.bitmaps)
+
+    def save(self, path):
+        """
+        Writes the pass map to a file.
+        """
+        data = [bitmap.to_bytes() for bitmap in self.bitmaps]
+        header = {
+            "order": self.order,
+            "mod": self.mod,
+            "split_increase": self.split_increase,
+            "filter": self.filter,
+            "shards": [
+                {"input_count": input_count, "output_count": len(bitmap), "size": len(blob)}
+                for input_count, bitmap, blob in zip(self.input_counts, self.bitmaps, data)
+            ]
+        }
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            f.write(json.dumps(header).encode() + b"\n")
+            for blob in data:
+                f.write(blob)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a pass map from a file.
+
+        Raises:
+            ValueError: If the file is not a pass map.
+        """
+        with open(path, "rb") as f:
+            magic = f.readline()
+            if magic not in (MAGIC, LEGACY_MAGIC):
+                raise ValueError(f"{path} is not a pass map")
+            container_header = CONTAINER_HEADER if magic == MAGIC else LEGACY_CONTAINER_HEADER
+            header = json.loads(f.readline())
+            bitmaps = [RoaringBitmap.from_bytes(f.read(shard["size"]), container_header) for shard in header["shards"]]
+        input_counts = [shard["input_count"] for shard in header["shards"]]
+        return cls(header["order"], header["filter"], bitmaps, input_counts, header["split_increase"])
+
+def pack(shard_maps, order, filter_str):
+    """
+    Combines the single-shard pass maps written by the workers of a run into one pass map.
+
+    Args:
+        shard_maps (list): The `PassMap` of every shard, in shard order (`res` = 0, 1, ...).
+        order (int): The number of vertices of the graphs.
+        filter_str (str): The filter string of the run.
+
+    Returns:
+        PassMap: The pass map of the whole run, with `mod` equal to the number of shards.
+    """
+    bitmaps = [bitmap for shard_map in shard_maps for bitmap in shard_map.bitmaps]
+    input_counts = [count for shard_map in shard_maps for count in shard_map.input_counts]
+    return PassMap(order, filter_str, bitmaps, input_counts)
+
+def combine(pass_maps, operation):
+    """
+    Combines pass maps of the same order and sharding shard by shard.
+
+    Args:
+        pass_maps (list): The pass maps to combine.
+        operation (str): "union" (graphs passing any of the filters) or "intersect" (all of them).
+
+    Returns:
+        PassMap: The combined pass map.
+
+    Raises:
+        ValueError: If the pass maps do not cover the same enumeration of graphs.
+    """
+    first = pass_maps[0]
+    for other in pass_maps[1:]:
+        if (other.order, other.split_increase, other.input_counts) != (first.order, first.split_increase, first.input_counts):
+            raise ValueError("Pass maps can only be combined for the same order and sharding")
+
+    bitmaps = []
+    for shard in range(first.mod):
+        bitmap = first.bitmaps[shard]
+        for other in pass_maps[1:]:
+            bitmap = bitmap | other.bitmaps[shard] if operation == "union" else bitmap & other.bitmaps[shard]
+        bitmaps.append(bitmap)
+
+    filter_str = f"{operation}(" + ", ".join(pass_map.filter for pass_map in pass_maps) + ")"
+    return PassMap(first.order, filter_str, bitmaps, list(first.input_counts), first.split_increase)
+
+def materialize(pass_map, output, generate=generate_shard):
+    """
+    Writes the graph6 strings of the graphs in a pass map, by generating their shards again.
+
+    For every shard, geng is run and the graphs at the stored indices are kept; geng is stopped
+    as soon as the last passing graph of the shard was found.
+
+    Args:
+        pass_map (PassMap): The pass map.
+        output (file): A writable binary file object receiving the graph6 lines.
+        generate (callable): Context manager yielding the graph6 lines of a shard, called as
+                             `generate(order, res, mod, split_increase)` (geng by default).
+
+    Returns:
+        int: The number of graphs written.
+    """
+    written = 0
+    for res, bitmap in enumerate(pass_map.bitmaps):
+        wanted = iter(bitmap)
+        next_index = next(wanted, None)
+        if next_index is None:
+            continue
+
+        with generate(pass_map.order, res, pass_map.mod, pass_map.split_increase) as lines:
+            index = 0
+            for line in lines:
+                line = line.strip()
+                if not line:
+                    continue
+                if index == next_index:
+                    output.write(line + b"\n")
+                    written += 1
+                    next_index = next(wanted, None)
+                    if next_index is None:
+                        break
+                index += 1
+
+        if next_index is not None:
+            raise ValueError(f"Shard {res} has fewer graphs than its pass map expects")
+    return written
+
+def format_info(pass_map, path):
+    """
+    Describes a pass map in a few human-readable lines.
+    """
+    lines = [
+        f"order {pass_map.order}, {pass_map.mod} shards, filter {pass_map.filter}",
+        f"{pass_map.output_count} of {pass_map.input_count} graphs passed",
+    ]
+    with open(path, "rb") as f:
+        f.seek(0, 2)
+        lines.append(f"{f.tell()} bytes")
+    return "\n".join(lines)
+
+def parse_args():
+    """
+    Parses command line arguments for the pass map tools.
+
+    Returns:
+        argparse.Namespace: Parsed command line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Create, combine and materialize pass map results.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    pack_parser = commands.add_parser('pack', help="Combine the shard pass maps of a run into one pass map.")
+    pack_parser.add_argument('output', type=str, help="The pass map file to write.")
+    pack_parser.add_argument('shard_files', nargs='+', help="The shard pass maps, in shard order.")
+    pack_parser.add_argument('--order', type=int, required=True, help="The number of vertices of the graphs.")
+    pack_parser.add_argument('--filter', type=str, required=True, help="The filter string of the run.")
+
+    for operation in ('union', 'intersect'):
+        combine_parser = commands.add_parser(operation, help=f"Write the {operation} of several pass maps.")
+        combine_parser.add_argument('output', type=str, help="The pass map file to write.")
+        combine_parser.add_argument('inputs', nargs='+', help="The pass maps to combine.")
+
+    materialize_parser = commands.add_parser('materialize', help="Write the graph6 strings of a pass map.")
+    materialize_parser.add_argument('passmap', type=str, help="The pass map file.")
+    materialize_parser.add_argument('--output', metavar='FILE', type=str, help="Write to this file instead of stdout (.gz/.zst are compressed).")
+
+    info_parser = commands.add_parser('info', help="Describe a pass map.")
+    info_parser.add_argument('passmap', type=str, help="The pass map file.")
+
+    return parser.parse_args()
+
+def main():
+    """
+    Main entry point of the script. Runs one of the pass map tools.
+    """
+    args = parse_args()
+
+    try:
+        if args.command == 'pack':
+            pass_map = pack([PassMap.load(path) for path in args.shard_files], args.order, args.filter)
+            pass_map.save(args.output)
+        elif args.command in ('union', 'intersect'):
+            pass_map = combine([PassMap.load(path) for path in args.inputs], args.command)
+            pass_map.save(args.output)
+            print(f"{pass_map.output_count} graphs in the {args.command}.", file=sys.stderr)
+        elif args.command == 'materialize':
+            with open_output(args.output) as output:
+                materialize(PassMap.load(args.passmap), output)
+        elif args.command == 'info':
+            print(format_info(PassMap.load(args.passmap), args.passmap))
+    except (OSError, ValueError, subprocess.CalledProcessError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import os
+import sys
+import struct
+import argparse
+import tempfile
+from array import array
+
+
+"""
+results_index.py
+
+Line-offset index for result files (one graph6 string per line), so that any page of a result
+with millions of graphs can be read with a seek instead of a scan.
+
+The index of `<results>` is stored next to it as `<results>.idx`. It records the byte offset of
+every `INDEX_STRIDE`-th line, so reading a page seeks to the closest indexed line before it and
+skips at most `INDEX_STRIDE - 1` lines. The index also records the size of the results file it
+was built for; a result that changed since is indexed again when it is opened.
+
+Index format (little-endian):
+    header : magic b"G6INDEX1", stride (uint32), results size (uint64), line count (uint64)
+    offsets: uint64 byte offset of lines 0, stride, 2 * stride, ...
+
+Usage:
+    python results_index.py <results_file>
+"""
+
+MAGIC = b"G6INDEX1"
+HEADER = struct.Struct("<8sIQQ")
+
+# Number of lines between two indexed offsets (8 bytes of index per 256 lines)
+INDEX_STRIDE = 256
+
+def index_path(results_path):
+    """
+    Returns the path of the index of a results file.
+    """
+    return f"{results_path}.idx"
+
+def build_index(results_path, stride=INDEX_STRIDE):
+    """
+    Scans a results file once and writes its line-offset index.
+
+    Args:
+        results_path (str): The results file, one graph6 string per line.
+        stride (int): The number of lines between two indexed offsets.
+
+    Returns:
+        int: The number of lines in the results file.
+    """
+    offsets = array("Q")
+    position = 0
+    line_count = 0
+    with open(results_path, "rb") as f:
+        for line in f:
+            if line_count % stride == 0:
+                offsets.append(position)
+            position += len(line)
+            line_count += 1
+
+    if sys.byteorder == "big":
+        offsets.byteswap()
+
+    # Write to a temporary file of our own first, so readers never see a partial index and
+    # concurrent builds of the same index (e.g. two requests for a new job) do not mix
+    directory, name = os.path.split(index_path(results_path))
+    with tempfile.NamedTemporaryFile(dir=directory or ".", prefix=f"{name}.", suffix=".tmp", delete=False) as f:
+        try:
+            f.write(HEADER.pack(MAGIC, stride, position, line_count))
+            f.write(offsets.tobytes())
+        except BaseException:
+            os.remove(f.name)
+            raise
+    os.replace(f.name, index_path(results_path))
+    return line_count
+
+class IndexedResults:
+    """
+    Random access to the lines of an indexed results file.
+
+    Attributes:
+        path (str): The results file.
+        count (int): The number of graphs (lines) in the results file.
+
+    Example:
+        >>> results = IndexedResults("graph_batches/final_filtered_graphs.txt")
+        >>> len(results.page(1000000, 50))  # the 50 graphs after the first million
+        50
+    """
+    def __init__(self, path):
+        self.path = path
+        if not self.load_index():
+            build_index(path)
+            if not self.load_index():
+                raise ValueError(f"Could not index {path}")
+
+    def load_index(self):
+        """
+        Loads the index of the results file. Returns `False` if it is missing or out of date.
+        """
+        try:
+            with open(index_path(self.path), "rb") as f:
+                magic, self.stride, size, self.count = HEADER.unpack(f.read(HEADER.size))
+                if magic != MAGIC or size != os.path.getsize(self.path):
+                    return False
+                self.offsets = array("Q")
+                self.offsets.frombytes(f.read())
+        except (OSError, struct.error, ValueError):
+            return False
+
+        if sys.byteorder == "big":
+            self.offsets.byteswap()
+        return len(self.offsets) == -(-self.count // self.stride)
+
+    def page(self, offset, limit):
+        """
+        Returns up to `limit` graph6 strings starting at line `offset` (counting from 0).
+        """
+        if offset >= self.count or limit <= 0:
+            return []
+
+        graphs = []
+        with open(self.path, "rb") as f:
+            # Seek to the closest indexed line, then skip to the requested one
+            f.seek(self.offsets[offset // self.stride])
+            for _ in range(offset % self.stride):
+                f.readline()
+            for _ in range(min(limit, self.count - offset)):
+                graphs.append(f.readline().decode().strip())
+        return graphs
+
+def parse_args():
+    """
+    Parses command line arguments for indexing a results file.
+
+    Returns:
+        argparse.Namespace: Parsed command line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Build the line-offset index of a results file.')
+    parser.add_argument('results_file', type=str, help="The results file, one graph6 string per line.")
+    return parser.parse_args()
+
+def main():
+    """
+    Main entry point of the script. Indexes the given results file.
+    """
+    args = parse_args()
+    try:
+        count = build_index(args.results_file)
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Indexed {count} graphs in {index_path(args.results_file)}.")
+
+if __name__ == "__main__":
+    main()
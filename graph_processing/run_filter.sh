@@ -5,7 +5,7 @@
 # and optionally export them as images.
 #
 # Usage:
-#   ./run_filter.sh <order> <filter_string> [--export <folder>] [--image <format>]
+#   ./run_filter.sh <order> <filter_string> [--export <folder>] [--image <format>] [--limit <K>] [--stats] [--profile <file>] [--output <file>]
 #
 # Required:
 #   <order>           : Number of vertices in the graphs to generate (passed to 'geng')
@@ -14,16 +14,21 @@
 # Optional:
 #   --export <folder> : Folder where images of filtered graphs will be saved
 #   --image <format>  : Image format for exported graphs (e.g., png, svg)
+#   --limit <K>       : Stop as soon as K graphs have passed the filter
+#   --stats           : Measure per-stage timings, throughput and memory (printed to stderr and added to the history)
+#   --profile <file>  : Write a cProfile dump of the filter to the given file
+#   --output <file>   : Write the filtered graphs to a file instead of stdout
+#                       (compressed with gzip or zstd if it ends in '.gz' or '.zst')
 #
 # Output:
-#   - Filtered graphs are printed to stdout
-#   - History is appended to 'history.txt'
+#   - Filtered graphs are printed to stdout (or written to the --output file)
+#   - History is appended to 'history.txt' (marked as truncated if --limit cut the run short)
 #   - If export is enabled, images of passed graphs are saved to the specified folder
 # ===============================================================
 
 # Ensure the script is called with at least two arguments
 if [ "$#" -lt 2 ]; then
-  echo "Usage: $0 <order> <filter_string> [--export <folder>] [--image <format>]"
+  echo "Usage: $0 <order> <filter_string> [--export <folder>] [--image <format>] [--limit <K>] [--stats] [--profile <file>] [--output <file>]"
   exit 1
 fi
 
@@ -43,6 +48,11 @@ if [[ "${OPTIONAL_ARGS[*]}" =~ "--export" ]]; then
   echo "Images of filtered graphs will be exported."
 fi
 
+if [[ "${OPTIONAL_ARGS[*]}" =~ "--limit" ]]; then
+  echo "Filtering stops as soon as the limit is reached."
+fi
+
 # Generate graphs using 'geng', then filter them using the Python script 'filter_graph.py'
-# Pass the filter string and any optional arguments (e.g., --export, --image) to the Python script
+# Pass the filter string and any optional arguments (e.g., --export, --image, --limit, --stats) to the Python script
+# When the filter stops early because of --limit, 'geng' is terminated by SIGPIPE
 geng "$ORDER" | python3 filter_graph.py "$FILTER_STRING" "${OPTIONAL_ARGS[@]}"
@@ -5,7 +5,7 @@
 # using a Python script, and optionally export them as images.
 #
 # Usage:
-#   ./run_filter_parallel.sh <order> <filter_string> [--export <folder_path>] [--image <format>]
+#   ./run_filter_parallel.sh <order> <filter_string> [--export <folder_path>] [--image <format>] [--limit <K>] [--job-id <id>] [--stats] [--profile <folder>] [--compress <gzip|zstd>] [--format <text|bitmap>] [--output-dir <folder>] [--sheets]
 #
 # Required:
 #   <order>           : Number of vertices in the graphs to generate (passed to 'geng')
@@ -14,17 +14,36 @@
 # Optional:
 #   --export <folder> : Folder where images of filtered graphs will be saved
 #   --image <format>  : Image format for exported graphs (e.g., png, svg)
+#   --sheets          : Export contact sheets (many graphs tiled per image, or pages of a pdf with
+#                       --image pdf) plus an 'index.json', instead of one image file per graph
+#   --limit <K>       : Stop all workers as soon as K graphs have passed the filter
+#   --job-id <id>     : Run as a resumable job. Progress is checkpointed per shard in
+#                       'graph_batches/<id>/manifest.json'; running the same command again
+#                       after an interruption skips completed shards and resumes the others
+#   --stats           : Measure per-stage timings, throughput and memory of every worker
+#                       (printed to stderr and added to the history)
+#   --profile <folder>: Write a cProfile dump per worker to '<folder>/worker_<shard>.prof'
+#   --compress <type> : Write the batch files and the final output compressed with gzip or zstd
+#                       (adds a '.gz' or '.zst' extension; zstd needs the 'zstandard' package)
+#   --format <format> : 'text' (default) writes the graph6 strings of the passed graphs, 'bitmap'
+#                       writes a compact pass map of their positions in geng's output (see passmap.py)
+#   --output-dir <folder>: Folder for the batch files and the final output (default: 'graph_batches')
 #
 # Output:
 #   - Filtered graph results will be written to batch files in 'graph_batches'
-#   - History is appended to 'history.txt'
-#   - Final combined output is saved in 'graph_batches/final_filtered_graphs.txt'
+#   - History is appended to 'history.txt' (with --limit, a single entry for all workers, marked as truncated if the limit cut the run short;
+#     with --format bitmap, a single entry pointing at the packed pass map)
+#   - Final combined output is saved in 'graph_batches/final_filtered_graphs.txt' (plus '.gz'/'.zst' with --compress)
+#     or, with --format bitmap, in 'graph_batches/final_filtered_graphs.passmap'
+#   - Uncompressed text outputs get a line-offset index ('final_filtered_graphs.txt.idx', see results_index.py)
+#     (or 'graph_batches/<id>/final_filtered_graphs.txt' for a job, with a single history entry)
 #   - If export is enabled, images of passed graphs are saved to the specified folder
+#     (with --sheets, as contact sheets rendered once the filtering is done, see contact_sheet.py)
 # ===============================================================
 
-# Check that we have exactly 2 arguments (order and filter_string)
+# Check that we have at least 2 arguments (order and filter_string)
 if [ "$#" -lt 2 ]; then
-  echo "Usage: $0 <order> <filter_string> [--export <folder_path>] [--image <format>]"
+  echo "Usage: $0 <order> <filter_string> [--export <folder_path>] [--image <format>] [--limit <K>] [--job-id <id>] [--stats] [--profile <folder>] [--compress <gzip|zstd>] [--format <text|bitmap>] [--output-dir <folder>] [--sheets]"
   exit 1
 fi
 
@@ -32,17 +51,93 @@ ORDER=$1
 FILTER_STRING=$2
 EXPORT_FOLDER=""
 IMAGE_FORMAT=""
+LIMIT=""
+JOB_ID=""
+STATS=""
+PROFILE_DIR=""
+COMPRESS=""
+FORMAT="text"
+OUTPUT_ROOT="graph_batches"
+SHEETS=""
+shift 2
 
-# Check if the third argument is --export, then grab the folder path
-if [ "$3" == "--export" ]; then
-  EXPORT_FOLDER=$4
-  shift 2  # Shift to the next argument
+# Parse the optional arguments
+while [ "$#" -gt 0 ]; do
+  case "$1" in
+    --export) EXPORT_FOLDER=$2; shift 2 ;;
+    --image)  IMAGE_FORMAT=$2; shift 2 ;;
+    --limit)  LIMIT=$2; shift 2 ;;
+    --job-id) JOB_ID=$2; shift 2 ;;
+    --stats)  STATS=1; shift ;;
+    --profile) PROFILE_DIR=$2; shift 2 ;;
+    --compress) COMPRESS=$2; shift 2 ;;
+    --format) FORMAT=$2; shift 2 ;;
+    --output-dir) OUTPUT_ROOT=$2; shift 2 ;;
+    --sheets) SHEETS=1; shift ;;
+    *) echo "Unknown option: $1"; exit 1 ;;
+  esac
+done
+
+# Compressed outputs cannot be counted while they are written, nor truncated to a checkpoint
+SUFFIX=""
+case "$COMPRESS" in
+  "") ;;
+  gzip) SUFFIX=".gz" ;;
+  zstd) SUFFIX=".zst" ;;
+  *) echo "Unknown compression: $COMPRESS (use gzip or zstd)."; exit 1 ;;
+esac
+if [ -n "$COMPRESS" ] && [ -n "$LIMIT$JOB_ID" ]; then
+  echo "--compress cannot be combined with --limit or --job-id."
+  exit 1
+fi
+if [ "$FORMAT" != "text" ] && [ "$FORMAT" != "bitmap" ]; then
+  echo "Unknown format: $FORMAT (use text or bitmap)."
+  exit 1
+fi
+if [ "$FORMAT" = "bitmap" ] && [ -n "$LIMIT$JOB_ID$COMPRESS" ]; then
+  echo "--format bitmap cannot be combined with --limit, --job-id or --compress."
+  exit 1
+fi
+if [ -n "$SHEETS" ]; then
+  if [ -z "$EXPORT_FOLDER" ] || [ -z "$IMAGE_FORMAT" ]; then
+    echo "--sheets requires --export and --image."
+    exit 1
+  fi
+  if [ -n "$COMPRESS" ] || [ "$FORMAT" = "bitmap" ]; then
+    echo "--sheets cannot be combined with --compress or --format bitmap."
+    exit 1
+  fi
+fi
+if [ "$COMPRESS" = "zstd" ] && ! python3 -c "import zstandard" 2>/dev/null; then
+  echo "zstd compression requires the 'zstandard' package (pip install zstandard)."
+  exit 1
+fi
+
+if [ -n "$JOB_ID" ]; then
+  if [[ ! "$JOB_ID" =~ ^[A-Za-z0-9_-]+$ ]]; then
+    echo "Invalid job id: only letters, digits, '_' and '-' are allowed."
+    exit 1
+  fi
+  if [ -n "$LIMIT" ]; then
+    echo "--limit cannot be combined with --job-id."
+    exit 1
+  fi
 fi
 
-# Check if the next argument is --image, then grab the image format
-if [ "$3" == "--image" ]; then
-  IMAGE_FORMAT=$4
-  shift 2  # Shift to the next argument
+# Build the optional arguments passed to every filter worker
+FILTER_ARGS=()
+if [ -n "$EXPORT_FOLDER" ] && [ -z "$SHEETS" ]; then
+  FILTER_ARGS+=(--export "$EXPORT_FOLDER" --image "$IMAGE_FORMAT")
+fi
+if [ -n "$LIMIT" ]; then
+  # No single worker ever needs more than K matches
+  FILTER_ARGS+=(--limit "$LIMIT")
+fi
+if [ -n "$STATS" ]; then
+  FILTER_ARGS+=(--stats)
+fi
+if [ -n "$PROFILE_DIR" ]; then
+  mkdir -p "$PROFILE_DIR"
 fi
 
 # Print info about history tracking
@@ -50,37 +145,139 @@ echo "Running filter for graphs of order $ORDER with filter:"
 echo "$FILTER_STRING"
 echo "Filtered graphs will be written to separate files per batch, and history will be saved to history.txt."
 
-# Split the graph generation into multiple batches
+# Split the graph generation into multiple batches using geng's res/mod option,
+# so every worker generates and filters its own share of the graphs
 NUM_BATCHES=4  # Adjust based on how many threads you want to run in parallel
-BATCH_SIZE=$(( $(geng $ORDER | wc -l) / NUM_BATCHES ))  # Calculate the size of each batch
 
 # Create a directory for storing batch files and output within the project directory
 PROJECT_DIR=$(pwd)  # Get the current project directory
-OUTPUT_DIR="$PROJECT_DIR/graph_batches"  # Path to the output directory inside the project folder
+OUTPUT_DIR="$OUTPUT_ROOT"  # Path to the output directory (inside the project folder by default)
+[[ "$OUTPUT_DIR" = /* ]] || OUTPUT_DIR="$PROJECT_DIR/$OUTPUT_DIR"
 mkdir -p "$OUTPUT_DIR"  # Create the directory if it doesn't exist
 
-# Generate batches of graphs and save them to the output directory
-geng $ORDER | split -l $BATCH_SIZE - "$OUTPUT_DIR/graph_batch_"
+# A job keeps its outputs and progress manifest in its own directory, so they survive restarts
+if [ -n "$JOB_ID" ]; then
+  OUTPUT_DIR="$OUTPUT_DIR/$JOB_ID"
+  MANIFEST="$OUTPUT_DIR/manifest.json"
+  mkdir -p "$OUTPUT_DIR"
+
+  # Hold a lock for the whole job; the workers inherit it, so a restart is refused
+  # while workers of an interrupted run are still alive
+  exec 9> "$OUTPUT_DIR/job.lock"
+  if ! flock -n 9; then
+    echo "Job $JOB_ID is already running."
+    exit 1
+  fi
+
+  python3 ./checkpoint.py init "$OUTPUT_DIR" "$ORDER" "$FILTER_STRING" "$NUM_BATCHES" || exit 1
+  SHARDS=$(python3 ./checkpoint.py pending "$OUTPUT_DIR") || exit 1
+  echo "Job $JOB_ID: running shards [${SHARDS}] of $NUM_BATCHES."
+else
+  rm -f "$OUTPUT_DIR"/output_batch_*  # Remove the output of previous runs
+  SHARDS=$(seq 0 $((NUM_BATCHES - 1)))
+fi
+
+# Enable job control so every worker pipeline (geng | filter) gets its own process group
+set -m
 
 # Run the filtering process in parallel
-for batch_file in $OUTPUT_DIR/graph_batch_*; do
-    # Use `basename` to extract the batch number for the output file
-    BATCH_NUMBER=$(basename $batch_file | sed 's/graph_batch_//')
-    
-    # Run each filter in parallel, outputting to separate files in the project directory
-    if [ -n "$EXPORT_FOLDER" ]; then
-        python3 ./filter_graph.py "$FILTER_STRING" --export "$EXPORT_FOLDER" --image "$IMAGE_FORMAT" < "$batch_file" > "$OUTPUT_DIR/output_batch_$BATCH_NUMBER.txt" &
+WORKER_GROUPS=()
+for BATCH_NUMBER in $SHARDS; do
+    OUTPUT_FILE="$OUTPUT_DIR/output_batch_$BATCH_NUMBER.txt$SUFFIX"
+    # The history entries name the run's output folder, so concurrent runs can be told apart
+    WORKER_ARGS=("${FILTER_ARGS[@]}" --run-dir "$OUTPUT_DIR")
+    if [ -n "$PROFILE_DIR" ]; then
+        WORKER_ARGS+=(--profile "$PROFILE_DIR/worker_$BATCH_NUMBER.prof")
+    fi
+    if [ -n "$LIMIT" ] || [ "$FORMAT" = "bitmap" ]; then
+        # The workers only report their counts; a single history entry is saved for the whole run
+        WORKER_ARGS+=(--summary "$OUTPUT_DIR/output_batch_$BATCH_NUMBER.summary.json")
+    fi
+    if [ -n "$JOB_ID" ]; then
+        # The worker opens its output itself to resume it from the last checkpoint. It only marks
+        # the shard as drained at the end of its input, which is complete once geng succeeded too
+        {
+            geng "$ORDER" "$BATCH_NUMBER/$NUM_BATCHES" | python3 ./filter_graph.py "$FILTER_STRING" "${WORKER_ARGS[@]}" --checkpoint "$MANIFEST" --shard "$BATCH_NUMBER" --output "$OUTPUT_FILE"
+            STATUSES=("${PIPESTATUS[@]}")
+            if [ "${STATUSES[0]}" -eq 0 ] && [ "${STATUSES[1]}" -eq 0 ]; then
+                python3 ./checkpoint.py complete "$OUTPUT_DIR" "$BATCH_NUMBER"
+            else
+                echo "Shard $BATCH_NUMBER failed (geng exited with ${STATUSES[0]}, the filter with ${STATUSES[1]}); it will be resumed." >&2
+            fi
+        } &
+    elif [ "$FORMAT" = "bitmap" ]; then
+        # Only the positions of the passed graphs in the shard are kept
+        geng "$ORDER" "$BATCH_NUMBER/$NUM_BATCHES" | python3 ./filter_graph.py "$FILTER_STRING" "${WORKER_ARGS[@]}" --bitmap "$OUTPUT_DIR/output_batch_$BATCH_NUMBER.passmap" > /dev/null &
+    elif [ -n "$COMPRESS" ]; then
+        geng "$ORDER" "$BATCH_NUMBER/$NUM_BATCHES" | python3 ./filter_graph.py "$FILTER_STRING" "${WORKER_ARGS[@]}" --output "$OUTPUT_FILE" &
     else
-        python3 ./filter_graph.py "$FILTER_STRING" < "$batch_file" > "$OUTPUT_DIR/output_batch_$BATCH_NUMBER.txt" &
+        geng "$ORDER" "$BATCH_NUMBER/$NUM_BATCHES" | python3 ./filter_graph.py "$FILTER_STRING" "${WORKER_ARGS[@]}" > "$OUTPUT_FILE" &
     fi
+    WORKER_GROUPS+=("$(jobs -p %+)")
 done
 
+# In limit mode, watch the combined output and stop all workers once K graphs were found
+if [ -n "$LIMIT" ]; then
+  while [ -n "$(jobs -rp)" ]; do
+    if [ "$(cat "$OUTPUT_DIR"/output_batch_*.txt | wc -l)" -ge "$LIMIT" ]; then
+      echo "Limit of $LIMIT graphs reached, stopping the remaining workers."
+      for group in "${WORKER_GROUPS[@]}"; do
+        kill -TERM -- "-$group" 2>/dev/null
+      done
+      break
+    fi
+    sleep 0.1
+  done
+fi
+
 # Wait for all parallel jobs to finish
 wait
 
+# A job combines the outputs of its shards and saves a single history entry, once all shards are complete
+if [ -n "$JOB_ID" ]; then
+  if ! python3 ./checkpoint.py finalize "$OUTPUT_DIR"; then
+    echo "Job $JOB_ID is incomplete; run the same command again to resume it."
+    exit 1
+  fi
+  python3 ./results_index.py "$OUTPUT_DIR/final_filtered_graphs.txt" > /dev/null
+  if [ -n "$SHEETS" ]; then
+    python3 ./contact_sheet.py "$OUTPUT_DIR/final_filtered_graphs.txt" "$EXPORT_FOLDER" --format "$IMAGE_FORMAT" || exit 1
+  fi
+  echo "History saved to history.txt."
+  echo "All filtered graphs saved to $OUTPUT_DIR/final_filtered_graphs.txt."
+  exit 0
+fi
+
 # After processing, optionally save the history
 echo "History saved to history.txt."
 
 # Optionally, process the output files further or combine them as needed
-cat $OUTPUT_DIR/output_batch_*.txt > "$OUTPUT_DIR/final_filtered_graphs.txt"
-echo "All filtered graphs saved to $OUTPUT_DIR/final_filtered_graphs.txt."
+if [ "$FORMAT" = "bitmap" ]; then
+  SHARD_MAPS=()
+  for BATCH_NUMBER in $SHARDS; do
+    SHARD_MAPS+=("$OUTPUT_DIR/output_batch_$BATCH_NUMBER.passmap")
+  done
+  python3 ./passmap.py pack "$OUTPUT_DIR/final_filtered_graphs.passmap" "${SHARD_MAPS[@]}" --order "$ORDER" --filter "$FILTER_STRING" || exit 1
+  python3 ./checkpoint.py record-bitmap "$OUTPUT_DIR" "$FILTER_STRING" "$NUM_BATCHES" || exit 1
+  echo "All filtered graphs saved to $OUTPUT_DIR/final_filtered_graphs.passmap (see passmap.py materialize)."
+  exit 0
+elif [ -n "$LIMIT" ]; then
+  cat "$OUTPUT_DIR"/output_batch_*.txt | head -n "$LIMIT" > "$OUTPUT_DIR/final_filtered_graphs.txt"
+  python3 ./checkpoint.py record-limit "$OUTPUT_DIR" "$FILTER_STRING" "$LIMIT" "$NUM_BATCHES" || exit 1
+  python3 ./results_index.py "$OUTPUT_DIR/final_filtered_graphs.txt" > /dev/null
+else
+  # Concatenated gzip members and zstd frames form a valid compressed file as well
+  rm -f "$OUTPUT_DIR"/final_filtered_graphs.txt*
+  cat "$OUTPUT_DIR"/output_batch_*.txt$SUFFIX > "$OUTPUT_DIR/final_filtered_graphs.txt$SUFFIX"
+
+  # Index the lines of the result so any page of it can be read with a seek
+  if [ -z "$COMPRESS" ]; then
+    python3 ./results_index.py "$OUTPUT_DIR/final_filtered_graphs.txt" > /dev/null
+  fi
+fi
+
+# Render the contact sheets of all passed graphs at once, in parallel
+if [ -n "$SHEETS" ]; then
+  python3 ./contact_sheet.py "$OUTPUT_DIR/final_filtered_graphs.txt" "$EXPORT_FOLDER" --format "$IMAGE_FORMAT" || exit 1
+fi
+echo "All filtered graphs saved to $OUTPUT_DIR/final_filtered_graphs.txt$SUFFIX."
@@ -0,0 +1,81 @@
+import os
+import subprocess
+from contextlib import contextmanager
+
+from graph_io import read_lines
+
+
+"""
+shards.py
+
+Helpers for generating graphs with geng, optionally restricted to one `res/mod` shard.
+
+geng can split the graphs of an order into `mod` disjoint classes and only generate class
+`res`. Every class is enumerated in a deterministic order, which is what allows jobs to be
+split over workers, sampled, resumed and distributed.
+"""
+
+# The geng executable (can be overridden for builds that are not on the PATH)
+GENG_COMMAND = os.environ.get("GENG", "geng")
+
+def geng_command(order, res=0, mod=1, split_increase=0):
+    """
+    Builds the geng command line generating shard `res` out of `mod` of the graphs of the given order.
+
+    Args:
+        order (int): The number of vertices.
+        res (int): The shard to generate (0 <= res < mod).
+        mod (int): The total number of shards (1 generates all graphs).
+        split_increase (int): The value of geng's `-X` option, which moves the split level up
+                              for more even shards (see estimate_filter.choose_split()).
+
+    Returns:
+        list: The command and its arguments.
+
+    Example:
+        >>> geng_command(9, 3, 4)
+        ['geng', '-q', '9', '3/4']
+    """
+    command = [GENG_COMMAND, "-q"]
+    if mod > 1 and split_increase:
+        command.append(f"-X{split_increase}")
+    command.append(str(order))
+    if mod > 1:
+        command.append(f"{res}/{mod}")
+    return command
+
+@contextmanager
+def generate_shard(order, res=0, mod=1, split_increase=0):
+    """
+    Context manager running geng for one shard and yielding its output as graph6 bytes lines.
+
+    If the caller stops reading early, geng is terminated when the context is left. If the
+    caller read the whole output, geng is waited for, since its output also ends when it dies.
+
+    Raises:
+        subprocess.CalledProcessError: If the output was read to the end but geng exited with a
+                                       nonzero status (e.g. it was killed), so the shard is incomplete.
+
+    Example:
+        >>> with generate_shard(4) as lines:
+        ...     print(sum(1 for _ in lines))
+        11
+    """
+    command = geng_command(order, res, mod, split_increase)
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    drained = False
+
+    def lines():
+        nonlocal drained
+        yield from read_lines(process.stdout)
+        drained = True
+
+    try:
+        yield lines()
+    finally:
+        if not drained and process.poll() is None:
+            process.terminate()
+        process.stdout.close()
+        process.wait()
+    if drained and process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
@@ -0,0 +1,172 @@
+import time
+import resource
+import threading
+
+
+"""
+stats.py
+
+Performance instrumentation for the graph filter and the web server.
+
+- `StageTimer` splits the wall-clock and CPU time of the filter loop over its stages
+  (waiting for geng's output, graph6 decoding, rule evaluation, output writes, image export).
+- `Counter`, `Gauge` and `Histogram` are minimal thread-safe metrics rendered in the Prometheus
+  text exposition format, used by the web server's /metrics endpoint.
+"""
+
+# Stages of the filter loop, in the order a graph goes through them
+STAGES = ("generate", "decode", "rules", "write", "export")
+
+class StageTimer:
+    """
+    Accumulates wall-clock and CPU time per stage of the filter loop.
+
+    The loop calls `lap(stage)` at the end of every stage; the time since the previous lap
+    is attributed to that stage. The "generate" stage is the time spent waiting for and
+    reading the next graph from geng.
+    """
+    def __init__(self):
+        self.wall = dict.fromkeys(STAGES, 0.0)
+        self.cpu = dict.fromkeys(STAGES, 0.0)
+        self.start_wall = self.last_wall = time.perf_counter()
+        self.start_cpu = self.last_cpu = time.process_time()
+
+    def lap(self, stage):
+        """
+        Attributes the time since the previous lap to `stage`.
+        """
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        self.wall[stage] += wall - self.last_wall
+        self.cpu[stage] += cpu - self.last_cpu
+        self.last_wall = wall
+        self.last_cpu = cpu
+
+    def report(self, input_count, output_count):
+        """
+        Summarizes the timings of a finished run.
+
+        Args:
+            input_count (int): The number of graphs that were filtered.
+            output_count (int): The number of graphs that passed.
+
+        Returns:
+            dict: Total and per-stage wall and CPU seconds, graphs per second, pass rate
+                  and the peak resident set size of this process in kilobytes.
+        """
+        wall = time.perf_counter() - self.start_wall
+        cpu = time.process_time() - self.start_cpu
+        return {
+            "wall_seconds": round(wall, 6),
+            "cpu_seconds": round(cpu, 6),
+            "stages": {
+                stage: {"wall_seconds": round(self.wall[stage], 6), "cpu_seconds": round(self.cpu[stage], 6)}
+                for stage in STAGES
+            },
+            "graphs_per_second": round(input_count / wall, 2) if wall > 0 else 0.0,
+            "pass_rate": round(output_count / input_count, 6) if input_count else 0.0,
+            "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+
+class NullTimer:
+    """
+    Stand-in for `StageTimer` when no statistics are requested; `lap()` does nothing.
+    """
+    def lap(self, stage):
+        pass
+
+NULL_TIMER = NullTimer()
+
+def format_report(stats):
+    """
+    Formats the result of `StageTimer.report()` as a short human-readable table.
+    """
+    lines = [f"{'stage':<10}{'wall (s)':>12}{'cpu (s)':>12}"]
+    for stage, times in stats["stages"].items():
+        lines.append(f"{stage:<10}{times['wall_seconds']:>12.3f}{times['cpu_seconds']:>12.3f}")
+    lines.append(f"{'total':<10}{stats['wall_seconds']:>12.3f}{stats['cpu_seconds']:>12.3f}")
+    lines.append(f"{stats['graphs_per_second']:.1f} graphs/s, pass rate {stats['pass_rate']:.4%}, "
+                 f"peak RSS {stats['peak_rss_kb'] / 1024:.1f} MiB")
+    return "\n".join(lines)
+
+def format_labels(labels):
+    """
+    Formats a label dictionary as a Prometheus label set, e.g. `{stage="decode"}`.
+    """
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in sorted(labels.items())) + "}"
+
+class Counter:
+    """
+    A monotonically increasing Prometheus counter, optionally split by labels.
+    """
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(dict(key))} {value}")
+        return "\n".join(lines)
+
+class Gauge:
+    """
+    A Prometheus gauge holding the last value set, optionally split by labels.
+    """
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[tuple(sorted(labels.items()))] = value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(dict(key))} {value}")
+        return "\n".join(lines)
+
+class Histogram:
+    """
+    A Prometheus histogram with fixed bucket upper bounds (in seconds for latencies).
+    """
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = sorted(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for bound, count in zip(self.buckets, self.counts):
+                lines.append(f'{self.name}_bucket{{le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+            lines.append(f"{self.name}_sum {self.sum}")
+            lines.append(f"{self.name}_count {self.count}")
+        return "\n".join(lines)
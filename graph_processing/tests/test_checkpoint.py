@@ -0,0 +1,205 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+from unittest import mock
+import checkpoint
+from history_management import load_history, HISTORY_FILE
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Create a temporary job directory and back up the existing history file,
+        since finalizing a job appends to it.
+        """
+        self.job_dir = os.path.join(tempfile.mkdtemp(), "job1")
+        self.manifest_path = os.path.join(self.job_dir, checkpoint.MANIFEST_NAME)
+        self.rules = '[{"degree_sum": 3, "type": "min", "count": 1}]'
+
+        self.backup = None
+        if os.path.exists(HISTORY_FILE):
+            with open(HISTORY_FILE, 'r') as f:
+                self.backup = f.read()
+            os.remove(HISTORY_FILE)
+
+    def tearDown(self):
+        """
+        Remove the job directory and restore the history file.
+        """
+        shutil.rmtree(os.path.dirname(self.job_dir))
+        if self.backup is not None:
+            with open(HISTORY_FILE, 'w') as f:
+                f.write(self.backup)
+        elif os.path.exists(HISTORY_FILE):
+            os.remove(HISTORY_FILE)
+
+    def run_shard(self, shard, graphs):
+        """
+        Run filter_graph.py as a checkpointed worker for one shard, feeding it the given graphs.
+        """
+        subprocess.run(
+            [sys.executable, "filter_graph.py", self.rules,
+             "--checkpoint", self.manifest_path, "--shard", str(shard),
+             "--output", checkpoint.shard_output_path(self.job_dir, shard)],
+            input="".join(graph + "\n" for graph in graphs), text=True, check=True
+        )
+
+    def test_init_creates_pending_shards(self):
+        """
+        Test that a new job starts with all shards pending, and that resuming it
+        with different parameters is refused.
+        """
+        manifest = checkpoint.init_job(self.job_dir, 9, self.rules, 3)
+        self.assertEqual(manifest["job_id"], "job1")
+        self.assertEqual(checkpoint.pending_shards(manifest), [0, 1, 2])
+
+        checkpoint.update_shard(self.manifest_path, 1, state="complete")
+        manifest = checkpoint.init_job(self.job_dir, 9, self.rules, 3)
+        self.assertEqual(checkpoint.pending_shards(manifest), [0, 2])
+
+        with self.assertRaises(ValueError):
+            checkpoint.init_job(self.job_dir, 10, self.rules, 3)
+
+    def test_resume_truncates_partial_output(self):
+        """
+        Test that a worker resuming a shard drops the output written after the last checkpoint,
+        skips the graphs filtered before it, and ends with the same result as an uninterrupted run.
+        """
+        checkpoint.init_job(self.job_dir, 3, self.rules, 1)
+
+        # Simulate a worker that checkpointed after 2 graphs (Bg passed, Bw did not)
+        # and then wrote part of a line before it died
+        with open(checkpoint.shard_output_path(self.job_dir, 0), "w") as f:
+            f.write("Bg\nB")
+        checkpoint.update_shard(self.manifest_path, 0, state="running", input_count=2, output_count=1, offset=3)
+
+        self.run_shard(0, ["Bg", "Bw", "BW", "Bo"])
+
+        with open(checkpoint.shard_output_path(self.job_dir, 0)) as f:
+            self.assertEqual(f.read(), "Bg\nBW\nBo\n")
+        shard = checkpoint.get_shard(self.manifest_path, 0)
+        self.assertEqual(shard, {"state": "drained", "input_count": 4, "output_count": 3, "offset": 9})
+
+        # Only the runner completes a shard, once geng exited successfully
+        checkpoint.complete_shard(self.manifest_path, 0)
+        self.assertEqual(checkpoint.get_shard(self.manifest_path, 0)["state"], "complete")
+
+    def test_finalize_saves_single_history_entry(self):
+        """
+        Test that finalizing combines the shard outputs in order, saves one history entry
+        with the summed counts, and does nothing when run a second time.
+        """
+        checkpoint.init_job(self.job_dir, 3, self.rules, 2)
+        with self.assertRaises(ValueError):
+            checkpoint.finalize_job(self.job_dir)  # shards are not complete yet
+
+        self.run_shard(0, ["Bg", "Bw"])
+        self.run_shard(1, ["BW", "Bo", "Bw"])
+        with self.assertRaises(ValueError):
+            checkpoint.finalize_job(self.job_dir)  # shards are drained, but not complete
+        checkpoint.complete_shard(self.manifest_path, 0)
+        checkpoint.complete_shard(self.manifest_path, 1)
+        entry = checkpoint.finalize_job(self.job_dir)
+
+        with open(os.path.join(self.job_dir, checkpoint.FINAL_OUTPUT_NAME)) as f:
+            self.assertEqual(f.read(), "Bg\nBW\nBo\n")
+        self.assertEqual((entry.input_number, entry.output_number), (5, 3))
+
+        self.assertIsNone(checkpoint.finalize_job(self.job_dir))
+        history = load_history()
+        self.assertEqual(len(history), 1)
+        self.assertEqual(history[0].passed_graph_list, ["Bg", "BW", "Bo"])
+        self.assertEqual(history[0].metadata, {"job_id": "job1"})
+
+    def test_interrupted_finalize_does_not_save_twice(self):
+        """
+        Test that a finalize interrupted after saving the history entry, but before marking
+        the job as finalized, does not save the entry again when the job is run again.
+        """
+        checkpoint.init_job(self.job_dir, 3, self.rules, 1)
+        self.run_shard(0, ["Bg", "Bw"])
+        checkpoint.complete_shard(self.manifest_path, 0)
+
+        # Crash right after the history entry was saved: the marker is written, the final flag is not
+        original = checkpoint.write_json_atomic
+        calls = []
+        def crash_on_second_write(path, data):
+            calls.append(path)
+            if len(calls) == 2:
+                raise OSError("crash")
+            original(path, data)
+        with mock.patch.object(checkpoint, "write_json_atomic", crash_on_second_write):
+            with self.assertRaises(OSError):
+                checkpoint.finalize_job(self.job_dir)
+        self.assertEqual(len(load_history()), 1)
+
+        self.assertIsNotNone(checkpoint.finalize_job(self.job_dir))
+        self.assertEqual(len(load_history()), 1)
+        self.assertIsNone(checkpoint.finalize_job(self.job_dir))
+
+    def test_limited_run_saves_single_history_entry(self):
+        """
+        Test that the workers of a limited run write summaries instead of history entries,
+        and that a single truncated entry is saved for the trimmed final output.
+        """
+        os.makedirs(self.job_dir)
+        for shard, graphs in enumerate([["Bg", "Bw", "BW"], ["Bo", "BW"]]):
+            subprocess.run(
+                [sys.executable, "filter_graph.py", self.rules, "--limit", "2",
+                 "--summary", os.path.join(self.job_dir, f"output_batch_{shard}.summary.json")],
+                input="".join(graph + "\n" for graph in graphs), text=True, check=True, stdout=subprocess.DEVNULL
+            )
+        self.assertFalse(os.path.exists(HISTORY_FILE))
+
+        # Both workers found 2 graphs; the runner keeps the first 2 of the combined output
+        with open(os.path.join(self.job_dir, checkpoint.FINAL_OUTPUT_NAME), "w") as f:
+            f.write("Bg\nBW\n")
+        entry = checkpoint.record_limited_run(self.job_dir, self.rules, 2, 2)
+
+        self.assertEqual((entry.input_number, entry.output_number), (5, 2))
+        history = load_history()
+        self.assertEqual(len(history), 1)
+        self.assertEqual(history[0].passed_graph_list, ["Bg", "BW"])
+        self.assertEqual(history[0].metadata, {"limit": 2, "truncated": True, "output_dir": self.job_dir})
+
+    def test_killed_generator_leaves_shard_resumable(self):
+        """
+        Test that a job whose geng is killed is not finalized, even though its worker
+        reached the end of its input, and that running it again completes it with the right totals.
+        """
+        bin_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, bin_dir)
+        # A stand-in for geng: shard 0 gets two graphs, then it is killed if GENG_KILL is set
+        with open(os.path.join(bin_dir, "geng"), "w") as f:
+            f.write('#!/bin/sh\ncase "$2" in 0/*) printf \'Bg\\nBw\\n\';; esac\n'
+                    '[ -n "$GENG_KILL" ] && kill -9 $$\nexit 0\n')
+        os.chmod(os.path.join(bin_dir, "geng"), 0o755)
+
+        def run_job(**env):
+            return subprocess.run(
+                ["./run_filter_parallel.sh", "3", self.rules, "--job-id", "job1",
+                 "--output-dir", os.path.dirname(self.job_dir)],
+                env=dict(os.environ, PATH=bin_dir + os.pathsep + os.environ["PATH"], **env),
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+            )
+
+        result = run_job(GENG_KILL="1")
+        self.assertNotEqual(result.returncode, 0)
+        manifest = checkpoint.load_manifest(self.manifest_path)
+        self.assertFalse(manifest["finalized"])
+        self.assertEqual(manifest["shards"][0]["state"], "drained")
+        self.assertEqual(checkpoint.pending_shards(manifest), [0, 1, 2, 3])
+        self.assertFalse(os.path.exists(HISTORY_FILE))
+
+        result = run_job()
+        self.assertEqual(result.returncode, 0, result.stderr)
+        history = load_history()
+        self.assertEqual(len(history), 1)
+        self.assertEqual((history[0].input_number, history[0].output_number), (2, 1))
+        self.assertEqual(history[0].passed_graph_list, ["Bg"])
+
+if __name__ == "__main__":
+    unittest.main()
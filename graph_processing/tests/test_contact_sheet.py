@@ -0,0 +1,88 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import contact_sheet
+from contact_sheet import group_files, export_contact_sheets, INDEX_NAME
+
+class TestContactSheet(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Create a temporary output folder and a few small graphs.
+        """
+        self.tmp_dir = tempfile.mkdtemp()
+        self.graphs = ["Bw", "BW", "Bg", "CF", "CU", "C]", "C^", "C~"]
+
+    def tearDown(self):
+        """
+        Remove the temporary directory.
+        """
+        shutil.rmtree(self.tmp_dir)
+
+    def test_group_files_images(self):
+        """
+        Test that image formats get one sheet per file, the last sheet holding the remaining graphs.
+        """
+        files = list(group_files(self.graphs, "png", 2, 2))
+        self.assertEqual([(name, first) for name, first, _ in files],
+                         [("sheet_00000.png", 0), ("sheet_00001.png", 1)])
+        self.assertEqual(files[0][2], [self.graphs[:4]])
+        self.assertEqual(files[1][2], [self.graphs[4:]])
+
+    def test_group_files_pdf(self):
+        """
+        Test that PDF files hold up to `PAGES_PER_PDF` sheets each.
+        """
+        original = contact_sheet.PAGES_PER_PDF
+        contact_sheet.PAGES_PER_PDF = 2
+        try:
+            files = list(group_files(self.graphs, "pdf", 1, 3))
+        finally:
+            contact_sheet.PAGES_PER_PDF = original
+
+        self.assertEqual([(name, first, len(sheets)) for name, first, sheets in files],
+                         [("sheets_00000.pdf", 0, 2), ("sheets_00001.pdf", 2, 1)])
+        self.assertEqual(files[1][2], [self.graphs[6:]])
+
+    def test_export_writes_sheets_and_index(self):
+        """
+        Test that exporting writes every sheet and an index mapping each graph to its sheet and tile.
+        """
+        self.assertEqual(export_contact_sheets(self.graphs, self.tmp_dir, "png", columns=3, rows=1, workers=1), (8, 3))
+        with open(os.path.join(self.tmp_dir, INDEX_NAME)) as f:
+            index = json.load(f)
+
+        self.assertEqual((index["format"], index["columns"], index["rows"]), ("png", 3, 1))
+        self.assertEqual(len(index["sheets"]), 3)
+        self.assertEqual(len(index["graphs"]), 8)
+        for sheet in index["sheets"]:
+            self.assertTrue(os.path.getsize(os.path.join(self.tmp_dir, sheet["file"])) > 0)
+        self.assertEqual(index["graphs"]["Bw"], {"sheet": 0, "tile": 0})
+        self.assertEqual(index["graphs"]["CF"], {"sheet": 1, "tile": 0})
+        self.assertEqual(index["graphs"]["C~"], {"sheet": 2, "tile": 1})
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), [INDEX_NAME, "sheet_00000.png", "sheet_00001.png", "sheet_00002.png"])
+
+    def test_export_pdf(self):
+        """
+        Test that a PDF export writes a single multi-page file.
+        """
+        self.assertEqual(export_contact_sheets(self.graphs, self.tmp_dir, "pdf", columns=2, rows=2, workers=1), (8, 2))
+        with open(os.path.join(self.tmp_dir, INDEX_NAME)) as f:
+            index = json.load(f)
+
+        self.assertEqual(index["sheets"], [{"file": "sheets_00000.pdf", "page": 0},
+                                           {"file": "sheets_00000.pdf", "page": 1}])
+        with open(os.path.join(self.tmp_dir, "sheets_00000.pdf"), "rb") as f:
+            self.assertEqual(f.read(5), b"%PDF-")
+
+    def test_unsupported_format(self):
+        """
+        Test that an unsupported format is rejected.
+        """
+        with self.assertRaises(ValueError):
+            export_contact_sheets(self.graphs, self.tmp_dir, "gif")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+import subprocess
+from contextlib import contextmanager
+from distributed import Coordinator, MessageChannel, run_worker
+from history_management import load_history, HISTORY_FILE
+
+# Fake shards used instead of geng: 4 shards of small graphs on 3 vertices
+SHARDS = {0: ["Bg", "Bw"], 1: ["BW", "Bo"], 2: ["Bw"], 3: ["Bg"]}
+
+@contextmanager
+def fake_generate(order, res, mod):
+    """
+    Yields the graph6 lines of a fake shard, like shards.generate_shard() does for geng.
+    """
+    yield iter(graph.encode() + b"\n" for graph in SHARDS[res])
+
+@contextmanager
+def failing_generate(order, res, mod):
+    """
+    Yields part of a fake shard and then fails, like shards.generate_shard() does when geng is killed.
+    """
+    yield iter(graph.encode() + b"\n" for graph in SHARDS[res][:1])
+    raise subprocess.CalledProcessError(-9, ["geng"])
+
+class TestDistributed(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Create a temporary job directory and back up the existing history file,
+        since the coordinator appends the job to it.
+        """
+        self.job_dir = os.path.join(tempfile.mkdtemp(), "job1")
+        self.filter_str = '[{"degree_sum": 3, "type": "min", "count": 1}]'
+
+        self.backup = None
+        if os.path.exists(HISTORY_FILE):
+            with open(HISTORY_FILE, 'r') as f:
+                self.backup = f.read()
+            os.remove(HISTORY_FILE)
+
+    def tearDown(self):
+        """
+        Remove the job directory and restore the history file.
+        """
+        shutil.rmtree(os.path.dirname(self.job_dir))
+        if self.backup is not None:
+            with open(HISTORY_FILE, 'w') as f:
+                f.write(self.backup)
+        elif os.path.exists(HISTORY_FILE):
+            os.remove(HISTORY_FILE)
+
+    def start_coordinator(self, heartbeat_timeout=15, token=None):
+        """
+        Start a coordinator for the fake shards on a free local port and return its port.
+        """
+        self.coordinator = Coordinator(3, self.filter_str, len(SHARDS), self.job_dir,
+                                       host="127.0.0.1", port=0, heartbeat_timeout=heartbeat_timeout, token=token)
+        return self.coordinator.start()[1]
+
+    def start_worker(self, port, name, token=None):
+        """
+        Run a worker on the fake shards in a background thread.
+        """
+        thread = threading.Thread(target=run_worker, args=("127.0.0.1", port, name, fake_generate, token), daemon=True)
+        thread.start()
+        return thread
+
+    def assert_job_result(self, entry):
+        """
+        Check the combined output and history entry of the job on the fake shards.
+        """
+        with open(os.path.join(self.job_dir, "final_filtered_graphs.txt")) as f:
+            self.assertEqual(f.read(), "Bg\nBW\nBo\nBg\n")
+        self.assertEqual((entry.input_number, entry.output_number), (6, 4))
+        history = load_history()
+        self.assertEqual(len(history), 1)
+        self.assertEqual(history[0].output_number, 4)
+
+    def test_workers_complete_job(self):
+        """
+        Test that several workers together filter all shards and that the coordinator
+        combines their results in shard order into a single history entry.
+        """
+        port = self.start_coordinator()
+        workers = [self.start_worker(port, f"w{i}") for i in range(3)]
+        entry = self.coordinator.wait()
+        for worker in workers:
+            worker.join(timeout=5)
+
+        self.assert_job_result(entry)
+        self.assertEqual(entry.metadata["reassigned_shards"], 0)
+
+    def test_dead_worker_shard_is_reassigned(self):
+        """
+        Test that the shard of a worker that stops sending heartbeats is handed out again
+        and that the job still ends with the complete result.
+        """
+        port = self.start_coordinator(heartbeat_timeout=0.5)
+
+        # A worker that takes a shard and then hangs without closing its connection
+        channel = MessageChannel(socket.create_connection(("127.0.0.1", port)))
+        channel.send({"type": "hello", "name": "hanging"})
+        channel.receive()
+        channel.send({"type": "request"})
+        assignment = channel.receive()
+        self.assertEqual(assignment["type"], "shard")
+
+        # Once it is declared dead, its connection is closed by the coordinator
+        self.assertIsNone(channel.receive())
+        channel.close()
+
+        self.start_worker(port, "healthy")
+        entry = self.coordinator.wait()
+
+        self.assert_job_result(entry)
+        self.assertEqual(entry.metadata["reassigned_shards"], 1)
+        self.assertEqual(entry.metadata["workers"], 2)
+
+    def test_failed_shard_is_reassigned(self):
+        """
+        Test that a worker whose geng fails reports the shard, which is handed out again
+        under a new attempt, so the job ends with the complete result.
+        """
+        port = self.start_coordinator()
+        with self.assertRaises(subprocess.CalledProcessError):
+            run_worker("127.0.0.1", port, "broken", failing_generate)
+
+        self.start_worker(port, "healthy")
+        entry = self.coordinator.wait()
+
+        self.assert_job_result(entry)
+        self.assertEqual(entry.metadata["reassigned_shards"], 1)
+        self.assertEqual(self.coordinator.attempts[0], 2)
+
+    def test_public_address_requires_token(self):
+        """
+        Test that a coordinator refuses to listen on a public address without a token.
+        """
+        with self.assertRaises(ValueError):
+            Coordinator(3, self.filter_str, len(SHARDS), self.job_dir, host="0.0.0.0", port=0)
+
+    def test_worker_with_wrong_token_is_refused(self):
+        """
+        Test that a worker with a wrong token is refused before it can submit results,
+        while a worker with the right token completes the job.
+        """
+        port = self.start_coordinator(token="secret")
+        with self.assertRaises(PermissionError):
+            run_worker("127.0.0.1", port, "intruder", fake_generate, token="guess")
+        with self.assertRaises(PermissionError):
+            run_worker("127.0.0.1", port, "anonymous", fake_generate)
+
+        self.start_worker(port, "trusted", token="secret")
+        entry = self.coordinator.wait()
+        self.assert_job_result(entry)
+        self.assertEqual(entry.metadata["workers"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+import unittest
+import subprocess
+from unittest import mock
+import shards
+from estimate_filter import ratio_estimate, choose_split, plan_sample, run_shard, t_quantile, GRAPH_COUNTS, MAX_SAMPLE_FRACTION
+
+class TestEstimateFilter(unittest.TestCase):
+
+    def test_ratio_estimate_proportional_sample(self):
+        """
+        Test that a sample where every shard has the same pass rate gives that rate
+        with a zero-width confidence interval.
+        """
+        ratio, low, high = ratio_estimate([1, 2, 3], [10, 20, 30], 100)
+        self.assertAlmostEqual(ratio, 0.1)
+        self.assertAlmostEqual(low, 0.1)
+        self.assertAlmostEqual(high, 0.1)
+
+    def test_ratio_estimate_interval_contains_estimate(self):
+        """
+        Test that the confidence interval surrounds the estimate and narrows
+        as the sample covers more of the shards (finite population correction).
+        """
+        ys, xs = [0, 5, 9, 2], [10, 10, 12, 8]
+        ratio, low, high = ratio_estimate(ys, xs, 1000)
+        self.assertAlmostEqual(ratio, 16 / 40)
+        self.assertLess(low, ratio)
+        self.assertGreater(high, ratio)
+
+        _, low_small, high_small = ratio_estimate(ys, xs, 5)
+        self.assertLess(high_small - low_small, high - low)
+
+    def test_ratio_estimate_full_population_is_exact(self):
+        """
+        Test that sampling every shard gives an exact result.
+        """
+        self.assertEqual(ratio_estimate([3, 1], [4, 4], 2), (0.5, 0.5, 0.5))
+
+    def test_ratio_estimate_empty_sample(self):
+        """
+        Test that a sample without any graphs cannot be used for an estimate.
+        """
+        with self.assertRaises(ValueError):
+            ratio_estimate([0, 0], [0, 0], 10)
+
+    def test_ratio_estimate_needs_two_shards(self):
+        """
+        Test that a single sampled shard is rejected instead of giving an unbounded interval.
+        """
+        with self.assertRaises(ValueError):
+            ratio_estimate([1], [10], 10)
+
+    def test_t_quantile(self):
+        """
+        Test the t quantile approximation against tabulated values.
+        """
+        self.assertAlmostEqual(t_quantile(0.975, 3), 3.182, delta=0.1)
+        self.assertAlmostEqual(t_quantile(0.975, 7), 2.365, delta=0.01)
+        self.assertAlmostEqual(t_quantile(0.975, 1000), 1.962, delta=0.001)
+
+    def test_choose_split_small_orders_run_completely(self):
+        """
+        Test that small orders are not split into shards at all.
+        """
+        self.assertEqual(choose_split(5), (1, 0))
+        self.assertEqual(choose_split(8), (1, 0))
+
+    def test_choose_split_has_enough_nodes_per_shard(self):
+        """
+        Test that the split level of large orders has enough nodes for every shard
+        and never goes beyond n-2.
+        """
+        for order in (9, 10, 11, 12):
+            mod, split_increase = choose_split(order)
+            level = order - 3 + split_increase
+            self.assertGreater(mod, 1)
+            self.assertLessEqual(level, order - 2)
+            self.assertGreaterEqual(GRAPH_COUNTS[level], 20 * mod)
+
+    def test_plan_sample_reads_a_small_fraction(self):
+        """
+        Test that the sampled shards hold a small fraction of the graphs, and at least 2 shards
+        are sampled whenever the graphs are split.
+        """
+        for order in (9, 10, 11, 12):
+            mod, _, samples = plan_sample(order)
+            self.assertGreaterEqual(samples, 2)
+            self.assertLessEqual(samples, max(2, mod * MAX_SAMPLE_FRACTION))
+        self.assertEqual(plan_sample(9, samples=8, mod=13)[2], 2)
+        self.assertEqual(plan_sample(8), (1, 0, 1))
+
+    def test_plan_sample_bounds_the_sampled_graphs(self):
+        """
+        Test that the sample is capped at the given number of graphs, and that orders whose
+        shards are too large, or whose number of graphs is unknown, are refused.
+        """
+        mod, _, samples = plan_sample(11, samples=8, max_graphs=500000)
+        self.assertLessEqual(samples * GRAPH_COUNTS[11] / mod, 500000)
+        self.assertGreaterEqual(samples, 2)
+
+        for order in (14, 15, 16):
+            with self.assertRaises(ValueError):
+                plan_sample(order)
+        with self.assertRaises(ValueError):
+            plan_sample(12, max_graphs=1000)
+
+    def test_run_shard_fails_when_geng_is_killed(self):
+        """
+        Test that a shard whose geng is killed after printing some graphs raises an error
+        instead of returning the counts of a partial shard.
+        """
+        bin_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, bin_dir)
+        geng = os.path.join(bin_dir, "geng")
+        with open(geng, "w") as f:
+            f.write("#!/bin/sh\nprintf 'Bg\\nBw\\n'\nkill -9 $$\n")
+        os.chmod(geng, 0o755)
+
+        rules = [{"degree_sum": 3, "type": "min", "count": 1}]
+        with mock.patch.object(shards, "GENG_COMMAND", geng):
+            with self.assertRaises(subprocess.CalledProcessError):
+                run_shard(3, 0, 2, rules)
+
+if __name__ == "__main__":
+    unittest.main()
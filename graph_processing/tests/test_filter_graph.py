@@ -1,6 +1,7 @@
+import io
 import unittest
 import networkx as nx
-from filter_graph import satisfies_all_rules, parse_rules
+from filter_graph import satisfies_all_rules, parse_rules, filter_stream
 
 class TestFilterGraph(unittest.TestCase):
 
@@ -130,6 +131,41 @@ class TestFilterGraph(unittest.TestCase):
         with self.assertRaises(KeyError):  # Your implementation doesn't check type string explicitly
             satisfies_all_rules(self.G1, bad_rule)
 
+    def test_filter_stream_without_limit(self):
+        """
+        Test filtering a stream of graph6 lines without a limit.
+        All passing graphs are written to the output and the result is not truncated.
+        """
+        lines = [b"Bg\n", b"\n", b"Bw\n", b"BW\n"]  # path, empty line, triangle, path (other labelling)
+        rules = [{"degree_sum": 3, "type": "exactly", "count": 2}]
+        output = io.BytesIO()
+        input_count, output_count, passed, truncated = filter_stream(lines, rules, output)
+        self.assertEqual((input_count, output_count, truncated), (3, 2, False))
+        self.assertEqual(passed, ["Bg", "BW"])
+        self.assertEqual(output.getvalue().decode().split(), passed)
+
+    def test_filter_stream_with_limit(self):
+        """
+        Test that the filter stops reading as soon as the limit is reached
+        and reports the result as truncated.
+        """
+        lines = [b"Bg", b"Bw", b"BW", b"Bo"]
+        rules = [{"degree_sum": 3, "type": "min", "count": 1}]
+        output = io.BytesIO()
+        input_count, output_count, passed, truncated = filter_stream(lines, rules, output, limit=2)
+        self.assertEqual((input_count, output_count, truncated), (3, 2, True))
+        self.assertEqual(output.getvalue().split(), [b"Bg", b"BW"])
+
+    def test_filter_stream_limit_not_reached(self):
+        """
+        Test that reaching the limit exactly on the last graph is not reported as truncated.
+        """
+        lines = [b"Bg", b"BW"]
+        rules = [{"degree_sum": 3, "type": "min", "count": 1}]
+        _, output_count, _, truncated = filter_stream(lines, rules, io.BytesIO(), limit=2)
+        self.assertEqual(output_count, 2)
+        self.assertFalse(truncated)
+
 
 if __name__ == "__main__":
     unittest.main()
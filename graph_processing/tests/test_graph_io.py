@@ -0,0 +1,77 @@
+import io
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+import graph_io
+from graph_io import read_lines, open_output, compression_for_path
+
+class TestGraphIO(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Create a temporary directory for the output files.
+        """
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """
+        Remove the temporary directory.
+        """
+        shutil.rmtree(self.tmp_dir)
+
+    def test_read_lines_across_blocks(self):
+        """
+        Test that lines split over several blocks are joined back together,
+        and that a last line without a line ending is kept.
+        """
+        stream = io.BytesIO(b"Bg\nBw\n\nDQc\nBW")
+        self.assertEqual(list(read_lines(stream, block_size=3)), [b"Bg", b"Bw", b"", b"DQc", b"BW"])
+
+    def test_read_lines_empty_stream(self):
+        """
+        Test that an empty stream yields no lines.
+        """
+        self.assertEqual(list(read_lines(io.BytesIO(b""))), [])
+
+    def test_compression_for_path(self):
+        """
+        Test that the output compression is selected by the file extension.
+        """
+        self.assertEqual(compression_for_path("out.txt.gz"), "gzip")
+        self.assertEqual(compression_for_path("out.txt.zst"), "zstd")
+        self.assertIsNone(compression_for_path("out.txt"))
+        self.assertIsNone(compression_for_path(None))
+
+    def test_gzip_output(self):
+        """
+        Test that a .gz output file is written gzip-compressed.
+        """
+        path = os.path.join(self.tmp_dir, "out.txt.gz")
+        with open_output(path) as output:
+            output.write(b"Bg\nBW\n")
+        with gzip.open(path, "rb") as f:
+            self.assertEqual(f.read(), b"Bg\nBW\n")
+
+    def test_plain_output(self):
+        """
+        Test that other output files are written uncompressed.
+        """
+        path = os.path.join(self.tmp_dir, "out.txt")
+        with open_output(path) as output:
+            output.write(b"Bg\n")
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"Bg\n")
+
+    @unittest.skipIf(graph_io.zstandard is not None, "zstandard is installed")
+    def test_zstd_output_requires_zstandard(self):
+        """
+        Test that zstd output is refused with a clear error when zstandard is not installed.
+        """
+        with self.assertRaises(ValueError):
+            open_output(os.path.join(self.tmp_dir, "out.txt.zst"))
+
+
+if __name__ == "__main__":
+    unittest.main()
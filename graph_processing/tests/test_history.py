@@ -89,6 +89,22 @@ class TestHistory(unittest.TestCase):
         self.assertEqual(history[0].filter_str, special_filter)
         self.assertEqual(history[0].passed_graph_list, ["H1", "H2"])
 
+    def test_save_and_load_with_metadata(self):
+        """
+        Test that metadata (e.g. a truncated run) is stored in an extra column and loaded back,
+        while entries without metadata keep the 5-column format.
+        """
+        truncated = HistoryEntry(7, 2, "filterA", ["A", "B"], {"truncated": True, "limit": 2})
+        complete = HistoryEntry(7, 3, "filterB", ["C"])
+        self.assertEqual(len(truncated.to_line().split('\t')), 6)
+        self.assertEqual(len(complete.to_line().split('\t')), 5)
+
+        save_history([truncated, complete])
+        history = load_history()
+        self.assertTrue(history[0].truncated)
+        self.assertEqual(history[0].metadata["limit"], 2)
+        self.assertFalse(history[1].truncated)
+
 
 if __name__ == '__main__':
     unittest.main()
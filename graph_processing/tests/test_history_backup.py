@@ -0,0 +1,126 @@
+import os
+import sys
+import gzip
+import shutil
+import tempfile
+import unittest
+
+# The backup scripts live in history_backup/, next to graph_processing/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "history_backup"))
+
+from backup_history import backup, load_manifest
+from restore_history import list_snapshots, restore
+
+class TestHistoryBackup(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Create a temporary history file and backup directory.
+        """
+        self.tmp_dir = tempfile.mkdtemp()
+        self.history = os.path.join(self.tmp_dir, "history.txt")
+        self.backup_dir = os.path.join(self.tmp_dir, "backups")
+
+    def tearDown(self):
+        """
+        Remove the temporary directory.
+        """
+        shutil.rmtree(self.tmp_dir)
+
+    def append(self, text):
+        """
+        Append text to the history file and return its whole content.
+        """
+        with open(self.history, "a") as f:
+            f.write(text)
+        with open(self.history, "rb") as f:
+            return f.read()
+
+    def restored(self, segment_id):
+        """
+        Restore a snapshot to a new file and return its content.
+        """
+        output = os.path.join(self.tmp_dir, f"restored_{segment_id}.txt")
+        restore(self.backup_dir, (None, None, segment_id, None), output)
+        with open(output, "rb") as f:
+            return f.read()
+
+    def test_incremental_round_trip(self):
+        """
+        Test that backups store only the appended bytes, store nothing when the history is
+        unchanged, and that every snapshot restores the history as it was.
+        """
+        versions = [self.append("line 1\n" * 100)]
+        self.assertEqual(backup(self.history, self.backup_dir)["kind"], "base")
+        self.assertIsNone(backup(self.history, self.backup_dir))
+
+        versions.append(self.append("line 2\n"))
+        delta = backup(self.history, self.backup_dir)
+        self.assertEqual((delta["kind"], delta["offset"], delta["length"]), ("delta", 700, 7))
+
+        versions.append(self.append("line 3\n"))
+        backup(self.history, self.backup_dir)
+
+        # Deltas as large as their base trigger a new base
+        versions.append(self.append("line 4\n" * 200))
+        self.assertEqual(backup(self.history, self.backup_dir)["kind"], "base")
+
+        self.assertEqual(len(load_manifest(self.backup_dir)["segments"]), 4)
+        for segment_id, content in enumerate(versions):
+            self.assertEqual(self.restored(segment_id), content)
+
+    def test_rewritten_history_gets_a_new_base(self):
+        """
+        Test that a history that no longer starts with the backed up bytes is stored in full.
+        """
+        self.append("first\n")
+        backup(self.history, self.backup_dir)
+        with open(self.history, "w") as f:
+            f.write("other\nlines\n")
+        self.assertEqual(backup(self.history, self.backup_dir)["kind"], "base")
+        self.assertEqual(self.restored(1), b"other\nlines\n")
+
+    def test_corrupted_segment_is_detected(self):
+        """
+        Test that a segment that does not match its checksum stops the restore and leaves
+        the target file untouched.
+        """
+        self.append("line 1\n" * 100)
+        backup(self.history, self.backup_dir)
+        self.append("line 2\n")
+        delta = backup(self.history, self.backup_dir)
+
+        path = os.path.join(self.backup_dir, delta["file"])
+        with gzip.open(path, "wb") as f:
+            f.write(b"line X\n")
+
+        target = os.path.join(self.tmp_dir, "current.txt")
+        with open(target, "w") as f:
+            f.write("current\n")
+        with self.assertRaises(ValueError):
+            restore(self.backup_dir, (None, None, delta["id"], None), target)
+        with open(target) as f:
+            self.assertEqual(f.read(), "current\n")
+        self.assertEqual(os.listdir(self.tmp_dir).count("current.txt.restore.tmp"), 0)
+
+    def test_restore_into_empty_directory(self):
+        """
+        Test that a snapshot can be restored where no history exists yet, and that an empty
+        backup directory has no snapshots.
+        """
+        content = self.append("line 1\nline 2\n")
+        backup(self.history, self.backup_dir)
+
+        empty_dir = os.path.join(self.tmp_dir, "new_machine")
+        os.makedirs(empty_dir)
+        target = os.path.join(empty_dir, "history.txt")
+        self.assertEqual(restore(self.backup_dir, list_snapshots(self.backup_dir)[0], target), len(content))
+        with open(target, "rb") as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(os.listdir(empty_dir), ["history.txt"])
+
+        os.makedirs(os.path.join(self.tmp_dir, "no_backups"))
+        self.assertEqual(list_snapshots(os.path.join(self.tmp_dir, "no_backups")), [])
+
+if __name__ == '__main__':
+    unittest.main()
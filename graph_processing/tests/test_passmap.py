@@ -0,0 +1,172 @@
+import io
+import os
+import json
+import struct
+import shutil
+import random
+import tempfile
+import unittest
+from contextlib import contextmanager
+from filter_graph import filter_stream
+from passmap import RoaringBitmap, PassMap, ARRAY_MAX_SIZE, pack, combine, materialize
+
+# Fake shards used instead of geng: 2 shards of small graphs on 3 vertices
+SHARDS = {0: [b"Bg", b"Bw", b"BW"], 1: [b"Bo", b"Bw"]}
+
+@contextmanager
+def fake_generate(order, res, mod, split_increase=0):
+    """
+    Yields the graph6 lines of a fake shard, like shards.generate_shard() does for geng.
+    """
+    yield iter(graph + b"\n" for graph in SHARDS[res])
+
+class TestRoaringBitmap(unittest.TestCase):
+
+    def test_add_and_contains(self):
+        """
+        Test that added values are found, counted once and iterated in increasing order.
+        """
+        bitmap = RoaringBitmap([5, 1, 70000, 5, 3])
+        self.assertEqual(list(bitmap), [1, 3, 5, 70000])
+        self.assertEqual(len(bitmap), 4)
+        self.assertIn(70000, bitmap)
+        self.assertNotIn(4, bitmap)
+        self.assertNotIn(1 << 20, bitmap)
+
+    def test_dense_chunk_becomes_bitset(self):
+        """
+        Test that a chunk with many values is stored as a bitset and still behaves like a set.
+        """
+        values = list(range(0, 3 * ARRAY_MAX_SIZE, 2))
+        bitmap = RoaringBitmap(values)
+        self.assertIsInstance(bitmap.containers[0], bytearray)
+        self.assertEqual(list(bitmap), values)
+        self.assertEqual(len(bitmap), len(values))
+
+    def test_set_operations_match_python_sets(self):
+        """
+        Test union and intersection over sparse and dense chunks against Python sets.
+        """
+        rng = random.Random(1)
+        a = set(rng.sample(range(200000), 20000)) | set(range(65536, 80000))
+        b = set(rng.sample(range(200000), 3000))
+        bitmap_a, bitmap_b = RoaringBitmap(a), RoaringBitmap(b)
+        self.assertEqual(list(bitmap_a | bitmap_b), sorted(a | b))
+        self.assertEqual(list(bitmap_a & bitmap_b), sorted(a & b))
+        self.assertEqual(list(bitmap_b & bitmap_a), sorted(a & b))
+
+    def test_serialization_round_trip(self):
+        """
+        Test that a bitmap is restored from its serialized form.
+        """
+        bitmap = RoaringBitmap(list(range(10000)) + [123456, 4000000])
+        self.assertEqual(RoaringBitmap.from_bytes(bitmap.to_bytes()), bitmap)
+
+    def test_serialization_of_large_indices(self):
+        """
+        Test that indices of 2**32 and above (shards with more than 2**32 graphs) are serialized.
+        """
+        bitmap = RoaringBitmap([5, 2**32, 2**32 + 70000, 2**40])
+        self.assertEqual(list(RoaringBitmap.from_bytes(bitmap.to_bytes())), [5, 2**32, 2**32 + 70000, 2**40])
+
+    def test_invalid_serialization(self):
+        """
+        Test that truncated data is rejected.
+        """
+        data = RoaringBitmap(range(100)).to_bytes()
+        with self.assertRaises(ValueError):
+            RoaringBitmap.from_bytes(data[:50])
+
+class TestPassMap(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Create a temporary directory for the pass map files.
+        """
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """
+        Remove the temporary directory.
+        """
+        shutil.rmtree(self.tmp_dir)
+
+    def test_filter_stream_records_indices(self):
+        """
+        Test that the filter records the positions of the passing graphs in its input.
+        """
+        indices = RoaringBitmap()
+        filter_stream([b"Bg", b"\n", b"Bw", b"BW"], [{"degree_sum": 3, "type": "exactly", "count": 2}],
+                      io.BytesIO(), passed_indices=indices)
+        self.assertEqual(list(indices), [0, 2])
+
+    def test_filter_stream_does_not_collect_graphs_for_indices(self):
+        """
+        Test that the passing graphs are not kept in memory when only their indices are recorded.
+        """
+        _, output_count, passed, _ = filter_stream([b"Bg", b"Bw", b"BW"], [{"degree_sum": 3, "type": "exactly", "count": 2}],
+                                                   io.BytesIO(), passed_indices=RoaringBitmap())
+        self.assertEqual((output_count, passed), (2, []))
+
+    def test_save_and_load(self):
+        """
+        Test that a pass map keeps its parameters and bitmaps when saved.
+        """
+        path = os.path.join(self.tmp_dir, "result.passmap")
+        PassMap(3, "[]", [RoaringBitmap([0, 2]), RoaringBitmap()], [3, 2]).save(path)
+        pass_map = PassMap.load(path)
+        self.assertEqual((pass_map.order, pass_map.mod, pass_map.filter), (3, 2, "[]"))
+        self.assertEqual((pass_map.input_count, pass_map.output_count), (5, 2))
+        self.assertEqual(pass_map.bitmaps[0], RoaringBitmap([0, 2]))
+
+    def test_load_version_1(self):
+        """
+        Test that pass maps written with 16-bit container keys (version 1) can still be read.
+        """
+        path = os.path.join(self.tmp_dir, "old.passmap")
+        bitmap = struct.pack("<I", 1) + struct.pack("<HBI", 1, 0, 2) + struct.pack("<2H", 3, 7)
+        header = {"order": 3, "mod": 1, "split_increase": 0, "filter": "[]",
+                  "shards": [{"input_count": 70000, "output_count": 2, "size": len(bitmap)}]}
+        with open(path, "wb") as f:
+            f.write(b"PASSMAP 1\n" + json.dumps(header).encode() + b"\n" + bitmap)
+        self.assertEqual(list(PassMap.load(path).bitmaps[0]), [65539, 65543])
+
+    def test_load_rejects_other_files(self):
+        """
+        Test that a file that is not a pass map is rejected.
+        """
+        path = os.path.join(self.tmp_dir, "graphs.txt")
+        with open(path, "w") as f:
+            f.write("Bg\n")
+        with self.assertRaises(ValueError):
+            PassMap.load(path)
+
+    def test_combine_and_materialize(self):
+        """
+        Test that packed shard results can be combined and turned back into graph6 strings.
+        """
+        a = pack([PassMap(None, "A", [RoaringBitmap([0, 1])], [3]), PassMap(None, "A", [RoaringBitmap([0])], [2])], 3, "A")
+        b = pack([PassMap(None, "B", [RoaringBitmap([1, 2])], [3]), PassMap(None, "B", [RoaringBitmap()], [2])], 3, "B")
+
+        union = combine([a, b], "union")
+        self.assertEqual(union.filter, "union(A, B)")
+        output = io.BytesIO()
+        self.assertEqual(materialize(union, output, generate=fake_generate), 4)
+        self.assertEqual(output.getvalue().split(), [b"Bg", b"Bw", b"BW", b"Bo"])
+
+        output = io.BytesIO()
+        materialize(combine([a, b], "intersect"), output, generate=fake_generate)
+        self.assertEqual(output.getvalue().split(), [b"Bw"])
+
+    def test_combine_rejects_other_enumerations(self):
+        """
+        Test that pass maps of different orders or shardings cannot be combined.
+        """
+        a = PassMap(3, "A", [RoaringBitmap([0])], [3])
+        b = PassMap(4, "B", [RoaringBitmap([0])], [11])
+        with self.assertRaises(ValueError):
+            combine([a, b], "union")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from results_index import IndexedResults, build_index, index_path
+
+class TestResultsIndex(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Create a temporary results file with 10 graphs of different lengths.
+        """
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "final_filtered_graphs.txt")
+        self.graphs = [f"G{'?' * (i % 4)}{i}" for i in range(10)]
+        with open(self.path, "w") as f:
+            f.write("".join(graph + "\n" for graph in self.graphs))
+
+    def tearDown(self):
+        """
+        Remove the temporary directory.
+        """
+        shutil.rmtree(self.tmp_dir)
+
+    def test_pages_match_the_file(self):
+        """
+        Test that every page read through the index matches the lines of the file,
+        including pages that start between two indexed lines or run past the end.
+        """
+        self.assertEqual(build_index(self.path, stride=3), 10)
+        results = IndexedResults(self.path)
+        self.assertEqual(results.count, 10)
+        for offset in range(12):
+            for limit in (1, 2, 5):
+                self.assertEqual(results.page(offset, limit), self.graphs[offset:offset + limit])
+
+    def test_missing_index_is_built(self):
+        """
+        Test that opening a results file without an index creates it.
+        """
+        results = IndexedResults(self.path)
+        self.assertTrue(os.path.exists(index_path(self.path)))
+        self.assertEqual(results.page(9, 5), self.graphs[9:])
+
+    def test_stale_index_is_rebuilt(self):
+        """
+        Test that an index built before the results file changed is not used.
+        """
+        build_index(self.path)
+        with open(self.path, "a") as f:
+            f.write("Bw\n")
+        results = IndexedResults(self.path)
+        self.assertEqual(results.count, 11)
+        self.assertEqual(results.page(10, 1), ["Bw"])
+
+    def test_concurrent_builds_write_a_whole_index(self):
+        """
+        Test that a build of the index running while another one is writing it leaves the
+        complete index of one of them and no temporary files behind.
+        """
+        build_index(self.path, stride=1)
+        with open(index_path(self.path), "rb") as f:
+            expected = f.read()
+
+        # Start a second build just before the first one moves its index into place
+        original_replace = os.replace
+        nested = []
+        def replace_after_another_build(src, dst):
+            if not nested:
+                nested.append(dst)
+                build_index(self.path, stride=3)
+            original_replace(src, dst)
+        with mock.patch("os.replace", replace_after_another_build):
+            build_index(self.path, stride=1)
+
+        with open(index_path(self.path), "rb") as f:
+            self.assertEqual(f.read(), expected)
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ["final_filtered_graphs.txt", "final_filtered_graphs.txt.idx"])
+
+    def test_empty_results(self):
+        """
+        Test that an empty results file has no pages.
+        """
+        open(self.path, "w").close()
+        results = IndexedResults(self.path)
+        self.assertEqual(results.count, 0)
+        self.assertEqual(results.page(0, 10), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import io
+import unittest
+from filter_graph import filter_stream
+from stats import StageTimer, Counter, Gauge, Histogram, STAGES, format_report
+
+class TestStats(unittest.TestCase):
+
+    def test_stage_timer_report(self):
+        """
+        Test that the report of a timed filter run covers every stage and the run's totals.
+        """
+        timer = StageTimer()
+        lines = [b"Bg", b"Bw", b"BW", b"Bo"]
+        rules = [{"degree_sum": 3, "type": "min", "count": 1}]
+        input_count, output_count, _, _ = filter_stream(lines, rules, io.BytesIO(), timer=timer)
+
+        stats = timer.report(input_count, output_count)
+        self.assertEqual(set(stats["stages"]), set(STAGES))
+        self.assertEqual(stats["pass_rate"], 0.75)
+        self.assertGreater(stats["peak_rss_kb"], 0)
+        stage_wall = sum(stage["wall_seconds"] for stage in stats["stages"].values())
+        self.assertLessEqual(stage_wall, stats["wall_seconds"] + 1e-5)
+        self.assertIn("pass rate 75.0000%", format_report(stats))
+
+    def test_stage_timer_empty_run(self):
+        """
+        Test that a run without any graphs reports a zero pass rate instead of failing.
+        """
+        stats = StageTimer().report(0, 0)
+        self.assertEqual(stats["pass_rate"], 0.0)
+
+    def test_counter_render(self):
+        """
+        Test that a counter sums increments per label set in the Prometheus text format.
+        """
+        counter = Counter("jobs_total", "Jobs.")
+        counter.inc(status="success")
+        counter.inc(2, status="success")
+        counter.inc(status="error")
+        self.assertEqual(counter.render().split("\n"), [
+            "# HELP jobs_total Jobs.",
+            "# TYPE jobs_total counter",
+            'jobs_total{status="error"} 1',
+            'jobs_total{status="success"} 3',
+        ])
+
+    def test_gauge_keeps_last_value(self):
+        """
+        Test that a gauge reports the last value set.
+        """
+        gauge = Gauge("rss_bytes", "Memory.")
+        gauge.set(10, worker="0")
+        gauge.set(5, worker="0")
+        self.assertIn('rss_bytes{worker="0"} 5', gauge.render())
+
+    def test_histogram_buckets_are_cumulative(self):
+        """
+        Test that histogram buckets count every observation up to their bound.
+        """
+        histogram = Histogram("duration_seconds", "Durations.", [1, 10])
+        for value in (0.5, 5, 50):
+            histogram.observe(value)
+        lines = histogram.render().split("\n")
+        self.assertIn('duration_seconds_bucket{le="1"} 1', lines)
+        self.assertIn('duration_seconds_bucket{le="10"} 2', lines)
+        self.assertIn('duration_seconds_bucket{le="+Inf"} 3', lines)
+        self.assertIn("duration_seconds_sum 55.5", lines)
+        self.assertIn("duration_seconds_count 3", lines)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,336 @@
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+import threading
+import subprocess
+from unittest import mock
+import web_server
+from history import HistoryEntry
+from history_management import load_history, save_history, HISTORY_FILE
+
+class TestWebServerCaching(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Serve images from a temporary folder containing a large and a small SVG image, and
+        read the history and the jobs from a temporary folder as well.
+        """
+        self.images_folder = tempfile.mkdtemp()
+        self.data_folder = tempfile.mkdtemp()
+        self.original_paths = (web_server.GRAPH_IMAGES_FOLDER, web_server.HISTORY_PATH, web_server.JOBS_FOLDER)
+        web_server.GRAPH_IMAGES_FOLDER = self.images_folder
+        web_server.HISTORY_PATH = os.path.join(self.data_folder, "history.txt")
+        web_server.JOBS_FOLDER = os.path.join(self.data_folder, "jobs")
+        self.svg = "<svg>" + "<circle/>" * 200 + "</svg>"
+        with open(os.path.join(self.images_folder, "large.svg"), "w") as f:
+            f.write(self.svg)
+        with open(os.path.join(self.images_folder, "small.svg"), "w") as f:
+            f.write("<svg/>")
+        self.client = web_server.app.test_client()
+
+    def tearDown(self):
+        """
+        Restore the paths and remove the temporary folders.
+        """
+        web_server.GRAPH_IMAGES_FOLDER, web_server.HISTORY_PATH, web_server.JOBS_FOLDER = self.original_paths
+        shutil.rmtree(self.images_folder)
+        shutil.rmtree(self.data_folder)
+
+    def test_versioned_image_is_immutable(self):
+        """
+        Test that the current version of an image is cached for a long time,
+        while other versions must be revalidated.
+        """
+        version = web_server.image_version(os.path.join(self.images_folder, "large.svg"))
+        response = self.client.get(f"/static/graph_images/large.svg?v={version}")
+        self.assertTrue(response.cache_control.immutable)
+        self.assertEqual(response.cache_control.max_age, web_server.IMAGE_MAX_AGE)
+
+        response = self.client.get("/static/graph_images/large.svg?v=outdated")
+        self.assertFalse(response.cache_control.immutable)
+        self.assertTrue(response.cache_control.no_cache)
+
+    def test_image_conditional_get(self):
+        """
+        Test that an image is answered with 304 when the client already has it.
+        """
+        response = self.client.get("/static/graph_images/large.svg")
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.last_modified)
+
+        response = self.client.get("/static/graph_images/large.svg", headers={"If-None-Match": response.headers["ETag"]})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b"")
+
+    def test_svg_is_compressed(self):
+        """
+        Test that large SVG images are gzip-compressed with their own ETag, and small ones are not.
+        """
+        plain = self.client.get("/static/graph_images/large.svg")
+        response = self.client.get("/static/graph_images/large.svg", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.data).decode(), self.svg)
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        self.assertNotEqual(response.headers["ETag"], plain.headers["ETag"])
+
+        response = self.client.get("/static/graph_images/large.svg",
+                                   headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get("/static/graph_images/small.svg", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", response.headers)
+
+    def test_images_are_rendered_concurrently(self):
+        """
+        Test that threads rendering images at the same time (as gunicorn's threads do) each get
+        a complete image of their own graph, without leftover temporary files.
+        """
+        graphs = ["Bg", "Bw", "BW", "DQc", "EUzW", "E?bg"] * 2
+        threads = [threading.Thread(target=web_server.get_image_url, args=(graph,)) for graph in graphs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        images = sorted(name for name in os.listdir(self.images_folder) if name.endswith(".png"))
+        self.assertEqual(images, ["BW.png", "Bg.png", "Bw.png", "DQc.png", "EUzW.png", "E_q_bg.png"])
+        for name in images:
+            with open(os.path.join(self.images_folder, name), "rb") as f:
+                data = f.read()
+            self.assertTrue(data.startswith(b"\x89PNG") and data.endswith(b"IEND\xaeB`\x82"))
+        self.assertFalse([name for name in os.listdir(self.images_folder) if name.endswith(".tmp")])
+
+    def test_html_conditional_get(self):
+        """
+        Test that HTML pages get an ETag and are answered with 304 while they do not change.
+        """
+        with open(web_server.HISTORY_PATH, "w") as f:
+            f.write(HistoryEntry(4, 2, "[]", ["Bw", "BW"]).to_line() + "\n")
+
+        response = self.client.get("/index", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.cache_control.no_cache)
+
+        response = self.client.get("/index", headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(sorted(os.listdir(self.images_folder)), ["BW.png", "Bw.png", "large.svg", "small.svg"])
+
+class TestWebServerJobs(unittest.TestCase):
+
+    # The graphs on 4 vertices, in geng's order
+    GRAPHS = ["C?", "CC", "CE", "CF", "CQ", "CU", "CT", "CV", "C]", "C^", "C~"]
+
+    def setUp(self):
+        """
+        Create a finished job with the 11 graphs on 4 vertices as its results, and a job
+        without results, in temporary folders. Pages hold 4 graphs by default and at most 5.
+        """
+        self.folder = tempfile.mkdtemp()
+        self.original_paths = (web_server.GRAPH_IMAGES_FOLDER, web_server.JOBS_FOLDER)
+        web_server.GRAPH_IMAGES_FOLDER = os.path.join(self.folder, "images")
+        web_server.JOBS_FOLDER = os.path.join(self.folder, "jobs")
+
+        for job_id, status in (("job-done", "complete"), ("job-running", "running")):
+            os.makedirs(os.path.join(web_server.JOBS_FOLDER, job_id))
+            web_server.save_job({"job_id": job_id, "vertices": 4, "filter": "[]", "limit": None,
+                                 "created": "2026-01-01 00:00:00", "status": status})
+        with open(os.path.join(web_server.JOBS_FOLDER, "job-done", web_server.FINAL_OUTPUT_NAME), "w") as f:
+            f.write("".join(graph + "\n" for graph in self.GRAPHS))
+
+        patches = [mock.patch.object(web_server, "PAGE_SIZE", 4), mock.patch.object(web_server, "MAX_PAGE_SIZE", 5)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.client = web_server.app.test_client()
+
+    def tearDown(self):
+        """
+        Restore the paths and remove the temporary folder.
+        """
+        web_server.GRAPH_IMAGES_FOLDER, web_server.JOBS_FOLDER = self.original_paths
+        shutil.rmtree(self.folder)
+
+    def get_page(self, job_id="job-done", **args):
+        """
+        Request a page of results and return the response and the graphs listed on it.
+        """
+        response = self.client.get(f"/jobs/{job_id}/results", query_string=args)
+        graphs = [graph for graph in self.GRAPHS if f"<td>{graph}</td>".encode() in response.data]
+        return response, graphs
+
+    def test_pages_cover_the_results(self):
+        """
+        Test that following the pages from the first one lists every graph once, in order,
+        and that only the images of the graphs on the page are generated.
+        """
+        response, graphs = self.get_page()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(graphs, self.GRAPHS[:4])
+        self.assertEqual(len(os.listdir(web_server.GRAPH_IMAGES_FOLDER)), 4)
+
+        listed = []
+        for offset in range(0, len(self.GRAPHS), 4):
+            response, graphs = self.get_page(offset=offset)
+            listed += graphs
+        self.assertEqual(listed, self.GRAPHS)
+        self.assertIn(b"Graphs 9 to 11 of 11", response.data)
+        self.assertNotIn(b">Next<", response.data)
+
+    def test_page_bounds(self):
+        """
+        Test a page that starts between two pages, one past the end of the results,
+        and a limit above the largest page size, which is capped.
+        """
+        response, graphs = self.get_page(offset=9, limit=4)
+        self.assertEqual(graphs, self.GRAPHS[9:])
+
+        response, graphs = self.get_page(offset=11)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(graphs, [])
+        self.assertIn(b"No graphs on this page (11 in total)", response.data)
+
+        response, graphs = self.get_page(limit=1000)
+        self.assertEqual(graphs, self.GRAPHS[:5])
+        self.assertIn(b"Graphs 1 to 5 of 11", response.data)
+
+    def test_invalid_page_is_refused(self):
+        """
+        Test that negative, zero and non-numeric offsets and limits are refused.
+        """
+        for args in ({"offset": -1}, {"limit": 0}, {"limit": -4}, {"offset": "x"}, {"limit": "1.5"}):
+            response, _ = self.get_page(**args)
+            self.assertEqual(response.status_code, 400)
+
+    def test_unknown_job(self):
+        """
+        Test that unknown job ids, and ids that are not valid job ids, are answered with 404,
+        while a job without results yet shows an empty page.
+        """
+        for job_id in ("job-missing", "..", "job%20done"):
+            response, _ = self.get_page(job_id)
+            self.assertEqual(response.status_code, 404)
+
+        response, graphs = self.get_page("job-running")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"No graphs on this page (0 in total)", response.data)
+
+class TestWebServerHistory(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Back up the existing history file, since the runs of these tests append to it.
+        """
+        self.output_dir = tempfile.mkdtemp()
+        self.backup = None
+        if os.path.exists(HISTORY_FILE):
+            with open(HISTORY_FILE, 'r') as f:
+                self.backup = f.read()
+            os.remove(HISTORY_FILE)
+        self.client = web_server.app.test_client()
+
+    def tearDown(self):
+        """
+        Remove the run's outputs and restore the history file.
+        """
+        shutil.rmtree(self.output_dir)
+        if self.backup is not None:
+            with open(HISTORY_FILE, 'w') as f:
+                f.write(self.backup)
+        elif os.path.exists(HISTORY_FILE):
+            os.remove(HISTORY_FILE)
+
+    def test_estimate_refuses_large_orders(self):
+        """
+        Test that estimates are refused for orders above the web limit or without a known
+        number of graphs, instead of sampling huge shards within the request.
+        """
+        form = {"degree_sum": "6", "filter_type": "min", "count": "3"}
+        for vertices in (web_server.ESTIMATE_MAX_ORDER + 1, 14, 16):
+            response = self.client.post("/estimate", data=dict(form, vertices=str(vertices)))
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("error", response.get_json())
+
+    def test_job_stats_ignore_concurrent_jobs(self):
+        """
+        Test that the statistics of a job only count the history entries of its own workers,
+        not those appended meanwhile by another job.
+        """
+        save_history([HistoryEntry(1, 1, "[]", ["Bg"], {"output_dir": "old"})])
+        offset = os.path.getsize(HISTORY_FILE)
+        save_history([
+            HistoryEntry(10, 4, "[]", ["Bg"], {"output_dir": "job_a"}),
+            HistoryEntry(100, 40, "[]", ["Bg"], {"output_dir": "job_b"}),
+            HistoryEntry(20, 6, "[]", ["Bw"], {"output_dir": "job_a"}),
+            HistoryEntry(1000, 400, "[]", ["Bg"]),
+        ])
+
+        original = web_server.GRAPHS
+        web_server.GRAPHS = web_server.Counter("test_graphs_total", "Graphs counted by this test.")
+        try:
+            web_server.record_job_stats("job_a", offset)
+            self.assertEqual(web_server.GRAPHS.values, {(("result", "input"),): 30, (("result", "passed"),): 10})
+        finally:
+            web_server.GRAPHS = original
+
+    def test_estimate_and_metrics(self):
+        """
+        Test that an estimate is computed in its own process and that its duration shows up
+        in the metrics, next to the other metrics of the server.
+        """
+        # A stand-in for geng printing the graphs on 4 vertices, which are filtered completely
+        bin_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, bin_dir)
+        with open(os.path.join(bin_dir, "geng"), "w") as f:
+            f.write("#!/bin/sh\nprintf '%s\\n' " + " ".join(f"'{graph}'" for graph in TestWebServerJobs.GRAPHS) + "\n")
+        os.chmod(os.path.join(bin_dir, "geng"), 0o755)
+
+        before = web_server.ESTIMATE_DURATION.count
+        with mock.patch.dict(os.environ, PATH=bin_dir + os.pathsep + os.environ["PATH"]):
+            response = self.client.post("/estimate", data={"vertices": "4", "degree_sum": "4", "filter_type": "min", "count": "2"})
+        self.assertEqual(response.status_code, 200)
+        result = response.get_json()
+        self.assertTrue(result["exact"])
+        self.assertEqual(result["total_graphs"], 11)
+        self.assertEqual(result["pass_count"]["estimate"], 4)
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith("text/plain"))
+        body = response.get_data(as_text=True)
+        for metric in web_server.METRICS:
+            self.assertIn(f"# TYPE {metric.name} ", body)
+        self.assertIn(f"shed_estimate_duration_seconds_count {before + 1}", body)
+
+    def test_index_after_bitmap_run(self):
+        """
+        Test that a run with --format bitmap saves a single history entry pointing at its
+        pass map, and that the index page still renders afterwards.
+        """
+        # A stand-in for geng giving every shard the graphs on 3 vertices
+        bin_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, bin_dir)
+        with open(os.path.join(bin_dir, "geng"), "w") as f:
+            f.write("#!/bin/sh\nprintf 'Bg\\nBw\\nBW\\n'\n")
+        os.chmod(os.path.join(bin_dir, "geng"), 0o755)
+
+        subprocess.run(
+            ["./run_filter_parallel.sh", "3", '[{"degree_sum": 3, "type": "min", "count": 1}]',
+             "--format", "bitmap", "--output-dir", self.output_dir],
+            env=dict(os.environ, PATH=bin_dir + os.pathsep + os.environ["PATH"]),
+            stdout=subprocess.DEVNULL, check=True
+        )
+
+        history = load_history()
+        self.assertEqual(len(history), 1)
+        self.assertEqual((history[0].input_number, history[0].output_number), (12, 8))
+        self.assertEqual(history[0].passed_graph_list, [])
+        self.assertEqual(history[0].metadata["passmap"], os.path.join(self.output_dir, "final_filtered_graphs.passmap"))
+
+        self.assertEqual(web_server.load_recent_graphs(), [])
+        response = self.client.get("/index")
+        self.assertEqual(response.status_code, 200)
+
+if __name__ == "__main__":
+    unittest.main()
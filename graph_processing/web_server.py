@@ -1,10 +1,20 @@
 
-from flask import Flask, render_template, request, redirect, url_for
-from flask import send_from_directory
+from flask import Flask, render_template, request, redirect, url_for, jsonify, abort
+from flask import send_from_directory, Response
 import subprocess
+import secrets
+import hashlib
+import gzip
+import time
+import re
 import os
+import sys
 from datetime import datetime
 from export_graph6toImage import export_graph_image
+from estimate_filter import GRAPH_COUNTS
+from stats import Counter, Gauge, Histogram, STAGES
+from results_index import IndexedResults
+from checkpoint import FINAL_OUTPUT_NAME
 import json
 
 """
@@ -12,12 +22,23 @@ Flask web server for the Shed of Graphs project.
 
 This app allows users to:
 - Submit graph filtering jobs based on degree-sum rules
+- Estimate the outcome and runtime of a filtering job before submitting it
 - View recently processed graphs from history
+- Browse the full results of every job page by page (/jobs/<id>/results)
+- Monitor job latencies and per-stage filter timings (Prometheus format, /metrics)
 - Automatically generate and serve images of filtered graphs
 
+For production, run the app with gunicorn as a single worker process serving requests from
+several threads (see gunicorn.conf.py and the Dockerfile): the metrics are kept in the memory
+of that process, and the handlers it runs concurrently must be thread-safe. Responses carry cache validators (ETag, Last-Modified) and answer conditional
+GETs with 304; graph images are served from versioned URLs with a long-lived immutable
+Cache-Control, and HTML, SVG and other text responses are gzip-compressed.
+
 Depends on:
 - filter_graph.py for graph filtering
 - run_filter_parallel.sh to run filtering in parallel
+- estimate_filter.py to estimate a filtering job from a sample of geng shards
+- results_index.py to read any page of a job's results with a seek
 - export_graph_image() to generate graph images
 """
 
@@ -28,6 +49,43 @@ app = Flask(__name__)
 HISTORY_PATH = os.path.expanduser("./history.txt")
 GRAPH_IMAGES_FOLDER = os.path.join(os.path.expanduser("~"), "ShedOfGraphs", "graph_processing", "graph_images")
 
+# Every job submitted through the web form gets its own folder with its results and their index
+JOBS_FOLDER = os.path.join("graph_batches", "web")
+JOB_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
+JOB_FILE_NAME = "job.json"
+
+# Number of graphs per page of results by default, and at most
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Responses of these types are gzip-compressed for clients accepting it, if they are large enough
+COMPRESSIBLE_TYPES = {"text/html", "text/plain", "text/css", "application/json", "application/javascript", "image/svg+xml"}
+MIN_COMPRESS_SIZE = 500
+
+# Browsers keep versioned image URLs for a year without asking again
+IMAGE_MAX_AGE = 365 * 24 * 3600
+
+# Content digests of the images, by path, with the modification time and size they were computed for
+image_digests = {}
+
+# Number of geng shards sampled for an estimate (kept small so the form stays responsive).
+# Estimates run in their own process, sample at most ESTIMATE_MAX_GRAPHS graphs and are only
+# offered up to ESTIMATE_MAX_ORDER vertices (larger orders need estimate_filter.py)
+ESTIMATE_SAMPLES = 4
+ESTIMATE_MAX_ORDER = 11
+ESTIMATE_MAX_GRAPHS = 500000
+ESTIMATE_TIMEOUT = 120
+
+# Prometheus metrics of the jobs run by this server process
+LATENCY_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+JOB_DURATION = Histogram("shed_job_duration_seconds", "Duration of filter jobs submitted through the web form.", LATENCY_BUCKETS)
+ESTIMATE_DURATION = Histogram("shed_estimate_duration_seconds", "Duration of filter estimates.", LATENCY_BUCKETS)
+JOBS = Counter("shed_jobs_total", "Filter jobs submitted through the web form, by outcome.")
+GRAPHS = Counter("shed_graphs_total", "Graphs handled by the filter jobs, by result (input or passed).")
+STAGE_SECONDS = Counter("shed_stage_seconds_total", "Time spent in each stage of the filter loop of the jobs, by stage and clock (wall or cpu).")
+WORKER_PEAK_RSS = Gauge("shed_worker_peak_rss_bytes", "Peak resident memory of the filter workers of the last job, by worker.")
+METRICS = (JOB_DURATION, ESTIMATE_DURATION, JOBS, GRAPHS, STAGE_SECONDS, WORKER_PEAK_RSS)
+
 # Ensure the images folder exists
 os.makedirs(GRAPH_IMAGES_FOLDER, exist_ok=True)
 
@@ -44,12 +102,18 @@ def load_recent_graphs():
     # Open and parse each line in the history file
     with open(HISTORY_PATH, "r") as f:
         for line in f:
-            # Each line is expected to contain exactly 5 tab-separated fields
-            parts = line.strip().split('\t')
-            if len(parts) != 5:
+            # Each line is expected to contain 5 tab-separated fields, plus an optional metadata field
+            parts = line.rstrip('\n').split('\t')
+            if len(parts) not in (5, 6):
                 continue # Skip lines that are malformed
 
-            timestamp_str, _, _, filter_used, graph6_list = parts
+            timestamp_str, _, _, filter_used, graph6_list = parts[:5]
+
+            # Parse the optional metadata to know whether the run was truncated by a limit
+            try:
+                metadata = json.loads(parts[5]) if len(parts) == 6 else {}
+            except json.JSONDecodeError:
+                continue
 
             # Parse the timestamp; skip the line if it fails
             try:
@@ -57,13 +121,15 @@ def load_recent_graphs():
             except ValueError:
                 continue
             
-            # Each passed graph is listed in graph6 format, separated by commas
-            graphs = graph6_list.split(',')
+            # Each passed graph is listed in graph6 format, separated by commas. Entries without
+            # graphs (e.g. of runs with --format bitmap, which keep a pass map instead) are skipped
+            graphs = [graph for graph in graph6_list.split(',') if graph]
             for graph in graphs:
                 entries.append({
                     "timestamp": timestamp,
                     "graph6": graph,
-                    "filter": filter_used
+                    "filter": filter_used,
+                    "truncated": metadata.get("truncated", False)
                 })
 
     # Sort all collected graph entries by timestamp (most recent first)
@@ -72,9 +138,67 @@ def load_recent_graphs():
     # Return the 20 most recent graph entries
     return entries[:20]
 
+def record_job_stats(job_dir, history_offset):
+    """
+    Adds the statistics of the history entries of a job to the metrics. Jobs are run with
+    --stats, so every worker's entry contains its per-stage timings.
+
+    Only the entries written since `history_offset` (the size of the history file before the
+    job started) whose `output_dir` is the job's folder (`job_dir`, an absolute path, as the
+    runner records it) are counted, since other jobs running at the same time append their
+    entries as well.
+    """
+    if not os.path.exists(HISTORY_PATH):
+        return
+
+    with open(HISTORY_PATH, "r") as f:
+        f.seek(history_offset)
+        lines = f.readlines()
+
+    worker = 0
+    for line in lines:
+        parts = line.rstrip('\n').split('\t')
+        if len(parts) != 6:
+            continue
+        try:
+            metadata = json.loads(parts[5])
+        except json.JSONDecodeError:
+            continue
+        if not isinstance(metadata, dict) or metadata.get("output_dir") != job_dir:
+            continue
+
+        GRAPHS.inc(int(parts[1]), result="input")
+        GRAPHS.inc(int(parts[2]), result="passed")
+        worker_stats = [metadata["stats"]] if "stats" in metadata else metadata.get("shard_stats", [])
+        for stats in worker_stats:
+            for stage in STAGES:
+                STAGE_SECONDS.inc(stats["stages"][stage]["wall_seconds"], stage=stage, clock="wall")
+                STAGE_SECONDS.inc(stats["stages"][stage]["cpu_seconds"], stage=stage, clock="cpu")
+            WORKER_PEAK_RSS.set(stats["peak_rss_kb"] * 1024, worker=str(stats.get("shard", worker)))
+        worker += 1
+
+def image_version(image_path):
+    """
+    Returns a digest of the content of an image, used to make its URL content-addressed.
+
+    Digests are cached until the file's modification time or size changes.
+    """
+    stat = os.stat(image_path)
+    cached = image_digests.get(image_path)
+    if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+
+    with open(image_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:16]
+    image_digests[image_path] = (stat.st_mtime_ns, stat.st_size, digest)
+    return digest
+
 def get_image_url(graph6_str):
     """
     Generates the image for the graph if it doesn't already exist and returns the image URL.
+
+    The URL contains a digest of the image (`?v=...`), so it changes whenever the image does
+    and browsers can cache it indefinitely.
     """
     # Sanitize the graph6 string so it can safely be used as a filename
     safe_graph_name = graph6_str.replace("?", "_q_").replace("/", "_slash_")
@@ -87,7 +211,35 @@ def get_image_url(graph6_str):
         export_graph_image(graph6_str, "png", GRAPH_IMAGES_FOLDER)
     
     # Return the relative URL used by the Flask route to serve this image
-    return f"/static/graph_images/{safe_graph_name}.png"
+    return f"/static/graph_images/{safe_graph_name}.png?v={image_version(image_path)}"
+
+def load_job(job_id):
+    """
+    Returns the description of a web job (its parameters and status), or `None` if there is no such job.
+    """
+    if not JOB_ID_PATTERN.fullmatch(job_id):
+        return None
+    try:
+        with open(os.path.join(JOBS_FOLDER, job_id, JOB_FILE_NAME), "r") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+def save_job(job):
+    """
+    Writes the description of a web job to its folder.
+    """
+    with open(os.path.join(JOBS_FOLDER, job["job_id"], JOB_FILE_NAME), "w") as f:
+        json.dump(job, f)
+
+def load_recent_jobs(count=10):
+    """
+    Returns the descriptions of the most recent web jobs (job ids start with their creation time).
+    """
+    if not os.path.isdir(JOBS_FOLDER):
+        return []
+    jobs = (load_job(job_id) for job_id in sorted(os.listdir(JOBS_FOLDER), reverse=True))
+    return [job for job in jobs if job is not None][:count]
 
 @app.route("/index")
 def index():
@@ -101,28 +253,71 @@ def index():
     for graph in recent_graphs:
         graph["image_url"] = get_image_url(graph["graph6"])
     
-    # Render the template with the graph data
-    return render_template("index.html", graphs=recent_graphs)
+    # Render the template with the graph data and links to the full results of recent jobs
+    return render_template("index.html", graphs=recent_graphs, jobs=load_recent_jobs())
 
-@app.route("/filter_graphs", methods=["POST"])
-def filter_graphs():
+@app.route("/jobs/<job_id>/results")
+def job_results(job_id):
     """
-    Handles the form submission to filter graphs based on user input and generate the filter string.
+    Renders one page of the results of a job, given by the `offset` of its first graph and
+    the `limit` on the number of graphs. The page is read from the job's indexed results
+    file with a seek, and only the images of the graphs on the page are generated.
     """
-    # Extract the form fields
+    job = load_job(job_id)
+    if job is None:
+        abort(404)
+
     try:
-        vertices = int(request.form["vertices"])
-        degree_sum = int(request.form["degree_sum"])
-        filter_type = request.form["filter_type"]
-        count = int(request.form["count"])
+        offset = int(request.args.get("offset", 0))
+        limit = int(request.args.get("limit", PAGE_SIZE))
+    except ValueError:
+        return "Invalid offset or limit", 400
+    if offset < 0 or limit <= 0:
+        return "Invalid offset or limit", 400
+    limit = min(limit, MAX_PAGE_SIZE)
 
-        # Validate that no value is negative
-        if vertices < 0 or degree_sum < 0 or count < 0:
-            raise ValueError("Input values must be non-negative")
+    # A job that failed or is still running may not have results yet
+    results_path = os.path.join(JOBS_FOLDER, job_id, FINAL_OUTPUT_NAME)
+    if os.path.exists(results_path):
+        results = IndexedResults(results_path)
+        total, page = results.count, results.page(offset, limit)
+    else:
+        total, page = 0, []
 
-    except (ValueError, TypeError):
-        # Handle invalid inputs (negative values or wrong data types)
-        return "Invalid input, all values must be non-negative integers", 400
+    graphs = [
+        {"index": offset + i, "graph6": graph6, "image_url": get_image_url(graph6)}
+        for i, graph6 in enumerate(page)
+    ]
+    return render_template(
+        "results.html", job=job, graphs=graphs, total=total, offset=offset, limit=limit,
+        previous_offset=max(offset - limit, 0) if offset > 0 else None,
+        next_offset=offset + limit if offset + limit < total else None
+    )
+
+def parse_filter_form(form):
+    """
+    Extracts and validates the filter form fields and builds the filter string.
+
+    Returns:
+        tuple: `(vertices, filter_string, limit)` where `limit` is `None` if no limit was given.
+
+    Raises:
+        ValueError: If a value is not a non-negative integer (or the limit is not positive).
+    """
+    vertices = int(form["vertices"])
+    degree_sum = int(form["degree_sum"])
+    filter_type = form["filter_type"]
+    count = int(form["count"])
+
+    # Optional limit on the number of passing graphs; an empty field means no limit
+    limit = form.get("limit", "").strip()
+    limit = int(limit) if limit else None
+
+    # Validate that no value is negative
+    if vertices < 0 or degree_sum < 0 or count < 0:
+        raise ValueError("Input values must be non-negative")
+    if limit is not None and limit <= 0:
+        raise ValueError("Limit must be positive")
 
     # Build the filter rules JSON
     filter_rule = [{
@@ -130,38 +325,172 @@ def filter_graphs():
         "type": filter_type,
         "count": count
     }]
-    
-    filter_string = json.dumps(filter_rule)
 
-    # Define the shell command to run the filtering script
+    return vertices, json.dumps(filter_rule), limit
+
+@app.route("/estimate", methods=["POST"])
+def estimate():
+    """
+    Estimates the pass count, pass rate and runtime of the submitted filter from a sample
+    of geng shards, so the user can decide whether to start the full run.
+    """
+    try:
+        vertices, filter_string, _ = parse_filter_form(request.form)
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid input, all values must be non-negative integers"}), 400
+    if vertices not in GRAPH_COUNTS or vertices > ESTIMATE_MAX_ORDER:
+        return jsonify({"error": f"Estimates are available for up to {ESTIMATE_MAX_ORDER} vertices"}), 400
+
+    # Run the estimate in its own process, so it can be stopped when it takes too long
+    command = [
+        sys.executable, "estimate_filter.py", str(vertices), filter_string,
+        "--samples", str(ESTIMATE_SAMPLES),
+        "--max-graphs", str(ESTIMATE_MAX_GRAPHS),
+        "--json"
+    ]
+    start = time.perf_counter()
+    try:
+        completed = subprocess.run(command, capture_output=True, text=True, check=True, timeout=ESTIMATE_TIMEOUT)
+        result = json.loads(completed.stdout)
+    except subprocess.TimeoutExpired:
+        return jsonify({"error": f"The estimate took longer than {ESTIMATE_TIMEOUT} seconds"}), 504
+    except (OSError, ValueError, subprocess.CalledProcessError) as e:
+        print(f"Error estimating the filter: {e}")
+        return jsonify({"error": "Error estimating the filter"}), 500
+    finally:
+        ESTIMATE_DURATION.observe(time.perf_counter() - start)
+
+    return jsonify(result)
+
+@app.route("/filter_graphs", methods=["POST"])
+def filter_graphs():
+    """
+    Handles the form submission to filter graphs based on user input and generate the filter string.
+    """
+    # Extract the form fields
+    try:
+        vertices, filter_string, limit = parse_filter_form(request.form)
+    except (ValueError, TypeError):
+        # Handle invalid inputs (negative values or wrong data types)
+        return "Invalid input, all values must be non-negative integers", 400
+
+    # Give the job its own folder, so its results can be browsed later
+    job = {
+        "job_id": datetime.now().strftime("%Y%m%d-%H%M%S-") + secrets.token_hex(3),
+        "vertices": vertices,
+        "filter": filter_string,
+        "limit": limit,
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "status": "running"
+    }
+    job_dir = os.path.join(JOBS_FOLDER, job["job_id"])
+    os.makedirs(job_dir)
+    save_job(job)
+
+    # Define the shell command to run the filtering script. Images are not exported by the
+    # job; they are generated when a page of the results is viewed
     command = [
         "./run_filter_parallel.sh",  # Path to the shell script
         str(vertices),               # Pass the number of vertices
         filter_string,               # Pass the filter string
-        "--export",                  # Option to export images
-        "./graph_images",            # Directory for image export
-        "--image",                   # Image format option
-        "png"                        # Image format
+        "--output-dir",              # Folder for the results of this job
+        job_dir,
+        "--stats"                    # Measure the workers for /metrics
     ]
+
+    # Stop the filter as soon as enough graphs were found
+    if limit is not None:
+        command += ["--limit", str(limit)]
     
+    # Remember where the history ends, to find the entries written by this job
+    history_offset = os.path.getsize(HISTORY_PATH) if os.path.exists(HISTORY_PATH) else 0
+    start = time.perf_counter()
     try:
         # Run the command using subprocess
         subprocess.run(command, check=True)
         print("Filter executed successfully")
     except subprocess.CalledProcessError as e:
         print(f"Error executing the filter: {e}")
+        JOBS.inc(status="error")
+        job["status"] = "error"
+        save_job(job)
         return "Error executing the filter", 500
+    finally:
+        JOB_DURATION.observe(time.perf_counter() - start)
+
+    JOBS.inc(status="success")
+    record_job_stats(os.path.abspath(job_dir), history_offset)
+    job["status"] = "complete"
+    save_job(job)
+
+    # After processing, redirect to the first page of the job's results
+    return redirect(url_for('job_results', job_id=job["job_id"]))
 
-    # After processing, redirect to the index page to view the results
-    return redirect(url_for('index'))
+@app.route("/metrics")
+def metrics():
+    """
+    Exposes the job latencies and filter statistics in the Prometheus text format.
+    """
+    body = "\n".join(metric.render() for metric in METRICS) + "\n"
+    return Response(body, mimetype="text/plain; version=0.0.4")
 
 # Serve images from the 'graph_images' folder under '/static/graph_images'
 @app.route("/static/graph_images/<filename>")
 def serve_image(filename):
     """
     Serves a requested graph image file from the local graph_images directory.
+
+    send_from_directory() adds an ETag and Last-Modified and answers conditional requests.
+    A request for the current version of the image (`?v=<digest>`) is marked as immutable.
+    """
+    response = send_from_directory(GRAPH_IMAGES_FOLDER, filename)
+
+    version = request.args.get("v")
+    if version and version == image_version(os.path.join(GRAPH_IMAGES_FOLDER, filename)):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = IMAGE_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+@app.after_request
+def compress_and_validate(response):
     """
-    return send_from_directory(GRAPH_IMAGES_FOLDER, filename)
+    Compresses text and SVG responses with gzip for clients that accept it, and adds an ETag
+    to HTML pages, so that repeated GETs of unchanged content are answered with 304.
+    """
+    if request.method not in ("GET", "HEAD") or response.status_code != 200:
+        return response
+
+    if response.mimetype in COMPRESSIBLE_TYPES:
+        response.vary.add("Accept-Encoding")
+        if "gzip" in request.headers.get("Accept-Encoding", "") and "Content-Encoding" not in response.headers:
+            # The compressed variant of a file needs its own validator; if the client already
+            # has it, answer 304 without reading and compressing the file
+            etag, weak = response.get_etag()
+            if etag:
+                response.set_etag(f"{etag}-gzip", weak)
+                if request.if_none_match.contains_weak(f"{etag}-gzip"):
+                    return response.make_conditional(request)
+
+            # Files are streamed by default; read them to compress them
+            response.direct_passthrough = False
+            data = response.get_data()
+            if len(data) >= MIN_COMPRESS_SIZE:
+                # mtime=0 makes the compressed body, and so the ETag of HTML pages, reproducible
+                response.set_data(gzip.compress(data, compresslevel=6, mtime=0))
+                response.headers["Content-Encoding"] = "gzip"
+                response.headers.pop("Accept-Ranges", None)  # byte ranges would refer to the uncompressed file
+            elif etag:
+                response.set_etag(etag, weak)
+
+    # Pages are generated on every request; let browsers revalidate them with their ETag
+    if response.mimetype == "text/html":
+        response.cache_control.no_cache = True
+        if not response.get_etag()[0]:
+            response.add_etag()
+
+    return response.make_conditional(request)
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
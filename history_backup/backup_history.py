@@ -2,48 +2,263 @@
 """
 backup_history.py
 
-This script creates a timestamped backup of the history file used in ShedOfGraphs.
+This script creates an incremental backup of the history file used in ShedOfGraphs.
 
 - Source file: ~/ShedOfGraphs/graph_processing/history.txt
 - Backup destination: ~/ShedOfGraphs/.filtered-graphs/
-- Backup filename format: history_YYYYMMDD_HHMM.txt
+- Backup layout: gzip-compressed segments (segment_00000.gz, ...) and a manifest.json
+
+The history file only ever grows by appends, so instead of copying the whole file every time,
+each backup stores only the bytes appended since the previous one, as a compressed "delta"
+segment. A "base" segment holds the whole file and starts a new chain of deltas. The history
+at the time of any backup (a snapshot) is the base of its chain followed by the chain's
+deltas up to that backup, which restore_history.py streams back together.
 
 The script ensures that:
-- The backup directory exists or is created.
-- It does not overwrite previous backups by including the current timestamp in the filename.
-- If the source history file does not exist, an error is displayed.
+- Nothing is stored if the history did not change since the last backup.
+- A new base is written (full compaction) when the deltas of the current chain add up to the
+  size of its base, or when the chain is `MAX_CHAIN_DELTAS` deltas long. Bases then grow
+  geometrically, so the backups take space proportional to the history itself, and restoring
+  any snapshot reads at most about twice its size.
+- A new base is also written if the history no longer starts with the backed up bytes
+  (e.g. it was edited or replaced), or when asked for with --compact.
+- The manifest records the SHA-256 of every segment and of the whole history at every
+  snapshot, so a restore can verify what it rebuilds.
+- Segments and the manifest are written to temporary files first, so an interrupted backup
+  never leaves a broken manifest behind.
+
+Manifest format:
+    {"version": 1, "segments": [{"id": 0, "file": "segment_00000.gz", "kind": "base",
+      "base": 0, "offset": 0, "length": 1234, "sha256": "...", "history_size": 1234,
+      "history_sha256": "...", "created": "2026-10-19 14:00:00"}, ...]}
 
-This backup ensures that past graph processing history is preserved for future reference or recovery.
+Usage:
+    python3 backup_history.py [--source <history.txt>] [--backup-dir <folder>] [--compact]
 """
 
 import os
-import shutil
+import sys
+import gzip
+import json
+import hashlib
+import argparse
 from datetime import datetime
 
-def main():
+SOURCE_FILE = os.path.expanduser('~/ShedOfGraphs/graph_processing/history.txt')
+BACKUP_DIR = os.path.expanduser('~/ShedOfGraphs/.filtered-graphs/')
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+# A new base is written once the deltas of a chain add up to COMPACT_RATIO times its base,
+# or once a chain has MAX_CHAIN_DELTAS deltas (a week of hourly backups)
+COMPACT_RATIO = 1.0
+MAX_CHAIN_DELTAS = 168
+
+# Size of the blocks the history is read and hashed in
+BLOCK_SIZE = 1 << 20
+
+def manifest_path(backup_dir):
     """
-    Main function to perform the backup operation.
+    Returns the path of the manifest in a backup directory.
+    """
+    return os.path.join(backup_dir, MANIFEST_NAME)
+
+def load_manifest(backup_dir):
+    """
+    Loads the manifest of a backup directory.
+
+    Returns:
+        dict: The manifest, with an empty list of segments if there are no backups yet.
+
+    Raises:
+        ValueError: If the manifest is not a valid manifest of this version.
+    """
+    try:
+        with open(manifest_path(backup_dir), 'r') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {"version": MANIFEST_VERSION, "segments": []}
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid manifest {manifest_path(backup_dir)}: {e}")
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported manifest version: {manifest.get('version')}")
+    return manifest
+
+def save_manifest(backup_dir, manifest):
+    """
+    Writes the manifest of a backup directory atomically.
+    """
+    tmp_path = f"{manifest_path(backup_dir)}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, manifest_path(backup_dir))
+
+def chain(manifest, segment_id):
+    """
+    Returns the segments needed to rebuild the history of a snapshot: the base of its chain
+    followed by the chain's deltas up to and including the snapshot's segment.
+
+    Args:
+        manifest (dict): The manifest of the backup directory.
+        segment_id (int): The id of the snapshot's segment.
+
+    Returns:
+        list: The segment entries, in order.
+    """
+    segments = {segment["id"]: segment for segment in manifest["segments"]}
+    target = segments[segment_id]
+    return [segment for segment in manifest["segments"]
+            if segment["base"] == target["base"] and segment["id"] <= segment_id]
+
+def hash_prefix(f, length, digest):
+    """
+    Feeds the first `length` bytes of an open file into `digest`.
+
+    Returns:
+        bool: `False` if the file is shorter than `length` bytes.
     """
-    # Define source and destination paths
-    source_file = os.path.expanduser('~/ShedOfGraphs/graph_processing/history.txt')
-    backup_dir = os.path.expanduser('~/ShedOfGraphs/.filtered-graphs/')
+    remaining = length
+    while remaining > 0:
+        block = f.read(min(BLOCK_SIZE, remaining))
+        if not block:
+            return False
+        digest.update(block)
+        remaining -= len(block)
+    return True
 
-    # Ensure that the backup directory exists
+def write_segment(f, backup_dir, segment_id, length, history_digest):
+    """
+    Compresses the next `length` bytes of an open file into a new segment file.
+
+    Args:
+        f (file): The history file, positioned at the start of the segment.
+        backup_dir (str): The backup directory.
+        segment_id (int): The id of the new segment.
+        length (int): The number of bytes to store.
+        history_digest (hashlib._Hash): The digest of the whole history, updated with the
+                                        stored bytes.
+
+    Returns:
+        tuple: `(file_name, sha256)` of the segment, the checksum being that of its
+               uncompressed bytes.
+    """
+    file_name = f"segment_{segment_id:05d}.gz"
+    tmp_path = os.path.join(backup_dir, f"{file_name}.tmp")
+    segment_digest = hashlib.sha256()
+
+    with gzip.open(tmp_path, 'wb', compresslevel=6) as out:
+        remaining = length
+        while remaining > 0:
+            block = f.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                raise OSError("The history file was truncated during the backup")
+            segment_digest.update(block)
+            history_digest.update(block)
+            out.write(block)
+            remaining -= len(block)
+
+    os.replace(tmp_path, os.path.join(backup_dir, file_name))
+    return file_name, segment_digest.hexdigest()
+
+def backup(source_file, backup_dir, compact=False):
+    """
+    Backs up the history file incrementally.
+
+    Args:
+        source_file (str): The history file.
+        backup_dir (str): The backup directory (created if needed).
+        compact (bool): Whether to write a new base even if a delta would do.
+
+    Returns:
+        dict: The manifest entry of the new segment, or `None` if the history did not change.
+
+    Raises:
+        FileNotFoundError: If the history file does not exist.
+        ValueError: If the manifest is invalid.
+    """
     os.makedirs(backup_dir, exist_ok=True)
+    manifest = load_manifest(backup_dir)
+    segments = manifest["segments"]
+    last = segments[-1] if segments else None
+
+    with open(source_file, 'rb') as f:
+        # Only back up what was written so far, even if a filter run appends meanwhile
+        size = os.fstat(f.fileno()).st_size
+        history_digest = hashlib.sha256()
 
-    # Generate a unique backup filename based on the current date and time
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M')
-    backup_filename = f'history_{timestamp}.txt'
-    backup_path = os.path.join(backup_dir, backup_filename)
+        # The history can only be extended by a delta if it still starts with the backed up bytes
+        appended = (last is not None and size >= last["history_size"]
+                    and hash_prefix(f, last["history_size"], history_digest)
+                    and history_digest.hexdigest() == last["history_sha256"])
+        if appended and size == last["history_size"] and not compact:
+            return None
 
-    # Attempt to copy the source file to the backup location
+        if appended and not compact:
+            chain_segments = chain(manifest, last["id"])
+            base_length = chain_segments[0]["length"]
+            delta_length = sum(segment["length"] for segment in chain_segments[1:]) + size - last["history_size"]
+            compact = delta_length >= COMPACT_RATIO * base_length or len(chain_segments) > MAX_CHAIN_DELTAS
+
+        segment_id = last["id"] + 1 if last else 0
+        if appended and not compact:
+            kind, base, offset = "delta", last["base"], last["history_size"]
+        else:
+            # Full snapshot: hash and store the whole file from the start
+            kind, base, offset = "base", segment_id, 0
+            f.seek(0)
+            history_digest = hashlib.sha256()
+
+        file_name, sha256 = write_segment(f, backup_dir, segment_id, size - offset, history_digest)
+
+    segment = {
+        "id": segment_id,
+        "file": file_name,
+        "kind": kind,
+        "base": base,
+        "offset": offset,
+        "length": size - offset,
+        "sha256": sha256,
+        "history_size": size,
+        "history_sha256": history_digest.hexdigest(),
+        "created": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    segments.append(segment)
+    save_manifest(backup_dir, manifest)
+    return segment
+
+def parse_args():
+    """
+    Parses command line arguments for backing up the history file.
+
+    Returns:
+        argparse.Namespace: Parsed command line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Incrementally back up the history file.')
+    parser.add_argument('--source', type=str, default=SOURCE_FILE, help="The history file to back up.")
+    parser.add_argument('--backup-dir', type=str, default=BACKUP_DIR, help="The folder of the backups and their manifest.")
+    parser.add_argument('--compact', action='store_true', help="Write a full snapshot, starting a new chain of deltas.")
+    return parser.parse_args()
+
+def main():
+    """
+    Main function to perform the backup operation.
+    """
+    args = parse_args()
     try:
-        shutil.copyfile(source_file, backup_path)
-        print(f"Backup created successfully: {backup_path}")
+        segment = backup(args.source, args.backup_dir, args.compact)
     except FileNotFoundError:
-        print("Error: Source history file not found.")
-    except Exception as e:
-        print(f"Unexpected error during backup: {e}")
+        print("Error: Source history file not found.", file=sys.stderr)
+        sys.exit(1)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if segment is None:
+        print("History unchanged since the last backup, nothing to store.")
+    else:
+        print(f"Backup created successfully: {segment['kind']} segment {segment['file']} "
+              f"({segment['length']} bytes, history size {segment['history_size']} bytes)")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
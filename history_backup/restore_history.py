@@ -2,54 +2,223 @@
 """
 restore_history.py
 
-This script restores the history file from one of the available backups in ShedOfGraphs.
+This script restores the history file from the incremental backups made by backup_history.py.
 
-- Backup directory: ~/.filtered-graphs/
-- Source file: ~/ShedOfGraphs/graph_processing/history.txt
-- Backup filename format: history_YYYYMMDD_HHMM.txt
+- Backup directory: ~/ShedOfGraphs/.filtered-graphs/ (manifest.json and segment_*.gz)
+- Restored file: ~/ShedOfGraphs/graph_processing/history.txt
 
-The script lists all available backups in the backup directory, allows the user to select a backup, 
-and then restores the selected backup over the current history file (~/ShedOfGraphs/graph_processing/history.txt).
-If no backups are found, an error message will be displayed.
-Important: This operation overwrites the current history file with the selected backup.
-"""
+Every backup is a snapshot of the history at the time it was made. The script lists the
+snapshots and lets the user select one, or restores the one given with --snapshot, or the
+latest one made at or before the time given with --at. The history of the snapshot is rebuilt
+by streaming the base segment of its chain followed by its deltas, checking the size and the
+SHA-256 of every segment and of the whole result against the manifest.
+
+Full copies from older versions of backup_history.py (history_YYYYMMDD_HHMM.txt) are listed
+as well and restored as they are.
 
+The restored history is written to a temporary file first and only then replaces the target,
+so a failed restore leaves the current history untouched.
+Important: This operation overwrites the current history file with the selected snapshot.
+
+Usage:
+    python3 restore_history.py [--list] [--snapshot <id> | --at "YYYY-MM-DD HH:MM"] [--output <file>] [--backup-dir <folder>]
+"""
 
 import os
+import sys
+import gzip
 import shutil
+import hashlib
+import argparse
+from datetime import datetime
 
-# Paths
-backup_dir = os.path.expanduser('~/ShedOfGraphs/.filtered-graphs/')
-source_file = os.path.expanduser('~/ShedOfGraphs/graph_processing/history.txt')
+from backup_history import BACKUP_DIR, SOURCE_FILE, BLOCK_SIZE, load_manifest, chain
 
-# List all backup files (history_*.txt)
-try:
-    backups = [f for f in os.listdir(backup_dir) if f.startswith('history_') and f.endswith('.txt')]
-    
-    if not backups:
-        print("No backup files found in the backup directory.")
-        exit()
+def list_snapshots(backup_dir):
+    """
+    Lists the snapshots of a backup directory, oldest first.
+
+    Returns:
+        list: `(created, description, segment_id, legacy_file)` tuples, where `segment_id` is
+              set for incremental snapshots and `legacy_file` for full copies.
+    """
+    snapshots = []
+    for segment in load_manifest(backup_dir)["segments"]:
+        description = f"snapshot {segment['id']} ({segment['kind']}, {segment['history_size']} bytes)"
+        snapshots.append((segment["created"], description, segment["id"], None))
+
+    # Full copies made before backups were incremental: history_YYYYMMDD_HHMM.txt
+    for file_name in os.listdir(backup_dir):
+        if file_name.startswith('history_') and file_name.endswith('.txt'):
+            try:
+                created = datetime.strptime(file_name, 'history_%Y%m%d_%H%M.txt').strftime('%Y-%m-%d %H:%M:%S')
+            except ValueError:
+                continue
+            snapshots.append((created, f"full copy {file_name}", None, file_name))
+
+    snapshots.sort(key=lambda snapshot: snapshot[0])
+    return snapshots
+
+def snapshot_at(snapshots, when):
+    """
+    Returns the latest snapshot made at or before the minute `when` (a datetime), or `None`.
+    """
+    minute = when.strftime('%Y-%m-%d %H:%M')
+    latest = None
+    for snapshot in snapshots:
+        if snapshot[0][:16] <= minute:
+            latest = snapshot
+    return latest
+
+def rebuild(backup_dir, segment_id, output):
+    """
+    Streams the history of a snapshot into a binary output, verifying it on the way.
+
+    Args:
+        backup_dir (str): The backup directory.
+        segment_id (int): The id of the snapshot's segment.
+        output (file): A writable binary file object.
+
+    Returns:
+        int: The number of bytes written.
+
+    Raises:
+        ValueError: If a segment is missing data or does not match its checksum.
+    """
+    manifest = load_manifest(backup_dir)
+    if segment_id not in {segment["id"] for segment in manifest["segments"]}:
+        raise ValueError(f"No snapshot {segment_id} in {backup_dir}")
+
+    history_digest = hashlib.sha256()
+    size = 0
+    for segment in chain(manifest, segment_id):
+        if segment["offset"] != size:
+            raise ValueError(f"Segment {segment['file']} starts at byte {segment['offset']}, expected {size}")
+
+        segment_digest = hashlib.sha256()
+        length = 0
+        with gzip.open(os.path.join(backup_dir, segment["file"]), 'rb') as f:
+            while True:
+                block = f.read(BLOCK_SIZE)
+                if not block:
+                    break
+                segment_digest.update(block)
+                history_digest.update(block)
+                output.write(block)
+                length += len(block)
 
+        if length != segment["length"] or segment_digest.hexdigest() != segment["sha256"]:
+            raise ValueError(f"Segment {segment['file']} is corrupted (checksum mismatch)")
+        size += length
+
+    target = chain(manifest, segment_id)[-1]
+    if size != target["history_size"] or history_digest.hexdigest() != target["history_sha256"]:
+        raise ValueError(f"The rebuilt history of snapshot {segment_id} does not match its checksum")
+    return size
+
+def restore(backup_dir, snapshot, output_file):
+    """
+    Restores a snapshot (incremental or full copy) over the output file.
+
+    Returns:
+        int: The size of the restored history in bytes.
+    """
+    _, _, segment_id, legacy_file = snapshot
+    tmp_path = f"{output_file}.restore.tmp"
+    try:
+        with open(tmp_path, 'wb') as output:
+            if legacy_file is not None:
+                with open(os.path.join(backup_dir, legacy_file), 'rb') as f:
+                    shutil.copyfileobj(f, output, BLOCK_SIZE)
+                size = output.tell()
+            else:
+                size = rebuild(backup_dir, segment_id, output)
+        os.replace(tmp_path, output_file)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return size
+
+def choose_snapshot(snapshots):
+    """
+    Shows the available snapshots with a numbered list and lets the user choose one.
+
+    Returns:
+        tuple: The selected snapshot, or `None` if the choice is invalid.
+    """
     print("Available backups:")
-    # Show available backups with a numbered list
-    for i, backup in enumerate(backups, 1):
-        print(f"{i}. {backup}")
-
-    # Let user choose a backup to restore
-    choice = int(input("Enter the number of the backup to restore: "))
-    
-    # Validate input
-    if choice < 1 or choice > len(backups):
-        print("Invalid choice.")
-        exit()
+    for i, (created, description, _, _) in enumerate(snapshots, 1):
+        print(f"{i}. {created}  {description}")
+
+    try:
+        choice = int(input("Enter the number of the backup to restore: "))
+    except ValueError:
+        return None
+    if choice < 1 or choice > len(snapshots):
+        return None
+    return snapshots[choice - 1]
+
+def parse_args():
+    """
+    Parses command line arguments for restoring the history file.
 
-    # Get the selected backup file
-    selected_backup = backups[choice - 1]
-    selected_backup_path = os.path.join(backup_dir, selected_backup)
+    Returns:
+        argparse.Namespace: Parsed command line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Restore the history file from its backups.')
+    parser.add_argument('--backup-dir', type=str, default=BACKUP_DIR, help="The folder of the backups and their manifest.")
+    parser.add_argument('--output', type=str, default=SOURCE_FILE, help="The file to restore the history to.")
+    parser.add_argument('--list', action='store_true', help="List the available snapshots and exit.")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--snapshot', type=int, help="The id of the snapshot to restore.")
+    group.add_argument('--at', type=str, metavar='"YYYY-MM-DD HH:MM"',
+                       help="Restore the latest snapshot made at or before this time.")
+    return parser.parse_args()
+
+def main():
+    """
+    Main entry point of the script. Selects a snapshot and restores it.
+    """
+    args = parse_args()
+    try:
+        snapshots = list_snapshots(args.backup_dir)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if not snapshots:
+        print("No backup files found in the backup directory.")
+        sys.exit(1)
+
+    if args.list:
+        for created, description, _, _ in snapshots:
+            print(f"{created}  {description}")
+        return
+
+    if args.snapshot is not None:
+        snapshot = next((s for s in snapshots if s[2] == args.snapshot), None)
+    elif args.at is not None:
+        try:
+            snapshot = snapshot_at(snapshots, datetime.strptime(args.at, '%Y-%m-%d %H:%M'))
+        except ValueError:
+            print(f"Error: invalid time {args.at!r}, expected YYYY-MM-DD HH:MM", file=sys.stderr)
+            sys.exit(1)
+        if snapshot is None:
+            print(f"No backup made at or before {args.at}.")
+            sys.exit(1)
+    else:
+        snapshot = choose_snapshot(snapshots)
+
+    if snapshot is None:
+        print("Invalid choice.")
+        sys.exit(1)
 
-    # Perform the restore (copy selected backup to the source file location)
-    shutil.copyfile(selected_backup_path, source_file)
-    print(f"Restored {selected_backup} to {source_file}")
+    try:
+        size = restore(args.backup_dir, snapshot, args.output)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Restored {snapshot[1]} to {args.output} ({size} bytes)")
 
-except Exception as e:
-    print(f"Error: {e}")
+if __name__ == "__main__":
+    main()